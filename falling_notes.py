@@ -0,0 +1,288 @@
+"""
+falling_notes.py
+=====================
+
+This file provides the note highway of the piano game: every falling note rectangle on screen, kept as NumPy arrays
+and drawn from one shared vertex list.
+
+Each note lives in a slot of fixed-size arrays (pitch, player, position, height, flags and color) instead of being a
+pyglet shape of its own. Moving every note is one array operation, and each frame the vertices of every slot are
+computed together and copied into the vertex list in one go, so pyglet uploads them once per frame however many notes
+are falling. Only the few notes at the keys need any per-note Python (see PianoGameUI.simulation_step).
+
+Slots are recycled: a finished note's slot goes back on a free list and the next note takes it. The arrays are reserved
+up front to the most notes the song ever has on screen at once (see NoteDispatcher.peak_active), and grow by doubling
+if that is ever exceeded, so a song normally plays without allocating anything.
+
+Classes:
+    NoteHighway
+
+Authors: Devin Martin and Wesley Jake Anding
+"""
+
+import pyglet
+import numpy as np
+
+BORDER_THICKNESS = 2  # Thickness of a falling note's border, in pixels
+BORDER_COLOR = (0, 0, 0, 255)  # Black border for visibility
+
+# Triangles of one bordered rectangle: vertices 0-3 are the inner fill, 4-7 the outer edge (as pyglet.shapes.BorderedRectangle).
+_RECTANGLE_INDICES = np.array([0, 1, 2, 0, 2, 3, 0, 4, 3, 4, 7, 3, 0, 1, 5, 0, 5, 4, 1, 2, 5, 5, 2, 6, 6, 2, 3, 6, 3, 7])
+_VERTICES_PER_NOTE = 8
+
+
+class NoteHighway():
+    """
+    Every falling note, as parallel arrays indexed by slot.
+
+    Attributes
+    ----------
+    batch : pyglet.graphics.Batch
+        The batch the notes are drawn in.
+    capacity : int
+        Number of slots.
+    note_number : numpy.ndarray
+        The MIDI note number in each slot.
+    player : numpy.ndarray
+        The player each note belongs to (1 or 2).
+    x, width : numpy.ndarray
+        Horizontal position and width of each note.
+    sim_y, sim_height : numpy.ndarray
+        Simulated position and height, see PianoGameUI.simulation_step.
+    previous_y, previous_height : numpy.ndarray
+        Position and height at the previous simulation step, for drawing in between steps.
+    negative_y : numpy.ndarray
+        How far each note has moved past the keys, in pixels.
+    played : numpy.ndarray
+        True once the note has reached the keys and been played (or judged).
+    note_off : numpy.ndarray
+        True once autoplay has released the note.
+    active : numpy.ndarray
+        True for slots holding a note.
+    sequence : numpy.ndarray
+        When each note was spawned, counting up, so notes can be visited in spawn order.
+    color : numpy.ndarray
+        RGBA fill color of each note.
+    in_use : int
+        Number of slots holding a note.
+    peak_in_use : int
+        Most slots in use at once.
+    hits : int
+        Spawns that reused a free slot.
+    misses : int
+        Spawns that had to grow the arrays.
+    """
+
+    _ARRAYS = {
+        'note_number': np.uint8, 'player': np.uint8, 'x': np.float64, 'width': np.float64,
+        'sim_y': np.float64, 'sim_height': np.float64, 'previous_y': np.float64, 'previous_height': np.float64,
+        'negative_y': np.float64, 'played': bool, 'note_off': bool, 'active': bool, 'sequence': np.int64,
+    }
+
+    def __init__(self, batch, capacity=64):
+        """
+        Initializes an empty NoteHighway.
+
+        Parameters
+        ----------
+        batch : pyglet.graphics.Batch
+            The batch to draw the notes in.
+        capacity : int, optional
+            Number of slots to start with (default is 64).
+        """
+        self.batch = batch
+        self.program = pyglet.shapes.get_default_shader()
+        self.group = pyglet.graphics.ShaderGroup(self.program)
+        self.vertex_list = None
+
+        self.capacity = 0
+        for name, dtype in self._ARRAYS.items():
+            setattr(self, name, np.zeros(0, dtype=dtype))
+        self.color = np.zeros((0, 4), dtype=np.uint8)
+        self.free = []
+        self.next_sequence = 0
+
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.hits = 0
+        self.misses = 0
+        self.colors_changed = False
+
+        self.reserve(capacity)
+
+    def reserve(self, count):
+        """
+        Grows the arrays and the vertex list to at least count slots, so they do not grow mid-song.
+
+        Parameters
+        ----------
+        count : int
+            The number of slots the highway should hold.
+        """
+        if count <= self.capacity:
+            return
+
+        old_capacity = self.capacity
+        for name, dtype in self._ARRAYS.items():
+            grown = np.zeros(count, dtype=dtype)
+            grown[:old_capacity] = getattr(self, name)
+            setattr(self, name, grown)
+        grown = np.zeros((count, 4), dtype=np.uint8)
+        grown[:old_capacity] = self.color
+        self.color = grown
+
+        # Lowest new slot on top of the free list.
+        self.free.extend(range(count - 1, old_capacity - 1, -1))
+        self.capacity = count
+
+        if self.vertex_list is not None:
+            self.vertex_list.delete()
+        indices = (np.arange(count)[:, None] * _VERTICES_PER_NOTE + _RECTANGLE_INDICES).ravel().tolist()
+        vertex_count = count * _VERTICES_PER_NOTE
+        self.vertex_list = self.program.vertex_list_indexed(
+            vertex_count, pyglet.gl.GL_TRIANGLES, indices, self.batch, self.group,
+            position=('f', (0.0, 0.0) * vertex_count),
+            colors=('Bn', (0, 0, 0, 0) * vertex_count),
+            translation=('f', (0.0, 0.0) * vertex_count),
+            rotation=('f', (0.0,) * vertex_count))
+        self.colors_changed = True
+        self.update_vertices(1.0)
+
+    def spawn(self, note_number, player, x, y, width, height, color):
+        """
+        Puts a new note on the highway.
+
+        Parameters
+        ----------
+        note_number : int
+            The MIDI note number.
+        player : int
+            The player the note belongs to.
+        x, y : float
+            Position of the bottom left corner.
+        width, height : float
+            Size of the rectangle.
+        color : tuple
+            RGB fill color.
+
+        Returns
+        -------
+        int
+            The note's slot.
+        """
+        if self.free:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self.reserve(max(2 * self.capacity, 16))
+        slot = self.free.pop()
+
+        self.note_number[slot] = note_number
+        self.player[slot] = player
+        self.x[slot] = x
+        self.width[slot] = width
+        self.sim_y[slot] = self.previous_y[slot] = y
+        self.sim_height[slot] = self.previous_height[slot] = height
+        self.negative_y[slot] = 0
+        self.played[slot] = False
+        self.note_off[slot] = False
+        self.active[slot] = True
+        self.sequence[slot] = self.next_sequence
+        self.next_sequence += 1
+        self.set_color(slot, color)
+
+        self.in_use += 1
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+        return slot
+
+    def set_color(self, slot, color):
+        """
+        Changes a note's fill color. The vertex colors are uploaded with the next update_vertices.
+
+        Parameters
+        ----------
+        slot : int
+            The note's slot.
+        color : tuple
+            RGB fill color.
+        """
+        self.color[slot] = (*color[:3], 255)
+        self.colors_changed = True
+
+    def release(self, slot):
+        """
+        Takes a note off the highway and frees its slot.
+
+        Parameters
+        ----------
+        slot : int
+            The note's slot.
+        """
+        self.active[slot] = False
+        self.free.append(slot)
+        self.in_use -= 1
+
+    def clear(self):
+        """
+        Takes every note off the highway.
+        """
+        for slot in self.active_slots().tolist():
+            self.release(slot)
+
+    def active_slots(self):
+        """
+        Returns the slots holding a note, in the order the notes were spawned.
+        """
+        slots = np.flatnonzero(self.active)
+        return slots[np.argsort(self.sequence[slots], kind='stable')]
+
+    def update_vertices(self, alpha):
+        """
+        Places every note for drawing, between its previous and current simulated position, and copies all the
+        vertices into the vertex list at once.
+
+        Parameters
+        ----------
+        alpha : float
+            How far the frame is between the last simulation step (0) and the next one (1).
+        """
+        x0 = self.x
+        x1 = self.x + self.width
+        y0 = self.previous_y + (self.sim_y - self.previous_y) * alpha
+        y1 = y0 + np.maximum(self.previous_height + (self.sim_height - self.previous_height) * alpha, 0)
+        b = BORDER_THICKNESS
+
+        vertices = np.empty((self.capacity, _VERTICES_PER_NOTE, 2), dtype=np.float32)
+        vertices[:, :, 0] = np.column_stack((x0 + b, x1 - b, x1 - b, x0 + b, x0, x1, x1, x0))
+        vertices[:, :, 1] = np.column_stack((y0 + b, y0 + b, y1 - b, y1 - b, y0, y0, y1, y1))
+        vertices[~self.active] = 0  # Free slots collapse to a point and draw nothing.
+        np.ctypeslib.as_array(self.vertex_list.position)[:] = vertices.ravel()
+
+        if self.colors_changed:
+            colors = np.empty((self.capacity, _VERTICES_PER_NOTE, 4), dtype=np.uint8)
+            colors[:, :4] = self.color[:, None]
+            colors[:, 4:] = BORDER_COLOR
+            np.ctypeslib.as_array(self.vertex_list.colors)[:] = colors.ravel()
+            self.colors_changed = False
+
+    def stats(self):
+        """
+        Returns the highway's slot statistics: size, in_use, peak_in_use, hits, misses and hit_rate.
+        """
+        spawns = self.hits + self.misses
+        return {
+            "size": self.capacity,
+            "in_use": self.in_use,
+            "peak_in_use": self.peak_in_use,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / spawns, 4) if spawns else None,
+        }
+
+    def delete(self):
+        """
+        Frees the vertex list. The highway can't be drawn afterwards.
+        """
+        if self.vertex_list is not None:
+            self.vertex_list.delete()
+            self.vertex_list = None
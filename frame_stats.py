@@ -0,0 +1,275 @@
+"""
+frame_stats.py
+=====================
+
+This file provides the game's frame-time instrumentation: how long each stage of every frame took, so a hitch can be
+traced to the stage that blew the frame budget instead of just showing up as a lower FPS.
+
+A frame is everything between two calls to update_rectangles (see PianoGameUI). Its stages are timed on the real clock
+(time.perf_counter_ns), whatever clock the game itself runs on:
+
+    simulation      update_rectangles: fixed simulation steps, autoplay and placing the falling notes
+    score           update_score, on the frames it runs
+    draw            on_draw; this is the CPU side of drawing, the GPU may still be busy afterwards
+    input           handling the player's MIDI messages, on the input thread
+
+Frames are kept in a fixed-size ring buffer of FRAME_SAMPLE_DTYPE records, so recording never allocates and the
+percentiles cover the most recent frames. The slowest frames of the whole song are kept aside, so they are not lost
+when the ring wraps around.
+
+Classes:
+    FrameStats
+
+Constants:
+    STAGES
+    FRAME_SAMPLE_DTYPE
+    DEFAULT_EXPORT_DIR
+
+Authors: Devin Martin and Wesley Jake Anding
+"""
+
+import csv
+import heapq
+import json
+import os
+import time
+from collections import deque
+import numpy as np
+
+STAGES = ('simulation', 'score', 'draw', 'input')
+
+# One record per frame. Stage times are in nanoseconds.
+FRAME_SAMPLE_DTYPE = np.dtype([
+    ('frame', np.int64),
+    ('song_time', np.float64),
+    *((stage, np.int64) for stage in STAGES),
+    ('total', np.int64),
+])
+
+PERCENTILES = (50, 95, 99)
+
+DEFAULT_CAPACITY = 18000  # 5 minutes at 60 frames per second
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_EXPORT_DIR = os.path.join(PROJECT_DIR, 'frame_stats')
+
+
+def _milliseconds(nanoseconds):
+    """
+    Converts nanoseconds to milliseconds, rounded to the microsecond.
+    """
+    return round(float(nanoseconds) / 1e6, 3)
+
+
+class FrameStats():
+    """
+    Per-frame stage timings, in a ring buffer.
+
+    Attributes
+    ----------
+    samples : numpy.ndarray
+        The ring buffer, capacity records of FRAME_SAMPLE_DTYPE. Use recent() for the recorded ones in order.
+    capacity : int
+        Number of frames the ring buffer holds.
+    budget_ns : int
+        Time one frame may take, in nanoseconds.
+    frames : int
+        Number of frames recorded, including those the ring buffer no longer holds.
+    over_budget : int
+        Number of those frames that took longer than the budget.
+    worst : list
+        Heap of (total, frame record) for the slowest worst_count frames.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, budget_ms=1000 / 60, worst_count=5):
+        """
+        Initializes an empty FrameStats.
+
+        Parameters
+        ----------
+        capacity : int, optional
+            Number of frames to keep (default is 18000, 5 minutes at 60 frames per second).
+        budget_ms : float, optional
+            Time one frame may take, in milliseconds (default is one 60 Hz frame).
+        worst_count : int, optional
+            Number of slowest frames to keep for the whole song (default is 5).
+        """
+        self.samples = np.zeros(capacity, dtype=FRAME_SAMPLE_DTYPE)
+        self.capacity = capacity
+        self.budget_ns = round(budget_ms * 1e6)
+        self.worst_count = worst_count
+
+        self.frames = 0
+        self.over_budget = 0
+        self.worst = []
+
+        # The frame being recorded: its song time and the time of each stage so far.
+        self.frame_open = False
+        self.song_time = 0.0
+        self.current = [0] * len(STAGES)
+        self.stage_index = {stage: i for i, stage in enumerate(STAGES)}
+
+        # Input handling times from the input thread, waiting to be added to the frame. deque appends are thread safe.
+        self.input_queue = deque()
+
+    def begin_frame(self, song_time):
+        """
+        Finishes the frame being recorded, if any, and starts the next one. Call once per frame, on the main thread.
+
+        Parameters
+        ----------
+        song_time : float
+            The song time the new frame starts at.
+        """
+        if self.frame_open:
+            self.end_frame()
+        self.frame_open = True
+        self.song_time = song_time
+
+    def end_frame(self):
+        """
+        Writes the frame being recorded into the ring buffer.
+        """
+        input_queue = self.input_queue
+        input_index = self.stage_index['input']
+        while input_queue:
+            self.current[input_index] += input_queue.popleft()
+
+        total = sum(self.current)
+        record = (self.frames, self.song_time, *self.current, total)
+        self.samples[self.frames % self.capacity] = record
+
+        if total > self.budget_ns:
+            self.over_budget += 1
+        if len(self.worst) < self.worst_count:
+            heapq.heappush(self.worst, (total, record))
+        elif total > self.worst[0][0]:
+            heapq.heapreplace(self.worst, (total, record))
+
+        self.frames += 1
+        self.frame_open = False
+        self.current = [0] * len(STAGES)
+
+    def add(self, stage, elapsed_ns):
+        """
+        Adds time spent in a stage to the frame being recorded. Main thread only; use add_input from the input thread.
+
+        Parameters
+        ----------
+        stage : str
+            One of STAGES.
+        elapsed_ns : int
+            Time spent, in nanoseconds.
+        """
+        self.current[self.stage_index[stage]] += elapsed_ns
+
+    def add_input(self, elapsed_ns):
+        """
+        Adds time spent handling input to the frame being recorded. Safe to call from any thread.
+
+        Parameters
+        ----------
+        elapsed_ns : int
+            Time spent, in nanoseconds.
+        """
+        self.input_queue.append(elapsed_ns)
+
+    def recent(self):
+        """
+        Returns the frames the ring buffer holds, oldest first.
+        """
+        if self.frames <= self.capacity:
+            return self.samples[:self.frames].copy()
+        start = self.frames % self.capacity
+        return np.concatenate((self.samples[start:], self.samples[:start]))
+
+    def summary(self):
+        """
+        Returns p50/p95/p99/max of each stage and of the whole frame, in milliseconds, over the frames the ring buffer
+        holds, and the slowest frames of the whole song.
+
+        Returns
+        -------
+        dict
+            frames, over_budget and budget_ms, stages ({stage: {'p50', 'p95', 'p99', 'max'}}, including 'total'),
+            and worst (the slowest frames, slowest first, with each stage's time).
+        """
+        recent = self.recent()
+        stages = {}
+        for stage in (*STAGES, 'total'):
+            if len(recent):
+                values = recent[stage]
+                points = np.percentile(values, PERCENTILES)
+                stages[stage] = {f"p{p}": _milliseconds(v) for p, v in zip(PERCENTILES, points)}
+                stages[stage]["max"] = _milliseconds(values.max())
+            else:
+                stages[stage] = {f"p{p}": None for p in PERCENTILES}
+                stages[stage]["max"] = None
+
+        worst = []
+        for total, record in sorted(self.worst, key=lambda entry: entry[0], reverse=True):
+            frame, song_time, *stage_times, _ = record
+            worst.append({"frame": frame, "song_time": round(song_time, 3), "total_ms": _milliseconds(total),
+                          **{f"{stage}_ms": _milliseconds(t) for stage, t in zip(STAGES, stage_times)}})
+
+        return {
+            "frames": self.frames,
+            "over_budget": self.over_budget,
+            "budget_ms": _milliseconds(self.budget_ns),
+            "stages": stages,
+            "worst": worst,
+        }
+
+    def overlay_text(self):
+        """
+        Returns the summary as lines of text for the in-game overlay.
+        """
+        summary = self.summary()
+        lines = [f"{'frame ms':<11}{'p50':>7}{'p95':>7}{'p99':>7}{'max':>7}"]
+        for stage, values in summary["stages"].items():
+            cells = "".join(f"{'-' if v is None else f'{v:.2f}':>7}" for v in values.values())
+            lines.append(f"{stage:<11}{cells}")
+
+        lines.append(f"over {summary['budget_ms']:.1f} ms: {summary['over_budget']} of {summary['frames']} frames")
+        lines.append("worst frames:")
+        for frame in summary["worst"]:
+            slowest_stage = max(STAGES, key=lambda stage: frame[f"{stage}_ms"])
+            lines.append(f"  {frame['total_ms']:6.2f} ms at {frame['song_time']:7.2f}s "
+                         f"({slowest_stage} {frame[f'{slowest_stage}_ms']:.2f})")
+        return "\n".join(lines)
+
+    def export(self, directory, name):
+        """
+        Writes the frames the ring buffer holds to a CSV file, and the summary with the same frames to a JSON file.
+
+        Parameters
+        ----------
+        directory : str
+            Where to write the files; created if needed.
+        name : str
+            Start of the file names, e.g. the song's name. The date and time are added so runs don't overwrite each other.
+
+        Returns
+        -------
+        tuple
+            The paths of the CSV and JSON files.
+        """
+        os.makedirs(directory, exist_ok=True)
+        stem = os.path.join(directory, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}")
+        recent = self.recent()
+
+        columns = ["frame", "song_time", *(f"{stage}_ms" for stage in STAGES), "total_ms"]
+        rows = [[int(record['frame']), round(float(record['song_time']), 3),
+                 *(_milliseconds(record[stage]) for stage in (*STAGES, 'total'))] for record in recent]
+
+        csv_path = stem + ".csv"
+        with open(csv_path, 'w', newline='', encoding='utf-8') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(columns)
+            writer.writerows(rows)
+
+        json_path = stem + ".json"
+        with open(json_path, 'w', encoding='utf-8') as json_file:
+            json.dump({"summary": self.summary(), "columns": columns, "samples": rows}, json_file, indent=1)
+
+        return csv_path, json_path
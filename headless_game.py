@@ -0,0 +1,199 @@
+"""
+headless_game.py
+=====================
+
+This file runs the piano game without a display, a MIDI device or real time, for checking game logic and performance.
+
+The game runs on a SimulatedTime clock (see song_clock.py) that is stepped at a fixed frame rate as fast as the CPU allows:
+every frame calls update_rectangles (which runs the game's fixed simulation steps: falling notes, autoplay, Practice pauses)
+and, in Challenge mode, update_score on its usual 1/4 second schedule. Nothing waits on the real clock, so a 5 minute song finishes in seconds, and the same
+song and settings always produce the same score.
+
+Graphics still go through pyglet, using its headless (EGL) backend with an invisible window, so the shapes the game
+creates behave exactly as they do on screen but nothing is drawn. MIDI output goes to a port that discards everything.
+
+    python headless_game.py songs/ [--mode Challenge] [--players 1] [--autoplay 2] [--frame-rate 60] [--simulation-rate 120] [--json report.json] [--frame-stats DIR]
+
+Functions:
+    run_headless
+    main
+
+Authors: Devin Martin and Wesley Jake Anding
+"""
+
+import pyglet
+
+pyglet.options['headless'] = True  # Must be set before pyglet creates any window.
+
+import json
+import sys
+import time
+import mido
+from piano_game import PianoGameUI
+from song_cache import find_song_files
+from song_clock import GameClock, SimulatedTime
+from song_metadata import init_song_metadata
+
+SCORE_INTERVAL_NS = 250_000_000  # update_score runs every 1/4 second in Challenge mode
+
+
+class HeadlessWindow(pyglet.window.Window):
+    """
+    An invisible window standing in for the game's menu window (start.WalkingPianoGame).
+    """
+
+    def __init__(self, width=1920, height=1080):
+        """
+        Initializes the HeadlessWindow at the game's usual size.
+
+        Parameters
+        ----------
+        width : int, optional
+            Window width in pixels (default is 1920).
+        height : int, optional
+            Window height in pixels (default is 1080).
+        """
+        super().__init__(width=width, height=height, visible=False)
+
+    def return_to_menu(self):
+        """
+        Called by PianoGameUI.exit_game; there is no menu to return to.
+        """
+        pass
+
+
+def run_headless(window, song_file, game_mode="Challenge", player_count=1, auto_play=2, controller_size="88 key", frame_rate=60, simulation_rate=120,
+                 frame_stats_dir=None):
+    """
+    Plays one song to the end on a simulated clock.
+
+    Parameters
+    ----------
+    window : HeadlessWindow
+        The window to run the game in; it can be reused for many songs.
+    song_file : str
+        The path to the song (.mid/.midi or .wpsong).
+    game_mode : str, optional
+        'Challenge' or 'Practice' (default is 'Challenge').
+    player_count : int, optional
+        1 or 2 (default is 1).
+    auto_play : int, optional
+        0 for none, 1 for player 2 only, 2 for every note (default is 2, so the whole song is played).
+    controller_size : str, optional
+        '88 key' or '49 key' (default is '88 key').
+    frame_rate : int, optional
+        Frames per second of song time (default is 60, like the real game loop).
+    simulation_rate : int, optional
+        The game's fixed logic steps per second (default is 120).
+    frame_stats_dir : str, optional
+        Write the frame timings (see frame_stats.py) to CSV and JSON files here at the end of the song (default is None: don't).
+
+    Returns
+    -------
+    dict
+        The song's results: song_seconds, frames, wall_seconds, frames_per_second, realtime_factor, notes, score
+        note_highway (see NoteHighway.stats) and frame_stats (see FrameStats.summary), or {"error": message} if the song could not be played.
+    """
+    simulated_time = SimulatedTime()
+    game = PianoGameUI(window, song_file, game_mode, None, None, controller_size, player_count, auto_play,
+                       game_clock=GameClock(simulated_time), simulation_rate=simulation_rate,
+                       frame_stats_dir=frame_stats_dir)
+
+    # The game schedules itself on pyglet's real-time clock; take those over and drive it by hand instead.
+    pyglet.clock.unschedule(game.start_rectangle_game)
+    pyglet.clock.unschedule(game.update_rectangles)
+    pyglet.clock.unschedule(game.update_score)
+
+    if not game.game_active or not game.player_tracks:
+        return {"error": "song is not playable with these settings"}
+
+    game.outport = mido.ports.BaseOutput()  # Autoplay sends MIDI; discard it.
+    game.start_rectangle_game(0)
+
+    frame_ns = round(1e9 / frame_rate)
+    frame_seconds = frame_ns / 1e9
+    last_frame = round((game.note_dispatcher.end_time + game.end_buffer_time) * 1e9 / frame_ns) + frame_rate
+    next_score_ns = SCORE_INTERVAL_NS
+    frames = 0
+
+    start_time = time.perf_counter()
+    while not game.game_over and frames < last_frame:
+        simulated_time.advance(frame_ns)
+        game.update_rectangles(frame_seconds)
+
+        if game_mode == "Challenge" and simulated_time.now_ns >= next_score_ns:
+            game.update_score(SCORE_INTERVAL_NS / 1e9)
+            next_score_ns += SCORE_INTERVAL_NS
+
+        frames += 1
+    wall_seconds = time.perf_counter() - start_time
+
+    results = {
+        "song_seconds": round(game.song_time, 3),
+        "frames": frames,
+        "wall_seconds": round(wall_seconds, 3),
+        "frames_per_second": round(frames / wall_seconds, 1) if wall_seconds > 0 else None,
+        "realtime_factor": round(game.song_time / wall_seconds, 1) if wall_seconds > 0 else None,
+        "notes": len(game.note_dispatcher),
+        "score": game.score,
+        "finished": game.game_over,
+        "note_highway": game.note_highway.stats(),
+        "frame_stats": game.frame_stats.summary(),
+    }
+
+    game.exit_game()
+    return results
+
+
+def main():
+    """
+    Command line entry point: plays every song under the given paths headlessly and reports throughput and scores.
+    Exits with status 1 if any song fails to load or does not reach its end.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run Walking Piano songs headlessly on a simulated clock.")
+    parser.add_argument("paths", nargs="+", help="Song files or directories of songs.")
+    parser.add_argument("--mode", default="Challenge", choices=["Challenge", "Practice"], help="Game mode (default: Challenge).")
+    parser.add_argument("--players", type=int, default=1, choices=[1, 2], help="Number of players (default: 1).")
+    parser.add_argument("--autoplay", type=int, default=2, choices=[0, 1, 2], help="0 none, 1 player 2 only, 2 every note (default: 2).")
+    parser.add_argument("--controller", default="88 key", choices=["88 key", "49 key"], help="Piano size (default: 88 key).")
+    parser.add_argument("--frame-rate", type=int, default=60, help="Frames per second of song time (default: 60).")
+    parser.add_argument("--simulation-rate", type=int, default=120, help="Fixed game logic steps per second (default: 120).")
+    parser.add_argument("--json", help="Also write the full report to this JSON file.")
+    parser.add_argument("--frame-stats", help="Write each song's frame timings to CSV and JSON files in this directory.")
+    args = parser.parse_args()
+
+    init_song_metadata()  # A malformed song_metadata.csv fails the whole run, not every song
+    window = HeadlessWindow()
+    report = {}
+    failures = 0
+
+    for song_file in find_song_files(args.paths):
+        try:
+            results = run_headless(window, song_file, args.mode, args.players, args.autoplay, args.controller,
+                                   args.frame_rate, args.simulation_rate, args.frame_stats)
+        except Exception as error:
+            results = {"error": f"{type(error).__name__}: {error}"}
+        report[song_file] = results
+
+        if "error" in results or not results["finished"]:
+            failures += 1
+            print(f"FAILED {song_file}: {results.get('error', 'song did not reach its end')}")
+        else:
+            print(f"{song_file}: {results['song_seconds']:.1f}s of song in {results['wall_seconds']:.2f}s "
+                  f"({results['frames_per_second']:.0f} frames/s, {results['realtime_factor']:.0f}x real time), "
+                  f"{results['notes']} notes, score {results['score']}")
+
+    window.close()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as report_file:
+            json.dump(report, report_file, indent=1, sort_keys=True)
+
+    print(f"{len(report) - failures} of {len(report)} songs finished.")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
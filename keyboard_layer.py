@@ -0,0 +1,203 @@
+"""
+keyboard_layer.py
+=====================
+
+This file provides the on-screen piano keyboard as a cached layer.
+
+The keyboard hardly ever changes: 88 keys, 52 note name labels, the middle C marker and the guide lines above it
+only change when a key lights up. So they are drawn once, when the game starts, into two offscreen textures
+(see StaticLayer), and every frame just draws those textures:
+
+    lower layer     the white keys and their labels, opaque
+    (overlay)       highlighted white keys, with a copy of their label on top
+    upper layer     the black keys and the guide lines, on a transparent background
+    (overlay)       highlighted black keys
+
+Only the keys that are lit up are drawn as shapes, so text glyphs and the rest of the keyboard's vertices are never
+submitted again after the first frame. Key colors are set on the KeyboardModel from any thread (e.g. the MIDI input
+thread); update collects the changed keys from the model and applies them to the overlay on the main thread, once
+per frame.
+
+Classes:
+    StaticLayer
+    KeyboardLayer
+
+Authors: Devin Martin and Wesley Jake Anding
+"""
+
+import pyglet
+from pyglet import gl
+
+
+class StaticLayer():
+    """
+    Batches drawn once into a texture, then shown as a single sprite.
+
+    Attributes
+    ----------
+    texture : pyglet.image.Texture
+        What the batches drew.
+    sprite : pyglet.sprite.Sprite
+        Draws the texture at the bottom left of the window.
+    """
+
+    def __init__(self, width, height, batch=None, group=None):
+        """
+        Initializes an empty StaticLayer.
+
+        Parameters
+        ----------
+        width, height : int
+            Size of the layer in window pixels, from the bottom left corner.
+        batch : pyglet.graphics.Batch, optional
+            The batch to draw the layer's sprite in.
+        group : pyglet.graphics.Group, optional
+            The sprite's group, for ordering it among other layers.
+        """
+        self.texture = pyglet.image.Texture.create(width, height, min_filter=gl.GL_NEAREST, mag_filter=gl.GL_NEAREST)
+        self.sprite = pyglet.sprite.Sprite(self.texture, batch=batch, group=group)
+
+    def render(self, window, batches, opaque=False):
+        """
+        Draws batches into the layer's texture, replacing what was there.
+
+        Parameters
+        ----------
+        window : pyglet.window.Window
+            The window whose coordinates the batches are laid out in.
+        batches : list of pyglet.graphics.Batch
+            Drawn in order.
+        opaque : bool, optional
+            Start from opaque black and keep the texture fully opaque, so anti-aliased text does not leave
+            see-through edges (default is False: start transparent).
+        """
+        clear_color = (gl.GLfloat * 4)()
+        gl.glGetFloatv(gl.GL_COLOR_CLEAR_VALUE, clear_color)
+
+        framebuffer = pyglet.image.Framebuffer()
+        framebuffer.attach_texture(self.texture)
+        framebuffer.bind()
+
+        # Draw with the window's own projection, so everything lands where it would on screen.
+        gl.glViewport(0, 0, window.width, window.height)
+        gl.glClearColor(0, 0, 0, 1 if opaque else 0)
+        gl.glClear(gl.GL_COLOR_BUFFER_BIT)
+        if opaque:
+            gl.glColorMask(gl.GL_TRUE, gl.GL_TRUE, gl.GL_TRUE, gl.GL_FALSE)
+
+        for batch in batches:
+            batch.draw()
+
+        gl.glColorMask(gl.GL_TRUE, gl.GL_TRUE, gl.GL_TRUE, gl.GL_TRUE)
+        gl.glClearColor(*clear_color)
+        framebuffer.unbind()
+        framebuffer.delete()
+        window.viewport = window.viewport
+
+    def delete(self):
+        """
+        Frees the sprite and texture.
+        """
+        self.sprite.delete()
+        self.texture.delete()
+
+
+class KeyboardLayer():
+    """
+    The piano keyboard: two StaticLayers, with overlays for the keys that are lit up.
+
+    Attributes
+    ----------
+    batch : pyglet.graphics.Batch
+        Everything the keyboard draws each frame.
+    keyboard : KeyboardModel
+        The keys' colors.
+    overlays : list
+        For each key (index = MIDI note - LOWEST_NOTE), the shapes and labels drawn over the cached layers while that
+        key is lit up.
+    """
+
+    def __init__(self, window, keyboard, note_labels, middle_c_circle, lower_batches, upper_batches, keyboard_height):
+        """
+        Initializes the KeyboardLayer and draws the cached layers.
+
+        Parameters
+        ----------
+        window : pyglet.window.Window
+            The game window.
+        keyboard : KeyboardModel
+            Where each key is and what color it shows.
+        note_labels : dict
+            MIDI note -> the note name label of every white key.
+        middle_c_circle : pyglet.shapes.Circle or None
+            The marker behind middle C's label.
+        lower_batches : list of pyglet.graphics.Batch
+            What goes under the highlighted white keys: the white keys and their labels.
+        upper_batches : list of pyglet.graphics.Batch
+            What goes over them: the black keys and the guide lines.
+        keyboard_height : int
+            Height of the keyboard in pixels; the lower layer covers only this much of the window.
+        """
+        self.batch = pyglet.graphics.Batch()
+        lower_group = pyglet.graphics.Group(order=0)
+        white_overlay_group = pyglet.graphics.Group(order=1)
+        marker_group = pyglet.graphics.Group(order=2)
+        white_label_group = pyglet.graphics.Group(order=3)
+        upper_group = pyglet.graphics.Group(order=4)
+        black_overlay_group = pyglet.graphics.Group(order=5)
+
+        self.lower_layer = StaticLayer(window.width, keyboard_height, self.batch, lower_group)
+        self.upper_layer = StaticLayer(window.width, window.height, self.batch, upper_group)
+        self.lower_layer.render(window, lower_batches, opaque=True)
+        self.upper_layer.render(window, upper_batches)
+
+        self.keyboard = keyboard
+        self.overlays = []
+
+        for note, is_black, x, y, width, height in keyboard.layout.tolist():
+            overlay = [pyglet.shapes.Rectangle(x, y, width, height, color=keyboard.key_color(note), batch=self.batch,
+                                               group=black_overlay_group if is_black else white_overlay_group)]
+            label = note_labels.get(note)
+            if label is not None:
+                if note == 60 and middle_c_circle is not None:
+                    overlay.append(pyglet.shapes.Circle(middle_c_circle.x, middle_c_circle.y, middle_c_circle.radius,
+                                                        color=middle_c_circle.color[:3], batch=self.batch, group=marker_group))
+                overlay.append(pyglet.text.Label(label.text, font_name=label.font_name, bold=label.bold, font_size=label.font_size,
+                                                 x=label.x, y=label.y, anchor_x=label.anchor_x, anchor_y=label.anchor_y,
+                                                 color=label.color, batch=self.batch, group=white_label_group))
+
+            for item in overlay:
+                item.visible = False
+            self.overlays.append(overlay)
+
+    def update(self):
+        """
+        Applies the keys' color changes since the last update to the overlay. Call once per frame, on the main thread,
+        before drawing.
+        """
+        keyboard = self.keyboard
+        for key in keyboard.take_changed().tolist():
+            color = tuple(keyboard.color[key].tolist())
+            lit = color != tuple(keyboard.rest_color[key].tolist())
+            overlay = self.overlays[key]
+            if lit:
+                overlay[0].color = color
+            for item in overlay:
+                item.visible = lit
+
+    def draw(self):
+        """
+        Draws the keyboard.
+        """
+        self.batch.draw()
+
+    def delete(self):
+        """
+        Frees the cached layers and every key's overlay.
+        """
+        self.lower_layer.delete()
+        self.upper_layer.delete()
+        for overlay in self.overlays:
+            for item in overlay:
+                item.delete()
+        self.overlays = []
@@ -0,0 +1,239 @@
+"""
+keyboard_model.py
+=====================
+
+This file provides the state of the game's 88 piano keys, kept in fixed-size NumPy arrays indexed by key.
+
+Key n of the arrays is MIDI note n + LOWEST_NOTE, so finding a key, testing whether it is black, or reading what the
+player is doing on it are all direct index lookups rather than scans of a list. The geometry of every key comes from
+one layout table (see keyboard_layout), which both the keyboard and the line the notes fall from are built from.
+
+Key colors can be changed from any thread (the MIDI input thread lights keys as they are pressed). A change only marks
+the key; the drawing side collects the marked keys once per frame with take_changed (see keyboard_layer.py).
+
+Classes:
+    KeyboardModel
+
+Functions:
+    keyboard_layout
+
+Constants:
+    KEY_LAYOUT_DTYPE
+    LOWEST_NOTE
+    KEY_COUNT
+
+Authors: Devin Martin and Wesley Jake Anding
+"""
+
+import numpy as np
+
+LOWEST_NOTE = 21  # A0, the lowest key of an 88 key piano
+KEY_COUNT = 88
+WHITE_KEY_COUNT = 52
+KEY_BORDER = 1  # Gap left on each side of a white key, in pixels
+
+# One row per key, lowest note first. x/y is the bottom left corner of the key.
+KEY_LAYOUT_DTYPE = np.dtype([
+    ('note', np.uint8),
+    ('is_black', bool),
+    ('x', np.float64),
+    ('y', np.float64),
+    ('width', np.float64),
+    ('height', np.float64),
+])
+
+# Notes outside this range are greyed out on a 49 key controller.
+SMALL_PIANO_RANGE = (36, 84)
+
+WHITE_KEY_COLOR = (255, 255, 255)
+BLACK_KEY_COLOR = (0, 0, 0)
+GREYED_KEY_COLOR = (100, 100, 100)
+
+
+def keyboard_layout(window_width, white_key_height, controller_size):
+    """
+    Lays out the 88 keys of the piano, centered in the window.
+    Black keys are 2/3 the height and half the width of a white key, and sit across the gap after their white key.
+
+    Parameters
+    ----------
+    window_width : int
+        Width of the window in pixels.
+    white_key_height : float
+        Height of a white key in pixels; the width follows from it.
+    controller_size : str
+        '88 key' or '49 key'. A 49 key piano is shifted so its playable range sits in the middle of the window.
+
+    Returns
+    -------
+    numpy.ndarray
+        KEY_COUNT records of dtype KEY_LAYOUT_DTYPE, in note order.
+    """
+    white_key_width = white_key_height * 0.146  # Matches the true proportions of piano keys.
+    black_key_width = white_key_width / 2
+    black_key_height = white_key_height * (2 / 3)
+
+    x_position = (window_width - white_key_width * WHITE_KEY_COUNT) / 2
+    if controller_size == '49 key':
+        x_position += white_key_width * 2.5
+
+    layout = np.zeros(KEY_COUNT, dtype=KEY_LAYOUT_DTYPE)
+    key = 0
+
+    for i in range(WHITE_KEY_COUNT):
+        layout[key] = (LOWEST_NOTE + key, False, x_position + KEY_BORDER, 0,
+                       white_key_width - 2 * KEY_BORDER, white_key_height - 2 * KEY_BORDER)
+        key += 1
+
+        # A black key follows A (the first key), and then every C, D, F, G and A.
+        if i == 0 or ((1 <= (i - 1) % 7 <= 2) or (4 <= (i - 1) % 7 <= 6)) and i < WHITE_KEY_COUNT - 1:
+            layout[key] = (LOWEST_NOTE + key, True, x_position + white_key_width - KEY_BORDER - black_key_width / 2,
+                           white_key_height - black_key_height, black_key_width, black_key_height)
+            key += 1
+
+        x_position += white_key_width
+
+    return layout
+
+
+class KeyboardModel():
+    """
+    The state of every key, as arrays with one slot per key (index = MIDI note - LOWEST_NOTE).
+
+    Attributes
+    ----------
+    layout : numpy.ndarray
+        The key geometry, see keyboard_layout.
+    is_black : numpy.ndarray
+        True for black keys.
+    rest_color : numpy.ndarray
+        RGB color of each key when it is not lit up.
+    color : numpy.ndarray
+        RGB color each key is showing.
+    changed : numpy.ndarray
+        True for keys whose color changed since the last take_changed.
+    pressed : numpy.ndarray
+        True while the key is held down (by the player or by autoplay).
+    timing : numpy.ndarray
+        How close the next falling note on each key is: 0 not close, 1 okay, 2 perfect.
+    scored : numpy.ndarray
+        The last note scored on each key (its index in the NoteDispatcher), so a note only scores once; -1 if none.
+    """
+
+    def __init__(self, window_width, white_key_height, controller_size):
+        """
+        Initializes the KeyboardModel with every key at rest.
+
+        Parameters
+        ----------
+        window_width : int
+            Width of the window in pixels.
+        white_key_height : float
+            Height of a white key in pixels.
+        controller_size : str
+            '88 key' or '49 key'; on a 49 key piano the white keys out of reach are greyed out.
+        """
+        self.layout = keyboard_layout(window_width, white_key_height, controller_size)
+        self.is_black = self.layout['is_black'].copy()
+
+        self.rest_color = np.empty((KEY_COUNT, 3), dtype=np.uint8)
+        self.rest_color[:] = WHITE_KEY_COLOR
+        self.rest_color[self.is_black] = BLACK_KEY_COLOR
+        if controller_size == '49 key':
+            notes = self.layout['note']
+            out_of_reach = ~self.is_black & ((notes < SMALL_PIANO_RANGE[0]) | (notes > SMALL_PIANO_RANGE[1]))
+            self.rest_color[out_of_reach] = GREYED_KEY_COLOR
+
+        self.color = self.rest_color.copy()
+        self.changed = np.zeros(KEY_COUNT, dtype=bool)
+        self.pressed = np.zeros(KEY_COUNT, dtype=bool)
+        self.timing = np.zeros(KEY_COUNT, dtype=np.uint8)
+        self.scored = np.full(KEY_COUNT, -1, dtype=np.int64)
+
+    @staticmethod
+    def has_key(note):
+        """
+        Returns True if the piano has a key for the MIDI note.
+        """
+        return LOWEST_NOTE <= note < LOWEST_NOTE + KEY_COUNT
+
+    def is_black_key(self, note):
+        """
+        Returns True if the MIDI note is a black key.
+        """
+        return bool(self.is_black[note - LOWEST_NOTE])
+
+    def key_color(self, note):
+        """
+        Returns the RGB color a key is showing.
+        """
+        return tuple(self.color[note - LOWEST_NOTE].tolist())
+
+    def set_color(self, note, color):
+        """
+        Changes the color a key is showing. Safe to call from any thread.
+
+        Parameters
+        ----------
+        note : int
+            The MIDI note of the key.
+        color : tuple
+            The RGB color.
+        """
+        key = note - LOWEST_NOTE
+        self.color[key] = color[:3]
+        self.changed[key] = True  # Marked after the color is written, so take_changed never sees a stale color.
+
+    def reset_color(self, note):
+        """
+        Puts a key back to its resting color.
+
+        Parameters
+        ----------
+        note : int
+            The MIDI note of the key.
+        """
+        self.set_color(note, self.rest_color[note - LOWEST_NOTE])
+
+    def set_pressed(self, note, pressed):
+        """
+        Marks a key as held down or released. Notes the piano has no key for are ignored.
+
+        Parameters
+        ----------
+        note : int
+            The MIDI note of the key.
+        pressed : bool
+            True if the key is held down.
+        """
+        if self.has_key(note):
+            self.pressed[note - LOWEST_NOTE] = pressed
+
+    def take_changed(self):
+        """
+        Returns the keys whose color changed since the last call, and clears their marks. Call once per frame.
+
+        Returns
+        -------
+        numpy.ndarray
+            Indexes of the changed keys (MIDI note - LOWEST_NOTE). Read their colors after this call.
+        """
+        keys = np.flatnonzero(self.changed)
+        self.changed[keys] = False
+        return keys
+
+    def reset_timing(self):
+        """
+        Forgets every key's timing state, e.g. when the song jumps. Notes already scored stay scored.
+        """
+        self.timing[:] = 0
+
+    def reset(self):
+        """
+        Puts every key back to rest: released, resting color, no timing or scoring state.
+        """
+        self.pressed[:] = False
+        self.reset_timing()
+        self.scored[:] = -1
+        self.color[:] = self.rest_color
+        self.changed[:] = True
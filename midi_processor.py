@@ -5,19 +5,338 @@ midi_processor.py
 This file provides functionalities to process and play MIDI files using MIDO.
 
 Classes:
+    TempoMap
     MIDIProcessor
+    PlaybackEngine
+    MIDIStreamReader
 
 Functions:
+    split_tracks
+    write_wpsong
+    load_wpsong
+    play_event_stream
     main
+
+Constants:
+    NOTE_DTYPE
+    EVENT_DTYPE
+    PROCESSOR_VERSION
+    MIN_NOTE_SECONDS
+    SPIN_SECONDS
     
 Authors: Devin Martin and Wesley Jake Anding
 """
 
-from mido import MidiFile, open_output, bpm2tempo
+from mido import MidiFile, Message, open_output, bpm2tempo
+import numpy as np
+import heapq
+import mmap
+from collections import deque
+import struct
 import threading
 import time
 import os
 
+# Bump this whenever compile_timeline output changes, so cached timelines (see song_cache.py) are rebuilt.
+PROCESSOR_VERSION = 3
+
+# Notes shorter than this (e.g. a note_on and note_off on the same tick) are lengthened to it, so they can still be seen and played.
+MIN_NOTE_SECONDS = 0.05
+
+# PlaybackEngine sleeps until this long before each deadline, then spins for the rest, since sleep can wake up late.
+SPIN_SECONDS = 0.002
+
+# Layout of one compiled note record. See MIDIProcessor.compile_timeline.
+NOTE_DTYPE = np.dtype([
+    ('onset_seconds', np.float64),
+    ('duration_seconds', np.float64),
+    ('note', np.uint8),
+    ('velocity', np.uint8),
+    ('track', np.uint16),
+    ('channel', np.uint8),
+])
+
+# Layout of one streamed channel event (note on/off, pedal, ...). See MIDIStreamReader.
+# status/data1/data2 are the raw MIDI bytes; data2 is 0 for one-byte messages like program_change.
+EVENT_DTYPE = np.dtype([
+    ('time_seconds', np.float64),
+    ('status', np.uint8),
+    ('data1', np.uint8),
+    ('data2', np.uint8),
+    ('track', np.uint16),
+])
+
+# .wpsong: a compact pre-compiled song. Everything is little-endian and packed:
+#   header (WPSONG_HEADER, 32 bytes): magic, format version, ticks per beat, tempo count, note count, processor version
+#   tempo map (tempo count x WPSONG_TEMPO_DTYPE): the tick each tempo segment starts on and its tempo
+#   notes (note count x WPSONG_NOTE_DTYPE): the compiled timeline records, 21 bytes each
+WPSONG_MAGIC = b'WPSONG'
+WPSONG_VERSION = 1
+WPSONG_HEADER = struct.Struct('<6sHHIII10x')
+WPSONG_TEMPO_DTYPE = np.dtype([('tick', '<i8'), ('tempo', '<f8')])
+WPSONG_NOTE_DTYPE = NOTE_DTYPE.newbyteorder('<')
+
+# Number of data bytes that follow each channel status (indexed by the high nibble).
+_CHANNEL_DATA_LENGTHS = {0x80: 2, 0x90: 2, 0xA0: 2, 0xB0: 2, 0xC0: 1, 0xD0: 1, 0xE0: 2}
+# Data bytes of the system common messages that can (rarely) appear in a file.
+_SYSTEM_DATA_LENGTHS = {0xF1: 1, 0xF2: 2, 0xF3: 1}
+
+
+def split_tracks(timeline):
+    """
+    Splits a compiled timeline into one note array per track with a single stable sort,
+    so every track keeps its notes in onset order.
+
+    Parameters
+    ----------
+    timeline : numpy.ndarray
+        A compiled timeline (dtype NOTE_DTYPE), as returned by MIDIProcessor.compile_timeline.
+
+    Returns
+    -------
+    tuple
+        (track_notes, summary) where track_notes maps each track number that contains notes to its note array,
+        and summary maps the same track numbers to their note counts. Tracks without notes are left out of both.
+    """
+    order = np.argsort(timeline['track'], kind='stable')
+    grouped = timeline[order]
+    tracks, starts, counts = np.unique(grouped['track'], return_index=True, return_counts=True)
+
+    track_notes = {}
+    summary = {}
+    for track, start, count in zip(tracks.tolist(), starts.tolist(), counts.tolist()):
+        track_notes[track] = grouped[start:start + count]
+        summary[track] = count
+
+    return track_notes, summary
+
+
+def _resolve_overlaps(timeline):
+    """
+    Makes every key play one note at a time. Within each track, channel and pitch:
+    notes that start together are merged into the longest one, a note is cut short where the next one starts,
+    and notes shorter than MIN_NOTE_SECONDS are lengthened to it (but never past the next note).
+
+    Parameters
+    ----------
+    timeline : numpy.ndarray
+        Paired notes (dtype NOTE_DTYPE), in any order.
+
+    Returns
+    -------
+    numpy.ndarray
+        The resolved notes, grouped by track, channel and pitch.
+    """
+    timeline = timeline[np.lexsort((-timeline['duration_seconds'], timeline['onset_seconds'],
+                                    timeline['note'], timeline['channel'], timeline['track']))]
+
+    def same_key(notes):
+        return ((notes['track'][1:] == notes['track'][:-1]) & (notes['channel'][1:] == notes['channel'][:-1])
+                & (notes['note'][1:] == notes['note'][:-1]))
+
+    duplicate = np.zeros(len(timeline), dtype=bool)
+    duplicate[1:] = same_key(timeline) & (timeline['onset_seconds'][1:] == timeline['onset_seconds'][:-1])
+    timeline = timeline[~duplicate]
+
+    onsets = timeline['onset_seconds']
+    next_onsets = np.full(len(timeline), np.inf)
+    followed = np.flatnonzero(same_key(timeline))
+    next_onsets[followed] = onsets[followed + 1]
+
+    timeline['duration_seconds'] = np.minimum(np.maximum(timeline['duration_seconds'], MIN_NOTE_SECONDS), next_onsets - onsets)
+    return timeline
+
+
+def write_wpsong(path, tempo_map, timeline):
+    """
+    Writes a compiled song to a .wpsong file (see WPSONG_HEADER for the layout).
+
+    Parameters
+    ----------
+    path : str
+        The path of the .wpsong file to write.
+    tempo_map : TempoMap
+        The song's tempo map.
+    timeline : numpy.ndarray
+        The compiled timeline (dtype NOTE_DTYPE).
+    """
+    tempos = np.empty(len(tempo_map.breakpoint_ticks), dtype=WPSONG_TEMPO_DTYPE)
+    tempos['tick'] = tempo_map.breakpoint_ticks
+    tempos['tempo'] = tempo_map.tempos
+
+    with open(path, 'wb') as song_file:
+        song_file.write(WPSONG_HEADER.pack(WPSONG_MAGIC, WPSONG_VERSION, tempo_map.ticks_per_beat,
+                                           len(tempos), len(timeline), PROCESSOR_VERSION))
+        song_file.write(tempos.tobytes())
+        song_file.write(np.ascontiguousarray(timeline, dtype=WPSONG_NOTE_DTYPE).tobytes())
+
+
+def load_wpsong(path):
+    """
+    Loads a .wpsong file written by write_wpsong.
+    The notes are memory mapped straight from the file: no parsing and no per-note Python objects.
+
+    Parameters
+    ----------
+    path : str
+        The path of the .wpsong file.
+
+    Returns
+    -------
+    tuple
+        (tempo_map, timeline): the TempoMap and a read-only array of dtype WPSONG_NOTE_DTYPE.
+
+    Raises
+    ------
+    OSError
+        If the file is not a .wpsong file, or was compiled by a different PROCESSOR_VERSION. A .wpsong file does not
+        keep its source MIDI, so it can't be rebuilt here; export it again from the MIDI file.
+    """
+    with open(path, 'rb') as song_file:
+        header = song_file.read(WPSONG_HEADER.size)
+
+    if len(header) < WPSONG_HEADER.size:
+        raise OSError(f"{path} is too short to be a .wpsong file")
+
+    magic, version, ticks_per_beat, tempo_count, note_count, processor_version = WPSONG_HEADER.unpack(header)
+    if magic != WPSONG_MAGIC or version != WPSONG_VERSION:
+        raise OSError(f"{path} is not a version {WPSONG_VERSION} .wpsong file")
+    if processor_version != PROCESSOR_VERSION:
+        raise OSError(f"{path} was compiled by processor version {processor_version}, not {PROCESSOR_VERSION}; "
+                      "export it again from its MIDI file")
+
+    tempo_offset = WPSONG_HEADER.size
+    tempos = np.fromfile(path, dtype=WPSONG_TEMPO_DTYPE, count=tempo_count, offset=tempo_offset)
+    tempo_map = TempoMap(tempos['tick'], tempos['tempo'], ticks_per_beat)
+
+    # numpy can't memory map zero bytes.
+    if note_count == 0:
+        return tempo_map, np.empty(0, dtype=WPSONG_NOTE_DTYPE)
+
+    note_offset = tempo_offset + tempo_count * WPSONG_TEMPO_DTYPE.itemsize
+    timeline = np.memmap(path, dtype=WPSONG_NOTE_DTYPE, mode='r', offset=note_offset, shape=(note_count,))
+    return tempo_map, timeline
+
+
+class TempoMap():
+    """
+    A tick-indexed tempo map for one MIDI file.
+    Every tempo segment is stored as a breakpoint: the tick it starts on, the second it starts at, and its tempo.
+    Converting between ticks and seconds is a binary search for the segment followed by one multiply,
+    so files with hundreds of tempo changes still convert in logarithmic time.
+
+    Attributes
+    ----------
+    ticks_per_beat : int
+        The resolution of the MIDI file.
+    breakpoint_ticks : numpy.ndarray
+        The tick at which each tempo segment starts (sorted, the first is always 0).
+    breakpoint_seconds : numpy.ndarray
+        The time in seconds at which each tempo segment starts.
+    tempos : numpy.ndarray
+        The tempo of each segment in microseconds per beat.
+    seconds_per_tick : numpy.ndarray
+        The length of one tick within each segment, in seconds.
+    """
+
+    def __init__(self, ticks, tempos, ticks_per_beat):
+        """
+        Initializes the TempoMap from a list of tempo changes.
+
+        Parameters
+        ----------
+        ticks : sequence of int
+            The absolute tick of each tempo change.
+        tempos : sequence of float
+            The tempo set at each tick, in microseconds per beat.
+        ticks_per_beat : int
+            The resolution of the MIDI file.
+        """
+        ticks = np.asarray(ticks, dtype=np.int64)
+        tempos = np.asarray(tempos, dtype=np.float64)
+
+        # Stable sort so that when several tempos share a tick, the last one in the file wins.
+        order = np.argsort(ticks, kind='stable')
+        ticks, tempos = ticks[order], tempos[order]
+
+        # Until the first set_tempo, MIDI files play at 120 BPM.
+        if len(ticks) == 0 or ticks[0] != 0:
+            ticks = np.concatenate(([0], ticks))
+            tempos = np.concatenate(([bpm2tempo(120)], tempos))
+
+        self.ticks_per_beat = ticks_per_beat
+        self.breakpoint_ticks = ticks
+        self.tempos = tempos
+        self.seconds_per_tick = tempos / (ticks_per_beat * 1e6)
+        self.breakpoint_seconds = np.concatenate(([0.0], np.cumsum(np.diff(ticks) * self.seconds_per_tick[:-1])))
+
+    @classmethod
+    def from_midi_file(cls, midi_file):
+        """
+        Builds the TempoMap from every set_tempo message in a MidiFile.
+
+        Parameters
+        ----------
+        midi_file : MidiFile
+            The MidiFile to read tempo changes from.
+
+        Returns
+        -------
+        TempoMap
+            The tempo map for the file.
+        """
+        ticks = []
+        tempos = []
+        for track in midi_file.tracks:
+            elapsed_ticks = 0
+            for msg in track:
+                elapsed_ticks += msg.time
+                if msg.type == 'set_tempo':
+                    ticks.append(elapsed_ticks)
+                    tempos.append(msg.tempo)
+
+        return cls(ticks, tempos, midi_file.ticks_per_beat)
+
+    def ticks_to_seconds(self, ticks):
+        """
+        Converts absolute ticks into seconds from the start of the song.
+
+        Parameters
+        ----------
+        ticks : int or numpy.ndarray
+            One tick or an array of ticks.
+
+        Returns
+        -------
+        float or numpy.ndarray
+            The time of each tick in seconds, matching the shape of the input.
+        """
+        ticks = np.asarray(ticks)
+        segment = np.maximum(np.searchsorted(self.breakpoint_ticks, ticks, side='right') - 1, 0)
+        seconds = self.breakpoint_seconds[segment] + (ticks - self.breakpoint_ticks[segment]) * self.seconds_per_tick[segment]
+        return float(seconds) if seconds.ndim == 0 else seconds
+
+    def seconds_to_ticks(self, seconds):
+        """
+        Converts seconds from the start of the song into absolute (fractional) ticks.
+        This is the inverse of ticks_to_seconds and is what seeking uses.
+
+        Parameters
+        ----------
+        seconds : float or numpy.ndarray
+            One time or an array of times in seconds.
+
+        Returns
+        -------
+        float or numpy.ndarray
+            The tick at each time, matching the shape of the input.
+        """
+        seconds = np.asarray(seconds, dtype=np.float64)
+        segment = np.maximum(np.searchsorted(self.breakpoint_seconds, seconds, side='right') - 1, 0)
+        ticks = self.breakpoint_ticks[segment] + (seconds - self.breakpoint_seconds[segment]) / self.seconds_per_tick[segment]
+        return float(ticks) if ticks.ndim == 0 else ticks
+
+
 class MIDIProcessor():
     """
     A class that processes MIDI files and plays the tracks in real time.
@@ -28,6 +347,8 @@ class MIDIProcessor():
         The path to the MIDI file.
     midi_file : MidiFile
         The MidiFile object representing the MIDI file.
+    tempo_map : TempoMap
+        The tempo map of the file, built once in extract_global_tempo.
     """
 
     def __init__(self, file_path):
@@ -43,6 +364,7 @@ class MIDIProcessor():
         self.midi_file = self.read_midi_file()
         self.bpm = None  # Is set in extract_track_messages
         self.global_tempo_changes = []
+        self.tempo_map = None  # Is set in extract_global_tempo
         self.extract_global_tempo()
         
 
@@ -63,37 +385,15 @@ class MIDIProcessor():
     
     def extract_global_tempo(self):
         """
-        Extracts global tempo changes from the MIDI file, storing them in our list self.global_tempo_changes.
-        This list is used to accurately apply tempo changes to each track message.
-        Helper function for extract_track_messages.
+        Extracts global tempo changes from the MIDI file into self.tempo_map (a TempoMap),
+        and keeps the (seconds, tempo) pairs in self.global_tempo_changes for play_track.
+        Helper function for extract_track_messages and compile_timeline.
+        The file's own tempo is used as is; per-song tempo tweaks live in song_metadata.csv (see song_metadata.py).
         """
-        track = self.midi_file.tracks[0]
-        elapsed_ticks = 0
-        cumulative_time = 0.0  # Cumulative time in seconds
-        current_tempo = bpm2tempo(120)  # Default tempo (microseconds per beat)
-        speed_multiplier = 1.0  # Speed multiplier for tempo changes
-        self.global_tempo_changes = []
-        
-        if self.file_path == 'mary_lamb.mid':
-            speed_multiplier = 1.75
-            
-        if self.file_path == "Pure_Imagination_Piano_Solo_-_Beginner.mid":
-            speed_multiplier = 1.85
-            
-        if self.file_path == 'You_ve_Got_A_Friend_In_Me_Easy_Piano_Sheet_Music.mid':
-            speed_multiplier = 1.6
-            
-        if self.file_path == 'Super_Mario_Theme_Song.mid':
-            speed_multiplier = 1.5
-        
+        self.tempo_map = TempoMap.from_midi_file(self.midi_file)
 
-        for msg in track:
-            if msg.time > 0:
-                cumulative_time += (msg.time * current_tempo * speed_multiplier) / (self.midi_file.ticks_per_beat * 1e6)
-            if msg.type == 'set_tempo':
-                self.global_tempo_changes.append((cumulative_time, msg.tempo * speed_multiplier))
-                current_tempo = msg.tempo * speed_multiplier  # Update current tempo
-            elapsed_ticks += msg.time
+        # (seconds, tempo) at the start of every tempo segment.
+        self.global_tempo_changes = list(zip(self.tempo_map.breakpoint_seconds.tolist(), self.tempo_map.tempos.tolist()))
 
    
     def extract_track_messages(self, track_number):
@@ -112,32 +412,106 @@ class MIDIProcessor():
             A list of (message, delay) tuples representing the messages in the track.
         """
         track = self.midi_file.tracks[track_number]
-        messages = []
-        elapsed_ticks = 0  # Total ticks since the last reset
-        current_tempo = bpm2tempo(120)  # Start with a default tempo
 
-        # Initialize tempo change handling
-        tempo_change_index = 0
-        if self.global_tempo_changes:
-            # Start with the first tempo change if it exists
-            _, current_tempo = self.global_tempo_changes[tempo_change_index]
+        # Absolute ticks never reset, so tempo changes apply at exactly the right place.
+        abs_ticks = np.cumsum(np.fromiter((msg.time for msg in track), dtype=np.int64, count=len(track)))
+        note_indexes = [i for i, msg in enumerate(track) if msg.type in ['note_on', 'note_off']]
+
+        # Convert every note event to seconds at once, then take the delay since the previous note event.
+        note_seconds = self.tempo_map.ticks_to_seconds(abs_ticks[note_indexes])
+        delays = np.diff(note_seconds, prepend=0.0)
+
+        return [(track[i], delay) for i, delay in zip(note_indexes, delays.tolist())]
+
+    def compile_timeline(self):
+        """
+        Compiles every note in the MIDI file into a single NumPy structured array (see NOTE_DTYPE),
+        sorted by onset time. Each record holds onset_seconds, duration_seconds, note, velocity, track and channel.
+
+        Unlike extract_track_messages, this walks the mido messages only once to collect absolute ticks.
+        All tick-to-seconds conversion is then done in one vectorized pass over self.tempo_map.
+
+        Note-ons are paired with their note-offs up front, so nothing at runtime ever has to search for a note's end:
+        each track keeps a queue of sounding notes per channel and pitch, and a note_off releases the oldest one.
+        Overlaps are then settled the same way every time (see _resolve_overlaps): a key struck again while it is
+        still held ends the earlier note, duplicate notes are dropped, and zero-length notes last MIN_NOTE_SECONDS.
+
+        Returns
+        -------
+        numpy.ndarray
+            Structured array of dtype NOTE_DTYPE, one record per note.
+        """
+        on_ticks, off_ticks, notes, velocities, tracks, channels = [], [], [], [], [], []
 
-        for msg in track:
-            elapsed_ticks += msg.time
+        for track_number, track in enumerate(self.midi_file.tracks):
+            # Absolute tick of every message in the track, in one vectorized cumulative sum.
+            abs_ticks = np.cumsum(np.fromiter((msg.time for msg in track), dtype=np.int64, count=len(track)))
+            end_tick = int(abs_ticks[-1]) if len(track) else 0
+            open_notes = {}  # (channel, note) -> deque of (tick, velocity) still waiting for a note_off, oldest first
 
-            # Check for and apply tempo changes
-            while (tempo_change_index < len(self.global_tempo_changes) and
-                elapsed_ticks >= self.global_tempo_changes[tempo_change_index][0] * self.midi_file.ticks_per_beat):
-                _, current_tempo = self.global_tempo_changes[tempo_change_index]
-                tempo_change_index += 1
+            for tick, msg in zip(abs_ticks.tolist(), track):
+                if msg.type == 'note_on' and msg.velocity != 0:
+                    open_notes.setdefault((msg.channel, msg.note), deque()).append((tick, msg.velocity))
 
-            if msg.type in ['note_on', 'note_off']:
-                # Calculate delay using current tempo and ticks per beat
-                delay = (elapsed_ticks * current_tempo) / (self.midi_file.ticks_per_beat * 1e6)
-                messages.append((msg, delay))
-                elapsed_ticks = 0  # Reset ticks after processing a note
+                elif msg.type == 'note_off' or msg.type == 'note_on':
+                    pending = open_notes.get((msg.channel, msg.note))
+                    if pending:
+                        on_tick, velocity = pending.popleft()
+                        on_ticks.append(on_tick)
+                        off_ticks.append(tick)
+                        notes.append(msg.note)
+                        velocities.append(velocity)
+                        tracks.append(track_number)
+                        channels.append(msg.channel)
 
-        return messages
+            # Any note never released is held until the end of its track.
+            for (channel, note), pending in open_notes.items():
+                for on_tick, velocity in pending:
+                    on_ticks.append(on_tick)
+                    off_ticks.append(end_tick)
+                    notes.append(note)
+                    velocities.append(velocity)
+                    tracks.append(track_number)
+                    channels.append(channel)
+
+        onset_seconds = self.tempo_map.ticks_to_seconds(np.asarray(on_ticks, dtype=np.int64))
+        offset_seconds = self.tempo_map.ticks_to_seconds(np.asarray(off_ticks, dtype=np.int64))
+
+        timeline = np.empty(len(onset_seconds), dtype=NOTE_DTYPE)
+        timeline['onset_seconds'] = onset_seconds
+        timeline['duration_seconds'] = offset_seconds - onset_seconds
+        timeline['note'] = notes
+        timeline['velocity'] = velocities
+        timeline['track'] = tracks
+        timeline['channel'] = channels
+
+        timeline = _resolve_overlaps(timeline)
+
+        # Order by onset, lowest note first for chords.
+        return timeline[np.lexsort((timeline['note'], timeline['onset_seconds']))]
+
+    def extract_all_tracks(self):
+        """
+        Extracts the notes of every track in one pass over the file, instead of one extract_track_messages call per track.
+        Useful for choosing a playable track or a two-player split.
+
+        Returns
+        -------
+        tuple
+            (track_notes, summary); see split_tracks.
+        """
+        return split_tracks(self.compile_timeline())
+
+    def export_wpsong(self, path):
+        """
+        Compiles the song and writes it to a .wpsong file, which loads near-instantly with load_wpsong.
+
+        Parameters
+        ----------
+        path : str
+            The path of the .wpsong file to write.
+        """
+        write_wpsong(path, self.tempo_map, self.compile_timeline())
 
     def play_track(self, messages, outport):
         """
@@ -147,7 +521,7 @@ class MIDIProcessor():
         THIS METHOD IS SLIGHTLY INNACURATE DUE TO THE FACT WE ARE USING TIME.SLEEP TO DELAY THE MESSAGES;
         HOWEVER, IT IS USEFUL FOR TESTING AND DEBUGGING. THE SONGS SHOULD SOUND SIMILAR, BUT NOT EXACTLY THE SAME... BUT CORRECT IN GAME!
         
-        To hear the song perfectly, use the test_midi_file.py script.
+        To hear the song accurately, use play_timeline (see PlaybackEngine) or the test_midi_file.py script.
         
         Parameters
         ----------
@@ -170,39 +544,444 @@ class MIDIProcessor():
                 _, tempo = self.global_tempo_changes[current_tempo_index]
                 current_tempo_index += 1
 
+    def play_timeline(self, outport, track_numbers=None):
+        """
+        Plays the song accurately from one thread with a PlaybackEngine, every track against the same absolute deadlines.
 
-if __name__ == "__main__":
+        Parameters
+        ----------
+        outport : mido output port
+            The MIDI output port to send to.
+        track_numbers : list of int, optional
+            The tracks to play (0-indexed; default is every track).
+        """
+        timeline = self.compile_timeline()
+        if track_numbers is not None:
+            timeline = timeline[np.isin(timeline['track'], track_numbers)]
+
+        PlaybackEngine.from_timeline(timeline).play(outport)
+
+
+class PlaybackEngine():
+    """
+    Plays MIDI messages against absolute deadlines, so they stay on time however long the song is.
+
+    play_track sleeps for each delay in turn, so every time sleep wakes up late the rest of the song shifts later,
+    and one thread per track lets the tracks drift apart. Here every deadline is measured from the same start time:
+    the engine sleeps until SPIN_SECONDS before a deadline and spins on time.perf_counter for the rest,
+    so a late wake-up delays only the message it was waiting for and nothing after it.
+    Messages due at the same instant (a chord, or a note ending as the next begins) are sent together as one batch.
+    All tracks are merged into one list, so one thread plays the whole song.
+
+    Attributes
+    ----------
+    deadlines : numpy.ndarray
+        When each batch is due, in seconds from the start of playback (sorted).
+    batches : list of list
+        The mido messages sent at each deadline, in order.
+    spin_seconds : float
+        How long before each deadline to stop sleeping and start spinning.
+    """
+
+    def __init__(self, times, messages, spin_seconds=SPIN_SECONDS):
+        """
+        Initializes the PlaybackEngine, grouping messages that share a time into batches.
+
+        Parameters
+        ----------
+        times : array-like of float
+            When each message is due, in seconds from the start (sorted).
+        messages : list
+            The mido messages, in the same order as times.
+        spin_seconds : float, optional
+            How long before each deadline to stop sleeping and start spinning (default is SPIN_SECONDS).
+        """
+        times = np.asarray(times, dtype=np.float64)
+        starts = np.flatnonzero(np.diff(times, prepend=-np.inf))
+        ends = np.append(starts[1:], len(times))
+
+        self.deadlines = times[starts]
+        self.batches = [messages[start:end] for start, end in zip(starts.tolist(), ends.tolist())]
+        self.spin_seconds = spin_seconds
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_timeline(cls, timeline, spin_seconds=SPIN_SECONDS):
+        """
+        Builds the note_on and note_off messages for a compiled timeline.
+        Every message is created up front, so nothing is allocated while playing.
+
+        Parameters
+        ----------
+        timeline : numpy.ndarray
+            The compiled timeline (dtype NOTE_DTYPE or WPSONG_NOTE_DTYPE).
+        spin_seconds : float, optional
+            How long before each deadline to stop sleeping and start spinning (default is SPIN_SECONDS).
+
+        Returns
+        -------
+        PlaybackEngine
+        """
+        onsets = timeline['onset_seconds']
+        times = np.concatenate([onsets, onsets + timeline['duration_seconds']])
+        is_on = np.concatenate([np.ones(len(timeline), dtype=bool), np.zeros(len(timeline), dtype=bool)])
+        notes = np.concatenate([timeline['note'], timeline['note']]).tolist()
+        velocities = np.concatenate([timeline['velocity'], np.zeros(len(timeline), dtype=np.uint8)]).tolist()
+        channels = np.concatenate([timeline['channel'], timeline['channel']]).tolist()
+
+        # By time, note_offs first, so a key released and struck again at the same instant sounds again.
+        order = np.lexsort((is_on, times)).tolist()
+        messages = [Message('note_on' if is_on[i] else 'note_off', channel=channels[i], note=notes[i], velocity=velocities[i])
+                    for i in order]
+
+        return cls(times[order], messages, spin_seconds)
+
+    def play(self, outport, start_time=None):
+        """
+        Plays every batch on time, blocking until the song ends or stop is called.
+        If stopped early, the port is reset so no note is left sounding.
+
+        Parameters
+        ----------
+        outport : mido output port
+            The MIDI output port to send to.
+        start_time : float, optional
+            The time.perf_counter value the deadlines are measured from (default is now).
+
+        Returns
+        -------
+        bool
+            True if the whole song was played.
+        """
+        self._stop.clear()
+        start_time = time.perf_counter() if start_time is None else start_time
+
+        for deadline, batch in zip((self.deadlines + start_time).tolist(), self.batches):
+            # Sleep in short steps so stop is noticed during long rests.
+            remaining = deadline - time.perf_counter()
+            while remaining > self.spin_seconds and not self._stop.is_set():
+                time.sleep(min(remaining - self.spin_seconds, 0.05))
+                remaining = deadline - time.perf_counter()
+
+            if self._stop.is_set():
+                outport.reset()
+                return False
+
+            while time.perf_counter() < deadline:
+                pass
+
+            for msg in batch:
+                outport.send(msg)
+
+        return True
+
+    def stop(self):
+        """
+        Stops play from another thread.
+        """
+        self._stop.set()
+
+
+class MIDIStreamReader():
     """
-    Example usage: play and test MIDI file track(s).
+    A streaming alternative to MIDIProcessor for very long performances.
+    Instead of loading the whole file into mido objects, the file is memory mapped and each track is decoded lazily.
+    The tracks are merged in tick order with heapq.merge and converted to seconds on the fly,
+    so events come out in time order and only a small look-ahead window is ever held in memory.
 
-    1. Replace `midi_file_path` and `midi_port_name` with your own MIDI file and port name.
-    2. Specify the track number you want to play (0-indexed).
-    3. Use threading to play multiple tracks simultaneously for debugging/testing.
+    Iterating a reader yields EVENT_DTYPE arrays, each covering chunk_seconds of song time.
+
+    Attributes
+    ----------
+    file_path : str
+        The path to the MIDI file.
+    chunk_seconds : float
+        How much song time each yielded chunk covers.
+    ticks_per_beat : int
+        The resolution of the MIDI file.
     """
+
+    def __init__(self, file_path, chunk_seconds=1.0):
+        """
+        Initializes the MIDIStreamReader. Only the file header and track chunk headers are read here.
+
+        Parameters
+        ----------
+        file_path : str
+            The path to the MIDI file.
+        chunk_seconds : float, optional
+            How much song time each yielded chunk covers (default is 1.0).
+        """
+        self.file_path = file_path
+        self.chunk_seconds = chunk_seconds
+
+        with open(file_path, 'rb') as midi_file:
+            self._data = mmap.mmap(midi_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        chunk_name, header_size = struct.unpack_from('>4sL', self._data, 0)
+        if chunk_name != b'MThd':
+            raise OSError(f"{file_path} is not a MIDI file (no MThd header)")
+        _, track_count, division = struct.unpack_from('>hhh', self._data, 8)
+
+        # SMPTE files give a fixed number of ticks per second and ignore set_tempo.
+        if division < 0:
+            self.ticks_per_beat = None
+            self._smpte_seconds_per_tick = 1.0 / (-(division >> 8) * (division & 0xFF))
+        else:
+            self.ticks_per_beat = division
+            self._smpte_seconds_per_tick = None
+
+        # Find where each track's data lives, skipping any unknown chunks.
+        self._track_ranges = []
+        position = 8 + header_size
+        while position + 8 <= len(self._data) and len(self._track_ranges) < track_count:
+            chunk_name, chunk_size = struct.unpack_from('>4sL', self._data, position)
+            position += 8
+            if chunk_name == b'MTrk':
+                self._track_ranges.append((position, min(position + chunk_size, len(self._data))))
+            position += chunk_size
+
+    def _read_track(self, track_number, start, end):
+        """
+        Decodes one track lazily. Yields only the events the game cares about: channel messages and set_tempo.
+
+        Parameters
+        ----------
+        track_number : int
+            The track number (0-indexed).
+        start : int
+            Offset of the first byte of the track data.
+        end : int
+            Offset just past the last byte of the track data.
+
+        Yields
+        ------
+        tuple
+            (tick, track_number, sequence, status, data1, data2). For set_tempo, status is 0xFF and data1 is the tempo.
+        """
+        data = self._data
+        position = start
+        tick = 0
+        sequence = 0
+        last_status = None
+
+        while position < end:
+            # Delta time (variable length quantity).
+            delta = 0
+            while True:
+                byte = data[position]
+                position += 1
+                delta = (delta << 7) | (byte & 0x7F)
+                if byte < 0x80:
+                    break
+            tick += delta
+
+            status = data[position]
+            if status < 0x80:  # Running status: reuse the last status byte.
+                if last_status is None:
+                    raise OSError(f"running status without last status in track {track_number}")
+                status = last_status
+            else:
+                position += 1
+                if status != 0xFF:  # Meta messages don't set running status (same as mido).
+                    last_status = status
+
+            if status == 0xFF or status == 0xF0 or status == 0xF7:
+                if status == 0xFF:
+                    meta_type = data[position]
+                    position += 1
+                length = 0
+                while True:
+                    byte = data[position]
+                    position += 1
+                    length = (length << 7) | (byte & 0x7F)
+                    if byte < 0x80:
+                        break
+                if status == 0xFF and meta_type == 0x51 and length == 3:
+                    tempo = (data[position] << 16) | (data[position + 1] << 8) | data[position + 2]
+                    yield (tick, track_number, sequence, 0xFF, tempo, 0)
+                    sequence += 1
+                position += length
+
+            elif status >= 0xF0:
+                position += _SYSTEM_DATA_LENGTHS.get(status, 0)
+
+            else:
+                if _CHANNEL_DATA_LENGTHS[status & 0xF0] == 2:
+                    yield (tick, track_number, sequence, status, data[position], data[position + 1])
+                    position += 2
+                else:
+                    yield (tick, track_number, sequence, status, data[position], 0)
+                    position += 1
+                sequence += 1
+
+    def events(self):
+        """
+        Yields every channel event of the song in time order, one at a time.
+
+        Yields
+        ------
+        tuple
+            (time_seconds, status, data1, data2, track).
+        """
+        tracks = [self._read_track(track_number, start, end) for track_number, (start, end) in enumerate(self._track_ranges)]
+
+        # Current tempo segment: where it starts, and how long one tick lasts within it.
+        segment_tick = 0
+        segment_seconds = 0.0
+        if self._smpte_seconds_per_tick is not None:
+            seconds_per_tick = self._smpte_seconds_per_tick
+        else:
+            seconds_per_tick = bpm2tempo(120) / (self.ticks_per_beat * 1e6)
+
+        for tick, track_number, _, status, data1, data2 in heapq.merge(*tracks):
+            seconds = segment_seconds + (tick - segment_tick) * seconds_per_tick
+
+            if status == 0xFF:
+                if self._smpte_seconds_per_tick is None:
+                    segment_tick, segment_seconds = tick, seconds
+                    seconds_per_tick = data1 / (self.ticks_per_beat * 1e6)
+            else:
+                yield (seconds, status, data1, data2, track_number)
+
+    def __iter__(self):
+        """
+        Yields the song as EVENT_DTYPE arrays in time order, each covering chunk_seconds of song time.
+        Empty stretches of the song produce no chunk.
+
+        Yields
+        ------
+        numpy.ndarray
+            Structured array of dtype EVENT_DTYPE.
+        """
+        chunk = []
+        chunk_end = self.chunk_seconds
+
+        for event in self.events():
+            if event[0] >= chunk_end:
+                if chunk:
+                    yield np.array(chunk, dtype=EVENT_DTYPE)
+                    chunk = []
+                chunk_end = (event[0] // self.chunk_seconds + 1) * self.chunk_seconds
+            chunk.append(event)
+
+        if chunk:
+            yield np.array(chunk, dtype=EVENT_DTYPE)
+
+    def close(self):
+        """
+        Releases the memory-mapped file.
+        """
+        self._data.close()
+
+
+def play_event_stream(chunks, outport, now_ns=time.perf_counter_ns, on_note_on=None, on_note_off=None, stopped=None):
+    """
+    Sends streamed events (see MIDIStreamReader) to a MIDI output port as each one comes due. This is JukeBox mode's player.
+    Deadlines are measured from the start, so sleep overshoot never adds up.
+
+    Parameters
+    ----------
+    chunks : iterable of numpy.ndarray
+        Chunks of events (dtype EVENT_DTYPE) in time order, e.g. a MIDIStreamReader.
+    outport : mido.ports.BaseOutput
+        The port to send the events to.
+    now_ns : callable, optional
+        The clock to time the song by, in nanoseconds (default is time.perf_counter_ns).
+    on_note_on, on_note_off : callable, optional
+        Called with the note number just before a note on or note off is sent (e.g. to light up the key).
+    stopped : callable, optional
+        Checked before each event and while waiting for it; playing stops within 50 ms of it returning True.
+
+    Returns
+    -------
+    bool
+        True if every event was sent, False if playing was stopped.
+    """
+    start_ns = now_ns()
+
+    for chunk in chunks:
+        for seconds, status, data1, data2, _ in chunk.tolist():
+            if stopped is not None and stopped():
+                return False
+
+            # Wait until the event is due, in short steps so stopping is noticed during long rests.
+            delay = seconds - (now_ns() - start_ns) / 1e9
+            while delay > 0:
+                time.sleep(min(delay, 0.05))
+                if stopped is not None and stopped():
+                    return False
+                delay = seconds - (now_ns() - start_ns) / 1e9
+
+            command = status & 0xF0
+            if command == 0x90 and data2 != 0:
+                if on_note_on is not None:
+                    on_note_on(data1)
+            elif command == 0x80 or command == 0x90:
+                if on_note_off is not None:
+                    on_note_off(data1)
+
+            # Program change and channel pressure only carry one data byte.
+            if command == 0xC0 or command == 0xD0:
+                outport.send(Message.from_bytes([status, data1]))
+            else:
+                outport.send(Message.from_bytes([status, data1, data2]))
+
+    return True
+
+
+def main():
+    """
+    Command line entry point.
+
+    python -m midi_processor build [paths ...] [--workers N] [--force]
+        Compile every MIDI file under the given paths (default: songs/ and jukebox_songs/) into the song cache
+        in parallel, and write the song index. See song_cache.build_song_library.
+
+    python -m midi_processor export file [file ...]
+        Compile MIDI file(s) into .wpsong files next to the originals. See write_wpsong.
+
+    python -m midi_processor play [file] [--port NAME] [--tracks N ...]
+        Play and test MIDI file track(s) with play_timeline, for debugging/testing.
+    """
+    import argparse
     
-    os.chdir('songs')
+    project_dir = os.path.dirname(os.path.abspath(__file__))
     
-    midi_file_path = 'married_life.mid'
-    midi_port_name = 'Microsoft GS Wavetable Synth 0'  # Replace with your MIDI port name
+    parser = argparse.ArgumentParser(prog="python -m midi_processor", description="Walking Piano MIDI tools.")
+    commands = parser.add_subparsers(dest="command", required=True)
     
-    outport = open_output(midi_port_name)
-
-    processor = MIDIProcessor(midi_file_path)
-    track_number = 1  # Specify the track number you want to play
+    build_parser = commands.add_parser("build", help="Compile the song library into the song cache.")
+    build_parser.add_argument("paths", nargs="*", default=[os.path.join(project_dir, "songs"), os.path.join(project_dir, "jukebox_songs")],
+                              help="MIDI files or directories to compile (default: songs/ and jukebox_songs/).")
+    build_parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: one per CPU).")
+    build_parser.add_argument("--force", action="store_true", help="Clear the cache first and recompile every song.")
     
-    track_messages1 = processor.extract_track_messages(track_number)
+    export_parser = commands.add_parser("export", help="Compile MIDI file(s) into .wpsong files.")
+    export_parser.add_argument("files", nargs="+", help="MIDI files to export; each is written next to the original.")
     
-    track_messages0 = processor.extract_track_messages(0)
+    play_parser = commands.add_parser("play", help="Play track(s) of a MIDI file with play_timeline.")
+    play_parser.add_argument("file", nargs="?", default=os.path.join(project_dir, "songs", "married_life.mid"))
+    play_parser.add_argument("--port", default="Microsoft GS Wavetable Synth 0", help="MIDI output port name (see debug.py).")
+    play_parser.add_argument("--tracks", type=int, nargs="+", default=[0, 1], help="Track numbers to play (0-indexed).")
     
-    thread = threading.Thread(target=processor.play_track, args=(track_messages0, outport))
-    thread.start()
+    args = parser.parse_args()
     
-    processor.play_track(track_messages1, outport)
+    if args.command == "build":
+        from song_cache import build_song_library  # song_cache imports this module, so import it here
+        build_song_library(args.paths, workers=args.workers, force=args.force)
     
-    #print("\nTrack Messages 0:")
-    #for message in track_messages0[:20]:
-    #    print(message)
+    elif args.command == "export":
+        for file_path in args.files:
+            wpsong_path = os.path.splitext(file_path)[0] + '.wpsong'
+            MIDIProcessor(file_path).export_wpsong(wpsong_path)
+            print(f"Wrote {wpsong_path}")
     
-   # print("\nTrack Messages 1:")
-    #for message in track_messages1[:20]:
-    #    print(message)
\ No newline at end of file
+    elif args.command == "play":
+        outport = open_output(args.port)
+        processor = MIDIProcessor(args.file)
+        processor.play_timeline(outport, args.tracks)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,6 @@ input/output handling.
 
 Classes:
     PianoGameUI: Manages the piano game UI, including drawing the piano, handling MIDI input, and game mechanics.
-    ClockPauseManager: Manages the clock and scheduled functions, allowing pausing and resuming of the game.
 
 Functions:
     None (all functionality is encapsulated within classes).
@@ -16,20 +15,34 @@ Functions:
 Author: Devin Martin and Wesley Jake Anding
 """
 
+import os
 import pyglet
 import mido
-import datetime
 import threading
-from midi_processor import MIDIProcessor
+import time
+import numpy as np
+from song_cache import SongCache
+from midi_processor import split_tracks, load_wpsong, MIDIStreamReader, play_event_stream
+from song_clock import GameClock, SongClock, NoteDispatcher
+from falling_notes import NoteHighway
+from keyboard_layer import KeyboardLayer
+from keyboard_model import KeyboardModel, LOWEST_NOTE, KEY_BORDER
+from frame_stats import FrameStats, DEFAULT_EXPORT_DIR
+from song_metadata import get_song_metadata, apply_song_metadata, apply_song_metadata_to_events, order_tracks
 
 
 class PianoGameUI(pyglet.event.EventDispatcher):
 
-    def __init__(self, window, midi_file_path, game_mode, inport_name, outport_name, controller_size, player_count=1,  auto_play=0):
+    def __init__(self, window, midi_file_path, game_mode, inport_name, outport_name, controller_size, player_count=1,  auto_play=0, game_clock=None, simulation_rate=120,
+                 frame_stats_dir=None):
         
         """
         PianoGameUI is responsible for handling the  entire game portion of the Walking Piano project,
         this includes the user interface and all  logic for the piano game.
+        All game timing comes from game_clock (see song_clock.GameClock); pass one in to drive the game with a fake clock.
+        Game logic runs in fixed steps of 1/simulation_rate seconds (120 or 240 work well), independent of the display rate.
+        Frame timings (see frame_stats.py) are written to frame_stats_dir at the end of the song if it is given, or to
+        DEFAULT_EXPORT_DIR if the F3 overlay is showing.
         """
         
         print("Initializing Piano Game...")
@@ -79,12 +92,11 @@ class PianoGameUI(pyglet.event.EventDispatcher):
         # Array for holding black keys
         self.black_keys = []
 
-        # SORTED array of all MIDI keys. Allows access by MIDI notes 21-108.
-        self.all_midi_keys = []     
-           
-        # MIDI numbers for black keys (sharps/flats) in each octave
-        self.black_keys_midi = [22, 25, 27, 30, 32, 34, 37, 39, 42, 44, 46, 49, 51, 54, 56, 58,
-                                61, 63, 66, 68, 70, 73, 75, 78, 80, 82, 85, 87, 90, 92, 94, 97, 99, 102, 104, 106]
+        # Note name labels of the white keys, by MIDI note. Filled in by create_piano.
+        self.note_labels = {}
+        
+        # Every key's geometry and state (color, pressed, note timing) in arrays indexed by MIDI note - 21. See keyboard_model.py
+        self.keyboard = KeyboardModel(self.window.width, self.white_key_height, self.controller_size)
 
         #All the note names... "b" is placeholder for the flat symbol, which can be printed formally using '\u266D'.
         self.note_names = {
@@ -114,20 +126,41 @@ class PianoGameUI(pyglet.event.EventDispatcher):
         # Placeholder array for notes currently being drawn.
         self.active_notes = {note: False for note in range(21, 109)}
         
-        #Array for tracking notes currently being played by user.
-        self.playing_notes = {note: False for note in range(21, 109)}
-        
-        self.active_note_events = {}  # New: Dictionary to track active note events
-
-        # Array for notes as they approach the time for being played.
+        # Notes currently being played by the user are tracked in self.keyboard.pressed.
+        
+        self.fall_speed = 150  # Speed of the falling rectangles, in pixels per second
+        self.perfect_window = 20 / self.fall_speed  # Seconds either side of a note reaching the keys that a press is 'perfect'
+        self.okay_window = 70 / self.fall_speed  # Seconds before a note reaches the keys that a press counts as 'okay'
+        self.simulation_rate = simulation_rate  # Fixed game logic steps per second, see update_rectangles
+        self.display_rate = 60  # Frames per second that update_rectangles is scheduled at
+        # Most simulation steps one frame may run; after a longer stall the song skips ahead instead (see update_rectangles).
+        self.max_steps_per_frame = max(8, 2 * -(-simulation_rate // self.display_rate))
+        
+        # How long each stage of every frame takes, shown by the F3 overlay and exported at the end of the song. See frame_stats.py
+        self.frame_stats = FrameStats(budget_ms=1000 / self.display_rate)
+        self.frame_stats_dir = frame_stats_dir
+        self.show_frame_stats = False
+        self.midi_file_path = midi_file_path
+        self.spawn_horizon = 1.0  # Notes are made into rectangles this many seconds of song time before they come into view
+        
+        # Song notes and the song time of the last update, set in start_rectangle_game and advanced by update_rectangles
+        self.player_tracks = []  # (track_notes, player) pairs, set in load_midi_file
+        self.note_dispatcher = None
+        self.song_time = 0.0
+        self.end_buffer_time = 7  # Seconds between the last note and the game over message
+        
+        # Practice loop markers in song time (see set_loop_marker); no loop while loop_end is None
+        self.loop_start = 0.0
+        self.loop_end = None
+
+        # Notes as they approach the time for being played are tracked in self.keyboard.timing.
         # 0 = dont play, 1 = okay 2 = perfect
-        self.incoming_notes = {note: {'note_timing': 0, 'note_played': 0} for note in range(21, 109)}
 
         """#Temp for testing visuals"""
         self.active_notes_line_segments = {}
 
-        # Intialize falling rectangle manager
-        self.falling_rectangles_list = []
+        # Intialize falling rectangle manager. Every falling note is a slot of the highway's arrays (see falling_notes.py).
+        self.note_highway = NoteHighway(self.rectangles_batch)
 
         """Todo: Get this note list working with 'extract_track_messages()' from MIDIprocessor class"""
         # Create note list
@@ -141,6 +174,10 @@ class PianoGameUI(pyglet.event.EventDispatcher):
         # Create piano keys and start game.
         self.create_piano()
         
+        # The keyboard is drawn once into textures; only lit up keys are drawn each frame. See keyboard_layer.py
+        self.keyboard_layer = KeyboardLayer(self.window, self.keyboard, self.note_labels, self.middle_c_special_label,
+                                            [self.white_keys_batch], [self.black_keys_batch], self.white_key_height)
+        
         #Flag for game state
         self.game_active = True
         
@@ -150,7 +187,15 @@ class PianoGameUI(pyglet.event.EventDispatcher):
 
         self.window.push_handlers(on_draw=self.on_draw)
         
-        self.clock_pause_manager = ClockPauseManager(self.update_rectangles)
+        # One monotonic clock for song time, frame time and input timestamps, and the song time for the falling notes
+        # on top of it; pausing the song clock (Practice mode) freezes the game. See song_clock.py
+        self.game_clock = game_clock if game_clock is not None else GameClock()
+        self.song_clock = SongClock(self.game_clock)
+        self.playback_rates = (0.25, 0.5, 0.75, 1.0, 1.25, 1.5, 2.0)  # Steps for the - and = keys
+        
+        # Compiled note timelines are cached on disk, keyed by file contents. See song_cache.py
+        self.song_cache = SongCache()
+        self.song_timeline = None  # Is set in load_midi_file
         
         #Add custom event handler for window close. This will allow us to clean up the MIDI port, and allow user to return to menu with ESC/Window close
         def on_window_close():
@@ -200,6 +245,16 @@ class PianoGameUI(pyglet.event.EventDispatcher):
             anchor_x='right', anchor_y='top', color=(255, 255, 255, 255)
         )
         
+        # Frame timing overlay, toggled with F3 (see toggle_frame_stats)
+        self.frame_stats_batch = pyglet.graphics.Batch()
+        self.frame_stats_background = pyglet.shapes.Rectangle(0, 0, 0, 0, color=(0, 0, 0), batch=self.frame_stats_batch)
+        self.frame_stats_background.opacity = 180
+        self.frame_stats_label = pyglet.text.Label(
+            "", font_name='Courier New', font_size=12, multiline=True, width=420,
+            x=20, y=self.window.height - 60, anchor_x='left', anchor_y='top',
+            color=(255, 255, 255, 255), batch=self.frame_stats_batch
+        )
+        
         #Define back button
         self.back_button = pyglet.shapes.Rectangle(10, self.window.height - 40, 100, 30, color=(50, 50, 50), batch = self.game_elements_batch)
 
@@ -243,7 +298,7 @@ class PianoGameUI(pyglet.event.EventDispatcher):
             keyboard_thread.start()
           
             #Schedule updating rectangles function to move things down constantly.
-            pyglet.clock.schedule_interval(self.update_rectangles, 1/60.0)
+            pyglet.clock.schedule_interval(self.update_rectangles, 1 / self.display_rate)
            
             #load file in; begin game
             self.load_midi_file(midi_file_path)
@@ -266,58 +321,49 @@ class PianoGameUI(pyglet.event.EventDispatcher):
     def load_midi_file(self, midi_file_path):
         """
         Load a MIDI file into the game.
-        Utilizes the MIDIProcessor class from midi_processor.py
+        The compiled note timeline comes from the song cache (see song_cache.py),
+        so a song that has been played before starts without being parsed again.
+        Pre-compiled .wpsong files (see midi_processor.write_wpsong) are memory mapped directly.
+        Per-song settings from song_metadata.csv (tempo, transposition, tracks and hands) are applied after loading.
 
         Parameters
         ----------
         midi_file_path : str
-            The path to the MIDI file.
+            The path to the MIDI file (.mid/.midi or .wpsong).
         """
         
         
-        self.midi_processor = MIDIProcessor(midi_file_path)
+        if midi_file_path.endswith('.wpsong'):
+            _, self.song_timeline = load_wpsong(midi_file_path)
+        else:
+            self.song_timeline = self.song_cache.get_timeline(midi_file_path)
         
-        track_number = 0 #Assuming we only using the first track for now...
-        track_messages = self.midi_processor.extract_track_messages(track_number)
+        song_metadata = get_song_metadata(midi_file_path)
+        self.song_timeline = apply_song_metadata(self.song_timeline, song_metadata)
         
-        track_messages2 = []
-
-        if track_messages == []:
-            track_number = 1
-            track_messages2 = self.midi_processor.extract_track_messages(track_number)
-            
-            
+        # One pass splits the song into per-track note arrays; only tracks that contain notes are playable.
+        track_notes, track_summary = split_tracks(self.song_timeline)
+        playable_tracks = order_tracks(sorted(track_summary), song_metadata)
             
         if self.player_count == 1:
-            if track_messages != []:
-                pyglet.clock.schedule_once(self.start_rectangle_game_thread, 0, track_messages, 1)
-                
-            elif track_messages2 != []:
-                pyglet.clock.schedule_once(self.start_rectangle_game_thread, 0, track_messages2, 1)
+            if len(playable_tracks) >= 1:
+                self.player_tracks = [(track_notes[playable_tracks[0]], 1)]
+                pyglet.clock.schedule_once(self.start_rectangle_game, 0)
                 
             else:
-                print("This song is could not be played. Tracks zero and 1 are both unavailable.")
+                print("This song is could not be played. No track contains any notes.")
                 self.exit_game()
         
         
         elif self.player_count == 2:
             
-            try:
-                track_messages2 = self.midi_processor.extract_track_messages(1)
-                
-                if track_messages2 != [] and track_messages != []:
-                    pyglet.clock.schedule_once(self.start_rectangle_game_thread, 0, track_messages, 1)
-                    pyglet.clock.schedule_once(self.start_rectangle_game_thread, 0, track_messages2, 2)
-                else:
-                    print("This song is not suitable for two players.")
-                    self.exit_game()
-
-            except:
+            #Each player gets their own track.
+            if len(playable_tracks) >= 2:
+                self.player_tracks = [(track_notes[playable_tracks[0]], 1), (track_notes[playable_tracks[1]], 2)]
+                pyglet.clock.schedule_once(self.start_rectangle_game, 0)
+            else:
                 print("This song is not suitable for two players.")
                 self.exit_game()
-                
-            finally:
-                'Do nothing...'
 
         
     def play_piano_user(self):
@@ -337,22 +383,27 @@ class PianoGameUI(pyglet.event.EventDispatcher):
                     msg = inport.poll()  # Non-blocking receive, immediately returns None if no message is available
 
                     if msg:
+                        timestamp = self.game_clock.now_ns()  # When the key was pressed, before any processing delay
+                        handling_start = time.perf_counter_ns()
+                        
                         # Check for note_on and note_off events:
                         if msg.type == "note_on" and msg.velocity != 0:
-                            self.highlight_key(msg.note)  # Highlight the key
+                            self.highlight_key(msg.note, self.song_clock.time_at(timestamp))  # Judge and highlight the key
                             self.outport.send(msg)  # Send the message out if necessary
-                            self.playing_notes[msg.note] = True
+                            self.keyboard.set_pressed(msg.note, True)
 
                             if self.paused == True and self.pausenote == msg.note:
                                 print("Resuming game...")
-                                self.clock_pause_manager.resume()
+                                self.song_clock.resume(at_ns=timestamp)
                                 self.paused = False
                                 """Race condition betwween pause and unpause..."""
 
                         elif msg.type == "note_off" or (msg.type == "note_on" and msg.velocity == 0):
                             self.unhighlight_key(msg.note)  # Unhighlight the key
                             self.outport.send(msg)  # Send the message out if necessary
-                            self.playing_notes[msg.note] = False
+                            self.keyboard.set_pressed(msg.note, False)
+                        
+                        self.frame_stats.add_input(time.perf_counter_ns() - handling_start)
 
                     time.sleep(0.0001)  # Sleep for a very short time to prevent high CPU usage
             finally:
@@ -433,68 +484,34 @@ class PianoGameUI(pyglet.event.EventDispatcher):
         There are two modes for the piano, 49 key and 88 key.
         A parameter passed into the class will determine which mode to use.
         See attribute 'controller_size' for more details.
+        
+        Where each key goes comes from the keyboard layout table and its color from the keyboard model (see keyboard_model.py);
+        on a 49 key piano the keys out of reach are grayed out.
+        These shapes are only drawn once, into the cached keyboard layer (see keyboard_layer.py).
         """
 
-        number_white_keys = 52  # 52 white keys in total
-
-        #I black keys should be 2/3 height of the white key and half the whidth.
-
-        # White Key size:
         white_key_width = self.white_key_width
         white_key_height = self.white_key_height
-
-        # Black key size:
-        black_key_width = white_key_width / 2
-        black_key_height = white_key_height * (2 / 3)
-
-        # Piano location:
-        
-        # Center the piano in the window
-        x_position = (self.window.width - white_key_width * number_white_keys) / 2
-        
-        """
-        Here we can define the size of the piano. If we are using the small piano mode, we will attempt center the 49 key piano in the window. Questionable logic but it looks right...
-        If we are using the full piano mode, we will use the full width of the window. 
-        """ 
-        if self.controller_size == '49 key': #If we are using the small piano mode...
-            x_position = (self.window.width - white_key_width * number_white_keys) / 2 + (white_key_width * 2.5) #Center the piano in the window. Logic weird but it looks right
-            
-        else: #If we are using the full piano mode...
-            x_position = (self.window.width - white_key_width * number_white_keys) / 2
-        
         y_position = 0
-        border_size = 1
-
-        # 21 is the lowest MIDI note on our piano. Start out couting at 20 for 'zero'
-        midi_key_counter = 20
         
         # Create the piano keys
-        for i in range(number_white_keys):  # 52 white keys in total
-
-            # Create white key
-            white_key = self.create_white_key(
-                x_position + border_size, 0, white_key_width - 2 * border_size, white_key_height - 2 * border_size, (255, 255, 255))
-            midi_key_counter += 1
+        for midi_key_counter, is_black, x, y, width, height in self.keyboard.layout.tolist():
+            color = tuple(self.keyboard.rest_color[midi_key_counter - LOWEST_NOTE].tolist())
             
-            """
-            Again here we can make changes based on size of piano we desire
-            If we are using the small piano mode, we will gray out the keys that are not in the range of the small piano!
-            """
-            if self.controller_size == '49 key': #If we are using the small piano mode...
-                if midi_key_counter <= 35 or 85 <= midi_key_counter : #If we are using the small piano mode...
-                    white_key.color = (100, 100, 100) #Gray out the keys that are not in the range of the small piano.
-                    
-            else:
-                #white_key.color = (255, 255, 255) The keys are already white as defined above on initialization... no need to change them.
-                pass
+            if is_black:
+                black_key = self.create_black_key(x, y, width, height, color)
                 
-            self.all_midi_keys.append((white_key, midi_key_counter))
+                # Black keys have no note name label.
+                self.black_keys.append((black_key, None))
+                continue
             
+            white_key = self.create_white_key(x, y, width, height, color)
+            x_position = x - KEY_BORDER  # Left edge of the white key's slot, gap included
             
             #This is not part of the piano itself, but lines to help the user see. To the right of every line is the C key.
             if (midi_key_counter - 24) % 12 == 0:
                 self.visibility_lines.append(pyglet.shapes.Line(
-                x_position, self.white_key_height, x_position, self.window.height, width=1, color=(123, 123, 123), batch = self.game_elements_batch))  # Add this line
+                x_position, self.white_key_height, x_position, self.window.height, width=1, color=(123, 123, 123), batch = self.black_keys_batch))  # Add this line
                 
             
             # Add note name label for white key
@@ -527,8 +544,6 @@ class PianoGameUI(pyglet.event.EventDispatcher):
                     color=(255, 255, 255, 255),  # White color
                     batch = self.white_keys_batch
                 )
-                
-                self.white_keys.append((white_key, note_label))
             else:
                 note_label = pyglet.text.Label(
                     note_name,
@@ -542,123 +557,24 @@ class PianoGameUI(pyglet.event.EventDispatcher):
                     color=note_label_color,
                     batch = self.white_keys_batch
                 )
-                self.white_keys.append((white_key, note_label))
             
-            # Base case: place a black key between the first and second white keys
-            if i == 0:
-                
-                #Create black key
-                black_key_x = x_position + white_key_width - border_size - black_key_width / 2
-                black_key_y = y_position + white_key_height - black_key_height
-                black_key = self.create_black_key(
-                    black_key_x, black_key_y, black_key_width, black_key_height, (0, 0, 0))
-
-                midi_key_counter += 1
-                self.all_midi_keys.append((black_key, midi_key_counter))
-                
-
-                """
-                # Add note name label for black key
-                note_label = pyglet.text.Label(
-                    self.note_names[midi_key_counter],
-                    font_name='Times New Roman',
-                    font_size=23,
-                    x=black_key_x + black_key_width / 2,
-                    y=black_key_y + black_key_height - 10,
-                    anchor_x='center',
-                    anchor_y='center',
-                    color=(255, 255, 255, 255)
-                )
-                """
-                note_label = None
-                
-                #Insert black key into list with note label
-                self.black_keys.append((black_key, note_label))
-
-            # Repeating pattern: place black keys for the remaining white keys
-            elif (1 <= (i - 1) % 7 <= 2) or (4 <= (i - 1) % 7 <= 6):
-                # Algorithm Generated with precise instruction of GPT4.
-
-                # Create black key
-                if i < 51:  # Ensure there's a white key after the current one
-                    black_key_x = x_position + white_key_width - border_size - black_key_width / 2
-                    black_key_y = y_position + white_key_height - black_key_height
-                    black_key = self.create_black_key(
-                        black_key_x, black_key_y, black_key_width, black_key_height, (0, 0, 0))
-
-                    midi_key_counter += 1
-                    self.all_midi_keys.append((black_key, midi_key_counter))
-
-                    """
-                    # Add note name label for black key
-                    note_label = pyglet.text.Label(
-                        self.note_names[midi_key_counter],
-                        font_name='Times New Roman',
-                        font_size=10,
-                        x=black_key_x + black_key_width / 2,
-                        y=black_key_y + black_key_height - 10,
-                        anchor_x='center',
-                        anchor_y='center',
-                        color=(255, 255, 255, 255)
-                    )
-                    """
-                    note_label = None
-
-                    self.black_keys.append((black_key, note_label))
-                    
-            # Move to the next key position
-            x_position += white_key_width
-
-        # Draw the piano keys and labels
+            self.white_keys.append((white_key, note_label))
+            self.note_labels[midi_key_counter] = note_label
 
     # Function to draw 'imaginary' line where our notes will fall from
     def create_active_notes_line(self):
         """
         Create 'imaginary' line where notes will fall from.
-        This lines up with the piano keys and utilizes very similar logic to the create_piano function.
+        Each segment sits at the top of the window, directly above its key in the keyboard layout table (see keyboard_model.py).
         """
         
-        number_white_keys = 52  # 52 white keys in total
-        
-        white_key_width = self.white_key_width
-        black_key_width = white_key_width / 2
-
         y_position = self.window.height # Position the line near the top of the window
-        x_position = (self.window.width - white_key_width * number_white_keys) / 2
-
-        """
-        Similar to the create_piano function, we will setup based on the size of the piano we are using.
-        """        
-        if  self.controller_size == '49 key':
-            x_position = (self.window.width - white_key_width * number_white_keys) / 2 + (white_key_width * 2.5) #Center the piano in the window
-        
-        else:
-            x_position = (self.window.width - white_key_width * number_white_keys) / 2
-        
-        border_size = 1
         height = 6
-        midi_key_counter = 21  # Starting MIDI note for the lowest white key
 
         # Create the active notes line segments
-        for i in range(52):  # Iterate over the 52 positions for white keys
-            # Create segment for white key
-            white_key_segment = pyglet.shapes.Rectangle(
-                x_position + border_size, y_position, white_key_width - 2 * border_size, height, color=(255, 255, 255))
-            self.active_notes_line_segments[midi_key_counter] = white_key_segment
-            midi_key_counter += 1  # Increment MIDI key counter for each key
-
-            # Check if a black key should be placed
-            if i == 0 or (1 <= (i - 1) % 7 <= 2) or (4 <= (i - 1) % 7 <= 6):
-                if i < 51:  # Ensure there's a white key after the current one
-                    # Create segment for black key
-                    black_key_x = x_position + white_key_width - border_size - black_key_width / 2
-                    black_key_segment = pyglet.shapes.Rectangle(
-                        black_key_x, y_position, black_key_width, height, color=(0, 0, 0))
-                    self.active_notes_line_segments[midi_key_counter] = black_key_segment
-                    midi_key_counter += 1  # Increment MIDI key counter for black key
-
-            # Move to the next key position
-            x_position += white_key_width
+        for midi_key_counter, is_black, x, y, width, key_height in self.keyboard.layout.tolist():
+            self.active_notes_line_segments[midi_key_counter] = pyglet.shapes.Rectangle(
+                x, y_position, width, height, color=(0, 0, 0) if is_black else (255, 255, 255))
 
             
     # Function to draw all aspects of the game. This includes pianos, rectangles and any other buttons. This method is called automatically by Pyglet every frame.
@@ -667,89 +583,126 @@ class PianoGameUI(pyglet.event.EventDispatcher):
         Draw all aspects of the game. This method is called automatically by Pyglet every frame.
         """
 
+        draw_start = time.perf_counter_ns()
         self.window.clear()
         
         if self.window.game_state == 'GAME':
             
             self.rectangles_batch.draw()
-            self.white_keys_batch.draw()
-            self.black_keys_batch.draw()
+            self.keyboard_layer.update()
+            self.keyboard_layer.draw()
             self.game_elements_batch.draw()
             
             if self.game_mode == "Challenge":
                 self.score_label.draw()
                 
-            #self.fps_display.draw()    
+            if self.show_frame_stats:
+                self.frame_stats_batch.draw()
+                self.fps_display.draw()
             
             # Draw Game Over message if the game is over
             if self.game_over:
                 self.game_over_label.draw()
+        
+        self.frame_stats.add('draw', time.perf_counter_ns() - draw_start)
 
             
       
 
                 
     # Function to highlight a specific key based on the key number
-    def highlight_key(self, key_number):
+    def highlight_key(self, key_number, song_time=None):
         """
-        Highlight a specific key based on the key number.
+        Highlight a specific key based on the key number, judging the press against the song's notes (see judge_press).
 
         Parameters
         ----------
         key_number : int
             The number of the key to highlight.
+        song_time : float, optional
+            When the key was pressed, in song time (default is the time of the current simulation step).
         """
         
-        color = (0, 0, 0)
-        black_color = (0, 0, 0)
-        
         # if key number in not in valid range, pass ~ error catching
-        if key_number not in range(21, 109): 
+        if not self.keyboard.has_key(key_number): 
             return # Do nothing if the key number is out of range
-        
+        key = key_number - LOWEST_NOTE
         
         #Check if game is in FreePlay mode. If so, we will highlight all keys the same color.
         if self.game_mode == "FreePlay":
-            color = self.perfect_color_white
-            black_color = self.perfect_color_black
+            self.color_key(key_number, 2)
+            return
         
         # Else if not freeplay, assign colors based on the note timing.
-        else:
-            if self.incoming_notes[key_number]['note_timing'] == 1:
-                color = self.okay_color_white
-                black_color = self.okay_color_black
-                
-                #Add points for playing the note 'okay', ONE TIME only.
-                if self.incoming_notes[key_number]['note_played'] == 0:
-                    self.incoming_notes[key_number]['note_played'] = 1
-                    self.score += self.points_for_hit_okay
-                
-            elif self.incoming_notes[key_number]['note_timing'] == 2:
-                color = self.perfect_color_white
-                black_color = self.perfect_color_black
-                
-                #Add points for playing the note perfectly, ONE TIME only.
-                if self.incoming_notes[key_number]['note_played'] == 0:
-                    self.incoming_notes[key_number]['note_played'] = 1
-                    self.score += self.points_for_hit_perfect
-                    
-            else:
-                color = self.wrong_color_white
-                black_color = self.wrong_color_black
+        timing, note_index = self.judge_press(key_number, self.song_time if song_time is None else song_time)
+        
+        #Add points for playing the note 'okay' or perfectly, ONE TIME only per note.
+        if timing != 0 and self.keyboard.scored[key] != note_index:
+            self.keyboard.scored[key] = note_index
+            self.score += self.points_for_hit_perfect if timing == 2 else self.points_for_hit_okay
         
+        self.color_key(key_number, timing)
+    
+    def judge_press(self, key_number, song_time):
+        """
+        Judge a key press against the notes of the song at the song time it happened, rather than against where the
+        falling rectangles were drawn, so a slow frame can't move a note out of (or into) its hit window.
+        A note reaches the keys fall_time after its onset (it comes into view at its onset). Pressing within
+        perfect_window of that is 'perfect'; from okay_window before it until the note ends is 'okay'.
+
+        Parameters
+        ----------
+        key_number : int
+            The MIDI note of the key pressed.
+        song_time : float
+            When the key was pressed, in song time.
 
-        #Apply color to the key
-        #Is it a black key? True/False...
-        is_black_key = key_number in self.black_keys_midi 
+        Returns
+        -------
+        tuple
+            (timing, note index): timing is 0 = wrong, 1 = okay, 2 = perfect; the note index is into the
+            NoteDispatcher's arrays, -1 if no note was hit.
+        """
+        if self.note_dispatcher is None:
+            return 0, -1
         
-        for key, midi_number in self.all_midi_keys:
-            if midi_number == key_number:
-                
-                if is_black_key:
-                    key.color = black_color
-                else:
-                    key.color = color
-                return
+        fall_time = (self.window.height - self.white_key_height) / self.fall_speed
+        onset_at_keys = song_time - fall_time  # Onset of a note that is reaching the keys right now
+        
+        note_index = self.note_dispatcher.find_note(key_number, onset_at_keys, self.okay_window)
+        if note_index < 0:
+            return 0, -1
+        
+        if abs(onset_at_keys - self.note_dispatcher.onsets[note_index]) <= self.perfect_window:
+            return 2, note_index
+        return 1, note_index
+    
+    def color_key(self, key_number, timing):
+        """
+        Color a key for how well it was played.
+
+        Parameters
+        ----------
+        key_number : int
+            The MIDI note of the key.
+        timing : int
+            0 = wrong, 1 = okay, 2 = perfect.
+        """
+        if timing == 2:
+            color = self.perfect_color_white
+            black_color = self.perfect_color_black
+        elif timing == 1:
+            color = self.okay_color_white
+            black_color = self.okay_color_black
+        else:
+            color = self.wrong_color_white
+            black_color = self.wrong_color_black
+
+        #Apply color to the key. It is drawn at the next frame, see KeyboardLayer.update
+        if self.keyboard.is_black_key(key_number):
+            self.keyboard.set_color(key_number, black_color)
+        else:
+            self.keyboard.set_color(key_number, color)
 
     # Function to unhighlight a specific key based on the key number
     def unhighlight_key(self, key_number):
@@ -761,49 +714,43 @@ class PianoGameUI(pyglet.event.EventDispatcher):
         key_number : int
             The number of the key to unhighlight.
         """
-        # Is black key?
-        is_black_key = key_number in self.black_keys_midi
-
-        for key, midi_number in self.all_midi_keys:
-            if midi_number == key_number:
-                if is_black_key:
-                    key.color = (0, 0, 0)
-                else:
-                    # We need to check if the key is outside the small piano range, and if so return it to grayed.
-                    if self.controller_size == '49 key':
-                        if midi_number <= 35 or 85 <= midi_number:
-                            key.color = (100, 100, 100)
-                        else:
-                            key.color = (255, 255, 255)
-                    else: #If we are using the full piano mode, every key is white.
-                        key.color = (255, 255, 255)
-                return
+        if not self.keyboard.has_key(key_number):
+            return
+
+        # Black, white, or grayed if the key is outside the small piano range (see KeyboardModel.rest_color).
+        self.keyboard.reset_color(key_number)
     
     # Function to prepare a falling rectangle for a specific note number
-    def prepare_falling_rectangle(self, note_number, player):
+    def prepare_falling_rectangle(self, note_number, duration, player, lead_time=0.0):
         """
         Prepare a falling rectangle for a specific note number.
+        The rectangle is as long as the note lasts. Its bottom starts lead_time seconds of falling above the top of the window,
+        so a note made ahead of time drops into view exactly at its onset.
 
         Parameters
         ----------
         note_number : int
             The number of the note.
+        duration : float
+            How long the note is held, in seconds.
         player : int
             The player number.
+        lead_time : float, optional
+            Seconds until the note's onset; negative if it should already have started falling (default is 0).
 
         Returns
         -------
-        pyglet.shapes.BorderedRectangle
-            The created falling rectangle.
+        int
+            The falling rectangle's slot in the note highway.
         """
        
         # Where it's at?
         reference_segment = self.active_notes_line_segments[note_number]
 
         x_pos = reference_segment.x
-        y_pos = reference_segment.y
+        y_pos = reference_segment.y + lead_time * self.fall_speed
         width = reference_segment.width
-        height = 0  # Initial height of the rectangle
+        height = duration * self.fall_speed
         
         self.player1_white_color = (137, 207, 240)
         self.player1_black_color = (70, 130, 255)
@@ -819,113 +766,42 @@ class PianoGameUI(pyglet.event.EventDispatcher):
         if player == 1:
             inner_color = self.player1_white_color  # Inner color for white keys
 
-            if note_number in self.black_keys_midi:
+            if self.keyboard.is_black_key(note_number):
                 inner_color = self.player1_black_color  # Different inner color for black keys
         
         elif player == 2:
             inner_color = self.player2_white_color  # Inner color for white keys
             
-            if note_number in self.black_keys_midi:
+            if self.keyboard.is_black_key(note_number):
                 inner_color = self.player2_black_color  # Different inner color for black keys
 
-        border_color = (0, 0, 0)  # Black border for visibility
-        border_thickness = 2  # Thickness of the border
-
-        # Create the bordered rectangle
-        new_rectangle = pyglet.shapes.BorderedRectangle(
-            x=x_pos, 
-            y=y_pos, 
-            width=width, 
-            height=height, 
-            border=border_thickness, 
-            color=inner_color, 
-            border_color=border_color,
-            batch = self.rectangles_batch
-        )
-
-        # Custom attributes for logic handling
-        new_rectangle.note_number = note_number
-        new_rectangle.lock = False
-        new_rectangle.played = False
-        new_rectangle.note_off = False
-        new_rectangle.negative_y = 0
+        return self.note_highway.spawn(note_number, player, x_pos, y_pos, width, height, inner_color)
 
-        timestamp = datetime.datetime.now().timestamp()
-        unique_id = f"{note_number}_{timestamp}"
-        new_rectangle.unique_id = unique_id
-        
-        self.active_note_events[unique_id] = {'rectangle': new_rectangle, 'note_number': note_number, 'locked': False, 'played': False}
-        return new_rectangle
-
-    # Function to schedule notes for our Piano game. 
-    def start_rectangle_game(self, dt, track_messages, player):
+    # Function to start the notes of our Piano game. 
+    def start_rectangle_game(self, dt):
         
         """
-        Function to schedule notes for our Piano game. 
-        This function is called during initialization by the MIDIProcessor class.
+        Function to start the notes of our Piano game. 
+        This function is called during initialization by load_midi_file.
+
+        Nothing is scheduled per note: the notes go into a NoteDispatcher (see song_clock.py),
+        and update_rectangles makes a rectangle for each note shortly before it comes into view (see spawn_horizon).
+        Notes come paired with their durations (see MIDIProcessor.compile_timeline), so there are no note_offs to dispatch.
 
         Parameters
         ----------
         dt : float 
             The delta time.
-        track_messages : list
-            The list of track messages.
-        player : int
-            The player number.
         """
+        self.song_time = 0.0
+        self.note_dispatcher = NoteDispatcher(self.player_tracks)
         
-
-        total_delay = 0
-        buffer_time = 7  # 10 seconds buffer time for end of song
-        
-
-        for msg, delay in track_messages:
+        # Make enough rectangles for the busiest moment of the song now, so none are made mid-song.
+        # A rectangle lives from spawn_horizon before its onset, through the fall to the keys, until its note ends.
+        fall_time = (self.window.height - self.white_key_height) / self.fall_speed
+        self.note_highway.reserve(self.note_dispatcher.peak_active(self.spawn_horizon, fall_time))
         
-            #We can't have delay zero or else 2 messages will get scheduled at the same time...
-            #If two messages are scheduled at same time, there are bugs. Add tiny delay to avoid this... hope this delay doesn't accumulate and cause more issues. :')
-            if delay == 0:
-                delay = 0.000001
-                
-            total_delay += delay
-        
-            
-            if msg.type == 'note_on' and msg.velocity != 0:
-                    
-                func = lambda dt, note=msg.note, velocity=msg.velocity, player=player: self.schedule_flag_note_on(dt, note, velocity, player)                
-                self.clock_pause_manager.schedule_function(func, delay=total_delay)
-                
-                #pyglet.clock.schedule_once(self.schedule_flag_note_on, total_delay, note=msg.note, velocity=msg.velocity)
-            
-            elif msg.type == 'note_off' or (msg.type == 'note_on' and msg.velocity == 0):
-                
-                
-                func = lambda dt, note=msg.note, velocity=msg.velocity: self.schedule_flag_note_off(dt, note, velocity)                
-                self.clock_pause_manager.schedule_function(func, delay=total_delay)
-                                                        
-                #pyglet.clock.schedule_once(self.schedule_flag_note_off, total_delay, note=msg.note)
-                
-            
-        #print(f"Total delay: {total_delay}")
-    
-        # Schedule end of the song with buffer time using ClockPauseManager
-        self.clock_pause_manager.schedule_function(self.end_of_song, total_delay + buffer_time)
-        
-    def start_rectangle_game_thread(self, dt, track_messages, player):
-        """
-        Wrapper function for threading.
-        Just calls start_rectangle_game with the given parameters and starts the seperate game thread.
-
-        Parameters
-        ----------
-        dt : float
-            The delta time.
-        track_messages : list
-            The list of track messages.
-        player : int
-            The player number.
-        """
-        game_thread = threading.Thread(target=self.start_rectangle_game, args=(dt, track_messages, player))
-        game_thread.start()
+        self.song_clock.start()
         
     def end_of_song(self, dt):
         """
@@ -940,184 +816,274 @@ class PianoGameUI(pyglet.event.EventDispatcher):
         
         # Acknowledge end of the song
         self.game_over = True
+        
+        if self.frame_stats_dir is not None or self.show_frame_stats:
+            self.export_frame_stats()
     
-    # Function to flag a note as being played or not
-    def flag_note(self, note_number, bool):
+    # Function to turn a note into its falling rectangle
+    def spawn_note(self, onset, note, velocity, duration, player):
         """
-        Flag a note as being played or not.
+        Make the falling rectangle for a note, placed for the current song time.
+        Called by update_rectangles when the note comes within the spawn horizon, and by seek.
 
         Parameters
         ----------
-        note_number : int
-            The number of the note.
-        bool : bool
-            Flag indicating if the note is played.
-        """
-        # Directly flagging note_on or note_off without iterating every time
-        unique_id = None
-        # Attempt to find the most recent matching note_number event that's not locked yet
-        for event_id, event_data in sorted(self.active_note_events.items(), key=lambda x: x[0], reverse=True): 
-            if f"{note_number}_" in event_id and not event_data['locked']:
-                unique_id = event_id
-                if bool is False and unique_id:
-                    self.active_note_events[unique_id]['locked'] = True
-                    self.active_note_events[unique_id]['rectangle'].lock = True
-                    
-                break
-            
-        if bool:
-            pass
-
-    # Function to schedule a note to be flagged as being played 
-    def schedule_flag_note_on(self, dt, note, velocity, player):
-        """
-        Schedule a note to be flagged as being played.
-
-        Parameters
-        ----------
-        dt : float
-            The delta time.
+        onset : float
+            When the note starts, in song time.
         note : int
             The note number.
         velocity : int
             The velocity of the note.
+        duration : float
+            How long the note is held, in seconds.
         player : int
             The player number.
         """
-        new_rectangle = self.prepare_falling_rectangle(note, player)
-        self.falling_rectangles_list.append(new_rectangle)
-        self.flag_note(note, True)
+        self.prepare_falling_rectangle(note, duration, player, onset - self.song_time)
 
-    # Function to schedule a note to be flagged as not being played
-    def schedule_flag_note_off(self, dt, note, velocity):
+    def seek(self, song_time):
         """
-        Schedule a note to be flagged as not being played.
+        Jump to a point in the song.
+        The rectangles on screen are replaced by the ones that would be falling at that moment, found by binary search
+        of the song's notes, so a jump costs the same 15 minutes into a long piece as at the start.
+        Only notes that have not reached the keys yet are rebuilt; a note the player is already meant to be holding is skipped.
 
         Parameters
         ----------
-        dt : float
-            The delta time.
-        note : int
-            The note number.
-        velocity : int
-            The velocity of the note.
+        song_time : float
+            The song time to jump to, in seconds.
+        """
+        if self.note_dispatcher is None:
+            return
+        
+        song_time = min(max(song_time, 0.0), self.note_dispatcher.end_time)
+        
+        self.note_highway.clear()
+        self.keyboard.reset_timing()
+        
+        #Release anything autoplay was holding.
+        if self.testing_autoplay == True:
+            for note in (np.flatnonzero(self.keyboard.pressed) + LOWEST_NOTE).tolist():
+                self.outport.send(mido.Message('note_off', note=note))
+                self.unhighlight_key(note)
+                self.keyboard.pressed[note - LOWEST_NOTE] = False
+        
+        #A jump also ends a Practice mode pause.
+        if self.paused:
+            self.song_clock.resume()
+            self.paused = False
+        
+        self.song_clock.seek(song_time, at_ns=self.game_clock.frame_ns)
+        self.note_dispatcher.seek(song_time + self.spawn_horizon)
+        self.song_time = song_time
+        self.game_over = False
+        
+        # Seconds a rectangle takes to fall from the top of the window to the keys.
+        fall_time = (self.window.height - self.white_key_height) / self.fall_speed
+        
+        for onset, note, velocity, duration, player in self.note_dispatcher.window(song_time - fall_time, song_time + self.spawn_horizon):
+            self.spawn_note(onset, note, velocity, duration, player)
+    
+    def set_loop_marker(self, marker):
         """
-        self.flag_note(note, False)
+        Set a Practice loop marker at the current song time. Once both are set, the song loops between them
+        (see update_rectangles); setting A after B, or B before A, clears the other marker.
 
+        Parameters
+        ----------
+        marker : str
+            'A' for the start of the loop, 'B' for the end.
+        """
+        if marker == 'A':
+            self.loop_start = self.song_time
+            if self.loop_end is not None and self.loop_end <= self.loop_start:
+                self.loop_end = None
+        else:
+            if self.song_time <= self.loop_start:
+                print("Loop end must come after the loop start.")
+                return
+            self.loop_end = self.song_time
+            
+        print(f"Loop: {self.loop_start:.2f}s - {'end' if self.loop_end is None else f'{self.loop_end:.2f}s'}")
+    
     # Function to update the falling rectangles
     def update_rectangles(self, dt):
         """
         Update the falling rectangles.
-        This function is called every frame to update the falling rectangles.
+        This function is called every display frame. It runs as many fixed simulation steps (see simulation_step)
+        as it takes to catch up with the song time, then places every rectangle for drawing by interpolating
+        between its last two simulated positions.
+        Because each step is always 1/simulation_rate seconds, a slow frame can't make a rectangle jump past a hit window.
+        A frame runs at most max_steps_per_frame steps. After a longer stall (a window drag, a resume from sleep) the
+        song clock is moved back to where the steps stopped, so the game never spends frames catching up.
+
+        Parameters
+        ----------
+        dt : float
+            The delta time.
+        """
+        
+        frame_start = time.perf_counter_ns()
+        self.frame_stats.begin_frame(self.song_time)
+        
+        # Nothing moves while the song is paused (Practice mode waits for the missed note).
+        if self.song_clock.paused:
+            return
+        
+        # The whole frame is judged at the instant it began.
+        frame_ns = self.game_clock.begin_frame()
+        frame_time = self.song_clock.time_at(frame_ns)
+        
+        # Practice loop: once the song passes marker B, jump back to marker A.
+        if self.loop_end is not None and frame_time >= self.loop_end:
+            self.seek(self.loop_start)
+            frame_time = self.song_time
+        
+        step = 1 / self.simulation_rate
+        steps = 0
+        while self.song_time + step <= frame_time and not self.song_clock.paused:
+            if steps == self.max_steps_per_frame:
+                # Too far behind: drop the rest of the stall rather than running hundreds of steps in one frame.
+                self.song_clock.seek(self.song_time, at_ns=frame_ns)
+                frame_time = self.song_time
+                break
+            self.simulation_step(step)
+            steps += 1
+        
+        # How far the song time is between the last step and the next one.
+        alpha = min(max((frame_time - self.song_time) / step, 0.0), 1.0)
+        self.note_highway.update_vertices(alpha)
+        
+        self.frame_stats.add('simulation', time.perf_counter_ns() - frame_start)
+    
+    def simulation_step(self, dt):
+        """
+        Advance the game by one fixed step of song time.
+        Moves the rectangles (their simulated sim_y and sim_height; update_rectangles draws them), judges hits,
+        runs autoplay and Practice mode, and makes rectangles for upcoming notes.
         Most of the logic for the game is handled here.
         A deep understanding of the game logic is recommended before making changes here.
 
+        Every rectangle falls in one vectorized step over the note highway's arrays. Only the rectangles close to the keys
+        (where timing is judged and notes are played) go through the per-note logic below, in the order they were made,
+        so the cost of a step does not grow with the number of notes still falling.
+
         Parameters
         ----------
         dt : float
-            The delta time.
+            The length of the step in seconds of song time.
         """
+        self.song_time += dt
         
         cleanup_list = []
 
-        move_speed = 150  # Speed of the falling rectangles
-        for rectangle in (self.falling_rectangles_list):
-            
-           # print("Top of this rectangle is: ", rectangle.y + rectangle.height, " and the note number is: ", rectangle.note_number)
-           # print("Bottom of this rectangle is: ", rectangle.y)
-            
-            
-            if rectangle.lock is False:
-                rectangle.height += move_speed * dt
+        if self.note_dispatcher is not None:
+            if not self.game_over and self.song_time >= self.note_dispatcher.end_time + self.end_buffer_time:
+                self.end_of_song(dt)
 
-            if rectangle.y >= self.white_key_height:
-                rectangle.y -= move_speed * dt
+        move_speed = self.fall_speed
+        highway = self.note_highway
+        slots = highway.active_slots()
+        
+        # Remember where the rectangles were, for drawing in between steps.
+        highway.previous_y[slots] = highway.sim_y[slots]
+        highway.previous_height[slots] = highway.sim_height[slots]
+        
+        falling = slots[highway.sim_y[slots] >= self.white_key_height]
+        highway.sim_y[falling] -= move_speed * dt
+        
+        # Nothing else happens to a rectangle until it comes within 70 pixels of the keys.
+        near_keys = slots[(highway.sim_y[slots] <= self.white_key_height + 70) | (highway.sim_height[slots] == 1)]
+        
+        for slot in near_keys.tolist():
+            note_number = int(highway.note_number[slot])
+            key = note_number - LOWEST_NOTE
+            sim_y = highway.sim_y[slot]
 
-            if rectangle.y <= self.white_key_height + 70 and rectangle.y > self.white_key_height + 20 and self.incoming_notes[rectangle.note_number]['note_timing'] != 2:
+            if sim_y <= self.white_key_height + 70 and sim_y > self.white_key_height + 20 and self.keyboard.timing[key] != 2:
                 # we need to flag this note as 'close' to the line segment
-                self.incoming_notes[rectangle.note_number]['note_timing'] = 1
+                self.keyboard.timing[key] = 1
 
-            elif rectangle.y <= self.white_key_height + 20 and rectangle.y >= self.white_key_height - 20:
-                self.incoming_notes[rectangle.note_number]['note_timing'] = 2
+            elif sim_y <= self.white_key_height + 20 and sim_y >= self.white_key_height - 20:
+                self.keyboard.timing[key] = 2
                 
-            if rectangle.height == 1:
+            if highway.sim_height[slot] == 1:
                 """THIS WAS A TEST! REMOVE THIS LATER!"""
                 # please see this comment ^ !!
                 # !
-                rectangle.color = (0, 255, 0)
-                cleanup_list.append(rectangle)
+                highway.set_color(slot, (0, 255, 0))
+                cleanup_list.append(slot)
 
-            if rectangle.y <= self.white_key_height and rectangle.played == True:
+            if sim_y <= self.white_key_height and highway.played[slot] == True:
             
-                diff = self.white_key_height - rectangle.y
-                rectangle.height -= diff
-                rectangle.negative_y += diff
-                rectangle.y = self.white_key_height
+                diff = self.white_key_height - sim_y
+                highway.sim_height[slot] -= diff
+                highway.negative_y[slot] += diff
+                highway.sim_y[slot] = self.white_key_height
     
-                if rectangle.height > 0 and rectangle.negative_y > 20:
-                    self.incoming_notes[rectangle.note_number]['note_timing'] = 1
+                if highway.sim_height[slot] > 0 and highway.negative_y[slot] > 20:
+                    self.keyboard.timing[key] = 1
 
                 #Setup for next rectangle being played...
-                if rectangle.height <= 0:
-                    rectangle.height = 0
-                    self.incoming_notes[rectangle.note_number]['note_timing'] = 0
-                    self.incoming_notes[rectangle.note_number]['note_played'] = 0
+                if highway.sim_height[slot] <= 0:
+                    highway.sim_height[slot] = 0
+                    self.keyboard.timing[key] = 0
                     
-                    if self.testing_autoplay == True and rectangle.note_off == False and self.playing_notes[rectangle.note_number] == True:
+                    if self.testing_autoplay == True and highway.note_off[slot] == False and self.keyboard.pressed[key] == True:
                         
                         if self.half_autoplay == True: #If half autoplay we only gonna autoplay the player2 notes...
-                            if rectangle.color == self.player2_white_color or rectangle.color == self.player2_black_color or rectangle.color == self.player2_white_color + (255,) or rectangle.color == self.player2_black_color + (255,):
-                                rectangle.note_off = True
-                                off_message = mido.Message('note_off', note= rectangle.note_number)
+                            if highway.player[slot] == 2:
+                                highway.note_off[slot] = True
+                                off_message = mido.Message('note_off', note= note_number)
                                 self.outport.send(off_message)
-                                self.playing_notes[rectangle.note_number] = False
-                                self.unhighlight_key(rectangle.note_number)
+                                self.keyboard.pressed[key] = False
+                                self.unhighlight_key(note_number)
                         else: #Else we gonna autoplay all the notes!
-                            rectangle.note_off = True
-                            off_message = mido.Message('note_off', note= rectangle.note_number)
+                            highway.note_off[slot] = True
+                            off_message = mido.Message('note_off', note= note_number)
                             self.outport.send(off_message)
-                            self.playing_notes[rectangle.note_number] = False
-                            self.unhighlight_key(rectangle.note_number)
+                            self.keyboard.pressed[key] = False
+                            self.unhighlight_key(note_number)
                         
-                    cleanup_list.append(rectangle)
+                    cleanup_list.append(slot)
 
-            elif rectangle.y <= self.white_key_height and rectangle.played == False:
+            elif sim_y <= self.white_key_height and highway.played[slot] == False:
                 
-                diff = self.white_key_height - rectangle.y
-                rectangle.height -= diff
-                rectangle.y = self.white_key_height
-                rectangle.negative_y += diff
+                diff = self.white_key_height - sim_y
+                highway.sim_height[slot] -= diff
+                highway.sim_y[slot] = self.white_key_height
+                highway.negative_y[slot] += diff
                 
-                if rectangle.height < 0:
+                if highway.sim_height[slot] < 0:
                     #Catch this visual error?
-                    rectangle.height = 0
+                    highway.sim_height[slot] = 0
             
-                if self.playing_notes[rectangle.note_number] == False:
+                if self.keyboard.pressed[key] == False:
                     
-                    rectangle.played = True
+                    highway.played[slot] = True
                     if self.testing_autoplay == True:
                         if self.half_autoplay == True:
-                            if rectangle.color == self.player2_white_color or rectangle.color == self.player2_black_color or rectangle.color == self.player2_white_color + (255,) or rectangle.color == self.player2_black_color + (255,):
-                                on_message = mido.Message('note_on', note= rectangle.note_number)
+                            if highway.player[slot] == 2:
+                                on_message = mido.Message('note_on', note= note_number)
                                 self.outport.send(on_message)
-                                self.highlight_key(rectangle.note_number)
-                                self.playing_notes[rectangle.note_number] = True
+                                self.highlight_key(note_number)
+                                self.keyboard.pressed[key] = True
                                 continue
                         else: 
-                            on_message = mido.Message('note_on', note= rectangle.note_number)
+                            on_message = mido.Message('note_on', note= note_number)
                             self.outport.send(on_message)
-                            self.highlight_key(rectangle.note_number)
-                            self.playing_notes[rectangle.note_number] = True
+                            self.highlight_key(note_number)
+                            self.keyboard.pressed[key] = True
                             continue
     
 
                 """LOGIC FOR PRACTICE GAME MODE"""
                 if self.game_mode == "Practice":
-                    (key_in_question, note_number) = self.all_midi_keys[rectangle.note_number - 21]
+                    key_color = self.keyboard.key_color(note_number)
                     #print key in question color
-                    #print("Key in question color is: ", key_in_question.color)
+                    #print("Key in question color is: ", key_color)
                     #print("The colors we are checking for are: ", self.okay_color_white, self.okay_color_black, self.perfect_color_white, self.perfect_color_black)
-                    if key_in_question.color in (self.okay_color_white, self.okay_color_white + (255,),
+                    if key_color in (self.okay_color_white, self.okay_color_white + (255,),
                                                  self.okay_color_black, self.okay_color_black +  (255,),
                                                  self.perfect_color_white, self.perfect_color_white +  (255,),
                                                  self.perfect_color_black, self.perfect_color_black +  (255,)
@@ -1126,13 +1092,17 @@ class PianoGameUI(pyglet.event.EventDispatcher):
                     else:
                         print("You didn't play the right note!")
                         self.pausenote = note_number
-                        self.clock_pause_manager.pause()
+                        self.song_clock.pause(at_ns=self.game_clock.frame_ns)
                         self.paused = True
                                         
-        for rectangle in cleanup_list:
-            self.falling_rectangles_list.remove(rectangle)
-            rectangle.delete()
-            del rectangle
+        for slot in cleanup_list:
+            highway.release(slot)
+        
+        # Make rectangles for the notes coming up within the spawn horizon. They start above the window and fall into view
+        # at their onset, so only what is on screen or about to be exists, however long the song is.
+        if self.note_dispatcher is not None:
+            for onset, note, velocity, duration, player in self.note_dispatcher.due(self.song_time + self.spawn_horizon):
+                self.spawn_note(onset, note, velocity, duration, player)
               
     # Method for handling mouse press to quit the game... can also use backspace but this is more intuitive.
     def on_mouse_press(self, x, y, button, modifiers):
@@ -1170,27 +1140,27 @@ class PianoGameUI(pyglet.event.EventDispatcher):
 
         self.threads = []
 
-        self.clock_pause_manager.clear()
+        pyglet.clock.unschedule(self.update_rectangles)
+        pyglet.clock.unschedule(self.update_frame_stats_overlay)
         
         if self.outport is not None:
             self.outport.reset()
             self.outport.close()
 
         self.active_notes = {note: False for note in range(21, 109)}
-        self.playing_notes = {note: False for note in range(21, 109)}
-        self.incoming_notes = {note: {'note_timing': 0, 'note_played': 0} for note in range(21, 109)}
+        self.keyboard.reset()
 
-        for rectangle in self.falling_rectangles_list:
-            rectangle.delete()
-        self.falling_rectangles_list.clear()
+        print(f"Note highway: {self.note_highway.stats()}")
+        self.note_highway.delete()
+        self.keyboard_layer.delete()
 
         # Reinitialize batches to reset graphics
         self.white_keys_batch = pyglet.graphics.Batch()
         self.black_keys_batch = pyglet.graphics.Batch()
         self.game_elements_batch = pyglet.graphics.Batch()
         self.rectangles_batch = pyglet.graphics.Batch()
+        self.note_highway = NoteHighway(self.rectangles_batch)
 
-        self.active_note_events.clear()
         self.score = 0
 
         self.window.remove_handlers(on_draw=self.on_draw, on_key_press=self.on_key_press)
@@ -1224,23 +1194,111 @@ class PianoGameUI(pyglet.event.EventDispatcher):
         if symbol == pyglet.window.key.B:
             print("B pressed")
         
-        """
-        if symbol == pyglet.window.key.P:
-            print("P pressed")
-            
-            if not self.clock_pause_manager.paused:
-                self.clock_pause_manager.pause()
+        #SLOW DOWN / SPEED UP THE SONG (- and =)
+        #Practice mode only: a slower song is easier to score on, and holds last longer.
+        if self.game_mode == "Practice":
+            if symbol == pyglet.window.key.MINUS:
+                self.change_playback_rate(-1)
                 
+            elif symbol == pyglet.window.key.EQUAL:
+                self.change_playback_rate(1)
+        
+        #SKIP BACK / FORWARD 5 SECONDS (LEFT and RIGHT), SET LOOP MARKERS A and B ([ and ]), CLEAR THE LOOP (\)
+        #Practice mode only: jumping back replays notes that have already been scored.
+        if self.game_mode == "Practice":
+            if symbol == pyglet.window.key.LEFT:
+                self.seek(self.song_time - 5)
                 
+            elif symbol == pyglet.window.key.RIGHT:
+                self.seek(self.song_time + 5)
                 
-            elif self.clock_pause_manager.paused:
-                self.clock_pause_manager.resume()
+            elif symbol == pyglet.window.key.BRACKETLEFT:
+                self.set_loop_marker('A')
                 
+            elif symbol == pyglet.window.key.BRACKETRIGHT:
+                self.set_loop_marker('B')
                 
+            elif symbol == pyglet.window.key.BACKSLASH:
+                self.loop_start, self.loop_end = 0.0, None
+                print("Loop cleared")
+        
+        #SHOW / HIDE THE FRAME TIMING OVERLAY (F3)
+        if symbol == pyglet.window.key.F3:
+            self.toggle_frame_stats()
+        
+        """
+        if symbol == pyglet.window.key.P:
+            print("P pressed")
+            
+            if not self.song_clock.paused:
+                self.song_clock.pause()
+                
+            elif self.song_clock.paused:
+                self.song_clock.resume()
              
-            print("total seconds played", datetime.datetime.now() - self.clock_pause_manager.start_time)  
+            print("total seconds played", self.song_clock.time)  
+        """
+        
+    
+    def change_playback_rate(self, steps):
+        """
+        Move the playback rate up or down through self.playback_rates.
+        Falling notes, autoplay and the end of the song all run on song time, so they follow the new rate straight away.
+
+        Parameters
+        ----------
+        steps : int
+            How many rates to move; negative slows the song down.
+        """
+        rates = self.playback_rates
+        current = min(range(len(rates)), key=lambda i: abs(rates[i] - self.song_clock.rate))
+        rate = rates[min(max(current + steps, 0), len(rates) - 1)]
+        
+        self.song_clock.set_rate(rate, at_ns=self.game_clock.now_ns())
+        print(f"Playback rate: {rate}x")
+    
+    def toggle_frame_stats(self):
+        """
+        Show or hide the frame timing overlay: p50/p95/p99/max of each frame stage and the slowest frames so far.
+        While it is showing, the frame timings are also exported at the end of the song.
         """
+        self.show_frame_stats = not self.show_frame_stats
         
+        if self.show_frame_stats:
+            self.update_frame_stats_overlay(0)
+            pyglet.clock.schedule_interval(self.update_frame_stats_overlay, 1/4)
+        else:
+            pyglet.clock.unschedule(self.update_frame_stats_overlay)
+    
+    def update_frame_stats_overlay(self, dt):
+        """
+        Refresh the frame timing overlay's text. Scheduled every 1/4 second while the overlay is showing,
+        so laying out the text does not itself cost time every frame.
+
+        Parameters
+        ----------
+        dt : float
+            The delta time.
+        """
+        label = self.frame_stats_label
+        label.text = self.frame_stats.overlay_text()
+        
+        background = self.frame_stats_background
+        background.x, background.y = label.x - 10, label.y - label.content_height - 10
+        background.width, background.height = label.content_width + 20, label.content_height + 20
+    
+    def export_frame_stats(self):
+        """
+        Write the frame timings to CSV and JSON files (see FrameStats.export), named after the song.
+        """
+        directory = self.frame_stats_dir if self.frame_stats_dir is not None else DEFAULT_EXPORT_DIR
+        name = os.path.splitext(os.path.basename(self.midi_file_path or "game"))[0]
+        
+        try:
+            csv_path, json_path = self.frame_stats.export(directory, name)
+            print(f"Frame timings written to {csv_path} and {json_path}")
+        except OSError as error:
+            print(f"Could not write frame timings: {error}")
     
     def update_score(self, dt):
         """
@@ -1251,17 +1309,19 @@ class PianoGameUI(pyglet.event.EventDispatcher):
         dt : float
             The delta time.
         """
+        score_start = time.perf_counter_ns()
         
-        for note in self.playing_notes:
-            if self.playing_notes[note] == True:
-                #Refresh highlight
-                
-                if self.incoming_notes[note]['note_timing'] == 0:
-                    self.highlight_key(note)
-                
-                if self.incoming_notes[note]['note_timing'] != 0:
-                    self.score += self.points_for_hold
+        keyboard = self.keyboard
+        
+        #Refresh the highlight of held keys with no note near them
+        for key in np.flatnonzero(keyboard.pressed & (keyboard.timing == 0)).tolist():
+            self.color_key(key + LOWEST_NOTE, 0)
+        
+        #Points for every held key with a note on it
+        self.score += self.points_for_hold * int(np.count_nonzero(keyboard.pressed & (keyboard.timing != 0)))
         self.score_label.text = f"{self.score}"
+        
+        self.frame_stats.add('score', time.perf_counter_ns() - score_start)
 
                 
     def jukebox_mode(self, midi_file_path):
@@ -1286,155 +1346,15 @@ class PianoGameUI(pyglet.event.EventDispatcher):
     
         if midi_file_path is not None and self.outport is not None:
         
-            song = mido.MidiFile(midi_file_path)
+            #Stream the song instead of loading it all at once, so even very long performances start right away.
+            song = MIDIStreamReader(midi_file_path)
+            song_metadata = get_song_metadata(midi_file_path)
+            chunks = (apply_song_metadata_to_events(chunk, song_metadata) for chunk in song)
             
-            for msg in song.play():
-                
-                #If the game is not active, stop playing the song! Error catching
-                if self.game_active == False:
-                    return
-            
-                #Else play  the song.
-                elif msg.type == "note_on" and msg.velocity != 0:
-                    self.highlight_key(msg.note)
-                    
-                elif msg.type == "note_off" or (msg.type == "note_on" and msg.velocity == 0):
-                    self.unhighlight_key(msg.note)
-                  
-                    
-                self.outport.send(msg)
-        
-            
-class ClockPauseManager():
-    """
-    ClockPauseManager is responsible for managing the clock and scheduled functions,
-    allowing pausing and resuming of the game. Mostly used for the Piano game in practice mode.
-    The implementation is based on the Pyglet clock and scheduling functions.
-    
-    This method is buggy and needs to be improved in future development!
-
-    Attributes
-    ----------
-    scheduled_functions : list
-        List of scheduled functions.
-    start_time : datetime.datetime
-        The start time of the game.
-    update_rectangles : callable
-        Method to update rectangles.
-    paused : bool
-        Flag indicating if the game is paused.
-    pause_time : datetime.datetime
-        The time when the game was paused.
-    unpause_time : datetime.datetime
-        The time when the game was unpaused.
-    """
-    
-    def __init__(self, update_rectangles):
-        """
-        Initialize the ClockPauseManager.
-
-        Parameters
-        ----------
-        update_rectangles : callable
-            Method to update rectangles.
-        """
-        self.scheduled_functions = []
-        self.start_time = datetime.datetime.now()
-        self.update_rectangles = update_rectangles
-        self.paused = False
-        self.pause_time = 0
-        self.unpause_time = 0
-
-
-
-    def schedule_function(self, func, delay):
-        """
-        Schedule a function with a delay.
-
-        Parameters
-        ----------
-        func : callable
-            The function to be scheduled.
-        delay : float
-            The delay in seconds.
-        """
-        #print(f"Scheduling function {func} with delay {delay}")
-       
-        scheduled_funcID = pyglet.clock.schedule_once(func, delay)
-        self.scheduled_functions.append((func, delay, scheduled_funcID))
-        
-    def pause(self):
-        """
-        Pause the clock and all scheduled functions.
-        """
-        
-        if not self.paused:
-            for func, _, _ in self.scheduled_functions:
-                pyglet.clock.unschedule(func)
-            pyglet.clock.unschedule(self.update_rectangles)
-            self.paused = True
-            self.pause_time = datetime.datetime.now()
-
-
-            
-            
-    def resume(self):
-        """
-        Resume the clock and all scheduled functions with adjusted intervals.
-        """
-        
-        seconds_before_pause = self.pause_time - self.start_time
-        seconds_before_pause = seconds_before_pause.total_seconds()
-        pyglet.clock.schedule_interval(self.update_rectangles, 1/60.0)
-
-        new_scheduled_functions = []
-        
-        temp_counter = 0
-        
-        if self.paused:
-            self.paused = False
-
-            for i, (func, delay, scheduled_funcID) in enumerate(self.scheduled_functions):
-                
-                # Reschedule with the remaining time 
-                #print(f"Rescheduling function {func} with delay {delay} and time difference {seconds_before_pause}")
-                remaining_delay = delay - seconds_before_pause
-            
-                if remaining_delay >= 0:
-                    # If there's remaining delay, reschedule the function
-                    pyglet.clock.schedule_once(func, remaining_delay)
-                    # Add the adjusted function back into the new list
-                    new_scheduled_functions.append((func, remaining_delay, scheduled_funcID))
-                    
-                    if temp_counter <= 1:
-                        """  
-                        print(f"Rescheduling function {func}({temp_counter}) with delay {remaining_delay}")
-                        print(f"Original delay: {delay}")
-                        print(f"Start time was: {self.start_time.time()} and pause time was: {self.pause_time.time()}")
-                        print(f"Time difference: {seconds_before_pause}")
-                        print(f"New delay: {remaining_delay}")
-                        print("The current time is: ", datetime.datetime.now().time())
-                        print("-------------------")
-                        """
-                        temp_counter += 1
-                    
-                else:
-                    # Log or handle the case where the function's scheduled time has passed
-                    #print(f"Skipping rescheduling of {func} due to elapsed delay.")
-                    pass
-
-            # Replace the original scheduled functions list with the new, adjusted list
-            self.scheduled_functions = new_scheduled_functions
-
-            # Reset the start time and unpause
-            self.start_time = datetime.datetime.now()
-
-    def clear(self):    
-        """
-        Clear all scheduled functions and reset the pause state.
-        """
-        for func, _, _ in self.scheduled_functions:
-            pyglet.clock.unschedule(func)
-        pyglet.clock.unschedule(self.update_rectangles)        
-        self.scheduled_functions = []
-        self.paused = False
+            try:
+                #Play the song, lighting up each key as it is played. Stops if the game is no longer active.
+                play_event_stream(chunks, self.outport, now_ns=self.game_clock.now_ns,
+                                  on_note_on=self.highlight_key, on_note_off=self.unhighlight_key,
+                                  stopped=lambda: not self.game_active)
+            finally:
+                song.close()
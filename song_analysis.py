@@ -0,0 +1,255 @@
+"""
+song_analysis.py
+=====================
+
+This file computes playing features from compiled note timelines (see MIDIProcessor.compile_timeline)
+and derives song metadata from them: a difficulty tier, whether the song suits two players, and whether it
+suits Practice mode. New songs can then be added to the song database without hand-tuning.
+
+Songs are analyzed as they are played, with their song_metadata.csv settings applied (a song slowed down there is
+classified at its slower speed). Every feature is computed with vectorized NumPy over the whole timeline. Results are
+cached per file (keyed like the song cache, by file contents, plus the song's settings) in the song cache directory,
+and songs that are not cached yet are analyzed in parallel, so the menu only pays for songs it has never seen.
+
+Functions:
+    analyze_timeline
+    classify_song
+    analyze_song_library
+    annotate_song_database
+
+Authors: Devin Martin and Wesley Jake Anding
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from song_cache import SongCache, DEFAULT_CACHE_DIR
+from song_metadata import get_song_metadata, apply_song_metadata
+
+# Bump this whenever the features or classification change, so cached analyses are recomputed.
+ANALYSIS_VERSION = 1
+ANALYSIS_FILENAME = 'analysis.json'
+
+CHORD_WINDOW_SECONDS = 0.05  # Notes in one track starting this close together are played as one chord
+
+# Used for songs that could not be analyzed (e.g. the file is missing).
+FALLBACK_METADATA = {"difficulty": "Challenge", "players": 1, "practice": False}
+
+
+def analyze_timeline(timeline):
+    """
+    Computes playing features from a compiled timeline.
+
+    Parameters
+    ----------
+    timeline : numpy.ndarray
+        The compiled timeline (dtype NOTE_DTYPE).
+
+    Returns
+    -------
+    dict
+        notes_per_second : float
+            Average note density over the song.
+        peak_polyphony : int
+            The most notes sounding at once.
+        pitch_range : int
+            Semitones between the lowest and highest note.
+        hand_span : int
+            Semitones spanned by the widest chord within a single track.
+        track_count : int
+            Number of tracks that contain notes.
+    """
+    if len(timeline) == 0:
+        return {"notes_per_second": 0.0, "peak_polyphony": 0, "pitch_range": 0, "hand_span": 0, "track_count": 0}
+
+    onsets = timeline['onset_seconds']
+    offsets = onsets + timeline['duration_seconds']
+    notes = timeline['note'].astype(np.int16)
+    tracks = timeline['track']
+
+    # Polyphony: +1 at every onset, -1 at every offset. Offsets sort first at equal times,
+    # so back-to-back notes are not counted as overlapping.
+    times = np.concatenate((onsets, offsets))
+    steps = np.concatenate((np.ones(len(onsets), dtype=np.int32), -np.ones(len(offsets), dtype=np.int32)))
+    order = np.lexsort((steps, times))
+    peak_polyphony = int(np.cumsum(steps[order]).max())
+
+    # Hand span: group each track's notes into chords by onset, then take the widest chord.
+    order = np.lexsort((onsets, tracks))
+    sorted_onsets, sorted_notes, sorted_tracks = onsets[order], notes[order], tracks[order]
+    new_chord = np.ones(len(order), dtype=bool)
+    new_chord[1:] = (np.diff(sorted_onsets) > CHORD_WINDOW_SECONDS) | (np.diff(sorted_tracks) != 0)
+    chord_starts = np.flatnonzero(new_chord)
+    hand_span = int(np.max(np.maximum.reduceat(sorted_notes, chord_starts) - np.minimum.reduceat(sorted_notes, chord_starts)))
+
+    duration = float(offsets.max())
+    return {
+        "notes_per_second": len(timeline) / duration if duration > 0 else 0.0,
+        "peak_polyphony": peak_polyphony,
+        "pitch_range": int(notes.max() - notes.min()),
+        "hand_span": hand_span,
+        "track_count": int(len(np.unique(tracks))),
+    }
+
+
+def classify_song(features):
+    """
+    Derives song metadata from its features.
+
+    Parameters
+    ----------
+    features : dict
+        Features from analyze_timeline.
+
+    Returns
+    -------
+    dict
+        difficulty : str
+            'Easy', 'Challenge' or 'Impossible'.
+        players : int
+            2 if the song has a separate track for each player, else 1.
+        practice : bool
+            Whether the song is slow and sparse enough for Practice mode, which pauses on every missed note.
+    """
+    notes_per_second = features["notes_per_second"]
+    peak_polyphony = features["peak_polyphony"]
+
+    if notes_per_second < 2.5 and peak_polyphony <= 2:
+        difficulty = "Easy"
+    elif notes_per_second >= 7 or peak_polyphony >= 8 or features["hand_span"] > 14:
+        difficulty = "Impossible"
+    else:
+        difficulty = "Challenge"
+
+    return {
+        "difficulty": difficulty,
+        "players": 2 if features["track_count"] >= 2 else 1,
+        "practice": difficulty == "Easy",
+    }
+
+
+def _analyze_file(file_path, cache_dir):
+    """
+    Analyzes one song as it is played, i.e. after its song_metadata.csv settings (time scale, transposition) are applied.
+    Runs in a worker process.
+
+    Parameters
+    ----------
+    file_path : str
+        The path to the MIDI file.
+    cache_dir : str
+        The song cache directory.
+
+    Returns
+    -------
+    dict
+        The song's features and metadata, or {"error": message} if it could not be analyzed.
+    """
+    try:
+        timeline = SongCache(cache_dir, max_bytes=None).get_timeline(file_path)
+        timeline = apply_song_metadata(timeline, get_song_metadata(file_path))
+        features = analyze_timeline(timeline)
+        return {**features, **classify_song(features)}
+    except Exception as error:
+        return {"error": f"{type(error).__name__}: {error}"}
+
+
+def _metadata_key(file_path):
+    """
+    Returns a short hash of a song's song_metadata.csv settings, so changing them invalidates its cached analysis.
+    """
+    settings = json.dumps(get_song_metadata(file_path), sort_keys=True)
+    return hashlib.sha1(settings.encode('utf-8')).hexdigest()[:12]
+
+
+def analyze_song_library(song_files, cache_dir=DEFAULT_CACHE_DIR, workers=None):
+    """
+    Analyzes every song, reusing cached results and analyzing the rest in parallel.
+    If the worker processes fail, the rest are analyzed one by one in this process instead.
+
+    Parameters
+    ----------
+    song_files : list of str
+        Paths to the MIDI files.
+    cache_dir : str, optional
+        The song cache directory, which also holds the analysis cache (default is .song_cache).
+    workers : int, optional
+        Number of worker processes (default is one per CPU).
+
+    Returns
+    -------
+    dict
+        Analysis (features and metadata) keyed by file path. Files that could not be analyzed map to {"error": message}.
+    """
+    song_cache = SongCache(cache_dir)
+    analysis_path = os.path.join(cache_dir, ANALYSIS_FILENAME)
+
+    try:
+        with open(analysis_path, 'r', encoding='utf-8') as analysis_file:
+            cached = json.load(analysis_file)
+    except (FileNotFoundError, ValueError):
+        cached = {}
+
+    results = {}
+    keys = {}
+    missing = []
+    for file_path in song_files:
+        try:
+            keys[file_path] = f"{song_cache.key_for(file_path)}-a{ANALYSIS_VERSION}-{_metadata_key(file_path)}"
+        except OSError as error:
+            results[file_path] = {"error": f"{type(error).__name__}: {error}"}
+            continue
+
+        if keys[file_path] in cached:
+            results[file_path] = cached[keys[file_path]]
+        else:
+            missing.append(file_path)
+
+    if missing:
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                analyses = list(executor.map(_analyze_file, missing, [cache_dir] * len(missing)))
+        except BrokenProcessPool as error:
+            # A worker died, e.g. it could not import the main module. Slower, but the menu still starts.
+            print(f"Song analysis workers failed ({error}); analyzing {len(missing)} songs in this process.")
+            analyses = [_analyze_file(file_path, cache_dir) for file_path in missing]
+
+        for file_path, analysis in zip(missing, analyses):
+            results[file_path] = analysis
+            if "error" not in analysis:
+                cached[keys[file_path]] = analysis
+
+        temp_path = f"{analysis_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as analysis_file:
+            json.dump(cached, analysis_file, indent=1, sort_keys=True)
+        os.replace(temp_path, analysis_path)
+
+    return results
+
+
+def annotate_song_database(song_database, workers=None):
+    """
+    Fills in "difficulty", "players" and "practice" for every entry in a song database from song analysis.
+    Values already written in an entry are kept, so they act as hand-picked overrides.
+
+    Parameters
+    ----------
+    song_database : dict
+        Song entries with at least a "file" key; paths are relative to the current directory. Updated in place.
+    workers : int, optional
+        Number of worker processes for songs that have not been analyzed before (default is one per CPU).
+    """
+    song_files = sorted({song_info["file"] for song_info in song_database.values()})
+    analyses = analyze_song_library(song_files, workers=workers)
+
+    for song_info in song_database.values():
+        analysis = analyses.get(song_info["file"], {})
+        if "error" in analysis:
+            print(f"Could not analyze {song_info['file']}: {analysis['error']}")
+            analysis = FALLBACK_METADATA
+
+        for field in FALLBACK_METADATA:
+            song_info.setdefault(field, analysis[field])
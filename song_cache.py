@@ -0,0 +1,408 @@
+"""
+song_cache.py
+=====================
+
+This file provides an on-disk cache of compiled note timelines (see MIDIProcessor.compile_timeline).
+Songs that have been played before are loaded straight from a memory-mapped .npy file instead of being
+re-read and re-parsed with mido.
+
+Entries are keyed by a hash of the MIDI file's contents plus the processor version, so editing a song
+or changing how songs are compiled never serves a stale timeline. The cache is bounded in size; when it
+grows too large the least recently used entries are evicted.
+
+The whole song library can be compiled into the cache ahead of time, in parallel, with
+build_song_library (or `python -m midi_processor build`), which also writes an index.json of song metadata.
+
+Classes:
+    SongCache
+
+Functions:
+    find_song_files
+    load_index
+    build_song_library
+
+Authors: Devin Martin and Wesley Jake Anding
+"""
+
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from midi_processor import MIDIProcessor, PROCESSOR_VERSION
+
+# Cache lives next to the source, regardless of which directory the game is run from.
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_DIR = os.path.join(PROJECT_DIR, '.song_cache')
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  # 256 MB
+INDEX_FILENAME = 'index.json'
+MIDI_EXTENSIONS = ('.mid', '.midi')
+
+
+class SongCache():
+    """
+    A size-bounded LRU cache of compiled note timelines stored as .npy files.
+
+    Attributes
+    ----------
+    cache_dir : str
+        The directory the cache entries are stored in.
+    max_bytes : int or None
+        The maximum total size of the cache entries before eviction, or None for no limit.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Initializes the SongCache, creating the cache directory if needed.
+
+        Parameters
+        ----------
+        cache_dir : str, optional
+            The directory to store cache entries in (default is .song_cache next to this file).
+        max_bytes : int or None, optional
+            The maximum total size of the cache in bytes, or None for no limit (default is 256 MB).
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._hashes = {}  # (path, size, mtime) -> content hash, so an unchanged file is only hashed once per run
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key_for(self, file_path):
+        """
+        Computes the cache key for a MIDI file from its contents and the processor version.
+
+        Parameters
+        ----------
+        file_path : str
+            The path to the MIDI file.
+
+        Returns
+        -------
+        str
+            The cache key.
+        """
+        stat = os.stat(file_path)
+        stat_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+
+        if stat_key not in self._hashes:
+            with open(file_path, 'rb') as midi_file:
+                self._hashes[stat_key] = hashlib.sha1(midi_file.read()).hexdigest()
+
+        return f"{self._hashes[stat_key]}-v{PROCESSOR_VERSION}"
+
+    def entry_path(self, key):
+        """
+        Returns the path of the .npy file for a cache key.
+
+        Parameters
+        ----------
+        key : str
+            The cache key.
+
+        Returns
+        -------
+        str
+            The path of the cache entry.
+        """
+        return os.path.join(self.cache_dir, key + '.npy')
+
+    def load(self, key):
+        """
+        Loads a cached timeline with memory mapping, marking it as recently used.
+
+        Parameters
+        ----------
+        key : str
+            The cache key.
+
+        Returns
+        -------
+        numpy.ndarray or None
+            The read-only, memory-mapped timeline, or None if it is not cached.
+        """
+        path = self.entry_path(key)
+        try:
+            timeline = np.load(path, mmap_mode='r')
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+
+        os.utime(path)  # Modification time doubles as the last-used time for LRU eviction.
+        return timeline
+
+    def store(self, key, timeline):
+        """
+        Writes a timeline to the cache, then evicts old entries if the cache is too large.
+
+        Parameters
+        ----------
+        key : str
+            The cache key.
+        timeline : numpy.ndarray
+            The compiled timeline to store.
+        """
+        path = self.entry_path(key)
+
+        # Write to a temporary file first, so a crash or a second writer never leaves a half-written entry.
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as cache_file:
+            np.save(cache_file, timeline)
+        os.replace(temp_path, path)
+
+        self.evict(keep=key)
+
+    def get_timeline(self, file_path):
+        """
+        Returns the compiled timeline for a MIDI file, from the cache if possible.
+        On a miss the file is parsed with MIDIProcessor and the result is cached for next time.
+
+        Parameters
+        ----------
+        file_path : str
+            The path to the MIDI file.
+
+        Returns
+        -------
+        numpy.ndarray
+            The compiled timeline (dtype NOTE_DTYPE).
+        """
+        key = self.key_for(file_path)
+
+        timeline = self.load(key)
+        if timeline is not None:
+            return timeline
+
+        timeline = MIDIProcessor(file_path).compile_timeline()
+        self.store(key, timeline)
+        return timeline
+
+    def entries(self):
+        """
+        Lists the cache entries from least to most recently used.
+
+        Returns
+        -------
+        list
+            A list of (path, size in bytes) tuples.
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npy'):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue  # Removed since listdir, e.g. by another process.
+                entries.append((stat.st_mtime_ns, path, stat.st_size))
+
+        return [(path, size) for _, path, size in sorted(entries)]
+
+    def evict(self, keep=None):
+        """
+        Removes the least recently used entries until the cache fits within max_bytes.
+        Entries that can't be removed (on Windows, a file that is still memory-mapped, e.g. the song being played)
+        are skipped, so the cache may stay over max_bytes until a later eviction.
+
+        Parameters
+        ----------
+        keep : str, optional
+            A cache key that must not be evicted, e.g. the entry that was just stored.
+        """
+        if self.max_bytes is None:
+            return
+
+        entries = self.entries()
+        total_bytes = sum(size for _, size in entries)
+        keep_path = self.entry_path(keep) if keep is not None else None
+
+        for path, size in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            if path == keep_path:
+                continue
+            if _remove_entry(path):
+                total_bytes -= size
+
+    def clear(self):
+        """
+        Removes every entry from the cache, except those that can't be removed (see evict).
+        """
+        for path, _ in self.entries():
+            _remove_entry(path)
+
+
+def _remove_entry(path):
+    """
+    Removes a cache entry file. Returns True if it is gone, False if it could not be removed.
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass  # Already removed, e.g. by another process.
+    except OSError:
+        return False
+    return True
+
+
+def find_song_files(paths):
+    """
+    Finds every MIDI file in the given files and directories (searched recursively).
+
+    Parameters
+    ----------
+    paths : list of str
+        Files and directories to search.
+
+    Returns
+    -------
+    list
+        Sorted list of MIDI file paths.
+    """
+    song_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, filenames in os.walk(path):
+                song_files.extend(os.path.join(directory, name) for name in filenames if name.lower().endswith(MIDI_EXTENSIONS))
+        else:
+            song_files.append(path)
+
+    return sorted(song_files)
+
+
+def load_index(cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Loads the song index written by build_song_library.
+
+    Parameters
+    ----------
+    cache_dir : str, optional
+        The cache directory (default is .song_cache next to this file).
+
+    Returns
+    -------
+    dict
+        Song metadata keyed by path relative to the project directory, or an empty dict if there is no index.
+    """
+    try:
+        with open(os.path.join(cache_dir, INDEX_FILENAME), 'r', encoding='utf-8') as index_file:
+            return json.load(index_file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _timeline_metadata(timeline):
+    """
+    Summarizes a compiled timeline for the song index.
+
+    Parameters
+    ----------
+    timeline : numpy.ndarray
+        The compiled timeline (dtype NOTE_DTYPE).
+
+    Returns
+    -------
+    dict
+        Duration, note count, lowest and highest note, and the notes per track.
+    """
+    if len(timeline) == 0:
+        return {"duration_seconds": 0.0, "note_count": 0, "lowest_note": None, "highest_note": None, "track_note_counts": {}}
+
+    tracks, counts = np.unique(timeline['track'], return_counts=True)
+    return {
+        "duration_seconds": float(np.max(timeline['onset_seconds'] + timeline['duration_seconds'])),
+        "note_count": int(len(timeline)),
+        "lowest_note": int(timeline['note'].min()),
+        "highest_note": int(timeline['note'].max()),
+        "track_note_counts": {str(track): int(count) for track, count in zip(tracks.tolist(), counts.tolist())},
+    }
+
+
+def _build_entry(file_path, cache_dir):
+    """
+    Compiles one song into the cache and extracts its metadata. Runs in a worker process.
+    Any error is returned instead of raised, so one corrupt file can't stop a library build.
+
+    Parameters
+    ----------
+    file_path : str
+        The path to the MIDI file.
+    cache_dir : str
+        The cache directory.
+
+    Returns
+    -------
+    dict
+        The song's metadata, or {"error": message} if it could not be compiled.
+    """
+    try:
+        # Eviction is left to the parent process once every worker has finished.
+        song_cache = SongCache(cache_dir, max_bytes=None)
+        timeline = song_cache.get_timeline(file_path)
+        metadata = _timeline_metadata(timeline)
+        metadata["key"] = song_cache.key_for(file_path)
+        return metadata
+    except Exception as error:
+        return {"error": f"{type(error).__name__}: {error}"}
+
+
+def build_song_library(paths, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, workers=None, force=False):
+    """
+    Compiles every MIDI file under the given paths into the song cache in parallel, and records
+    each song's metadata in the cache's index.json. Progress is printed as files finish.
+    Files that fail to compile are reported and recorded in the index with an "error" entry.
+
+    Parameters
+    ----------
+    paths : list of str
+        Files and directories of MIDI files to compile.
+    cache_dir : str, optional
+        The cache directory (default is .song_cache next to this file).
+    max_bytes : int or None, optional
+        The cache size limit applied once the build finishes (default is 256 MB).
+    workers : int, optional
+        Number of worker processes (default is one per CPU).
+    force : bool, optional
+        Clear the cache first so every song is recompiled (default is False).
+
+    Returns
+    -------
+    dict
+        The updated index: song metadata keyed by path relative to the project directory.
+    """
+    song_cache = SongCache(cache_dir, max_bytes)
+    if force:
+        song_cache.clear()
+
+    song_files = find_song_files(paths)
+    index = load_index(cache_dir)
+    failures = 0
+    start_time = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_build_entry, file_path, cache_dir): file_path for file_path in song_files}
+
+        for done, future in enumerate(as_completed(futures), start=1):
+            file_path = futures[future]
+            try:
+                metadata = future.result()
+            except Exception as error:  # The worker process itself died.
+                metadata = {"error": f"{type(error).__name__}: {error}"}
+
+            index_key = os.path.relpath(os.path.abspath(file_path), PROJECT_DIR).replace(os.sep, '/')
+            index[index_key] = metadata
+
+            if "error" in metadata:
+                failures += 1
+                print(f"[{done}/{len(song_files)}] FAILED {index_key}: {metadata['error']}")
+            else:
+                print(f"[{done}/{len(song_files)}] {index_key} ({metadata['note_count']} notes)")
+
+    song_cache.evict()
+
+    temp_path = os.path.join(cache_dir, f"{INDEX_FILENAME}.{os.getpid()}.tmp")
+    with open(temp_path, 'w', encoding='utf-8') as index_file:
+        json.dump(index, index_file, indent=1, sort_keys=True)
+    os.replace(temp_path, os.path.join(cache_dir, INDEX_FILENAME))
+
+    print(f"Built {len(song_files) - failures} of {len(song_files)} songs in {time.perf_counter() - start_time:.1f}s ({failures} failed).")
+    return index
@@ -0,0 +1,483 @@
+"""
+song_clock.py
+=====================
+
+This file provides the timing side of the piano game: one shared monotonic clock (GameClock), a virtual song clock
+that can be paused, and a dispatcher that hands out a song's notes as their time comes, instead of registering one
+pyglet.clock.schedule_once callback (and one closure) per note.
+
+Song time is derived rather than scheduled: song_time = ((now - start) - time spent paused) * playback rate.
+Pausing just freezes that value and resuming adds the pause to the total, so both are constant-time,
+nothing has to be unscheduled or rescheduled, and no rounding error builds up across many pauses.
+Changing the playback rate re-anchors the formula at the current song time, which is also constant-time.
+
+The dispatcher keeps the notes of every player in flat NumPy arrays sorted by onset, plus a cursor.
+Each frame the game asks for the notes due by the current song time; the cursor moves past them,
+so the cost per frame is a binary search plus the notes actually due, and nothing is set up per note in advance.
+
+Classes:
+    SimulatedTime
+    GameClock
+    SongClock
+    NoteDispatcher
+
+Authors: Devin Martin and Wesley Jake Anding
+"""
+
+import time
+import numpy as np
+
+# Slowest and fastest playback rates SongClock.set_rate allows.
+MIN_PLAYBACK_RATE = 0.25
+MAX_PLAYBACK_RATE = 2.0
+
+
+class SimulatedTime():
+    """
+    A time source for GameClock that only moves when told to, for running the game deterministically
+    and faster than real time (see headless_game.py).
+
+    Attributes
+    ----------
+    now_ns : int
+        The current simulated time in nanoseconds.
+    """
+
+    def __init__(self, start_ns=0):
+        """
+        Initializes the SimulatedTime.
+
+        Parameters
+        ----------
+        start_ns : int, optional
+            The starting time in nanoseconds (default is 0).
+        """
+        self.now_ns = start_ns
+
+    def __call__(self):
+        """
+        Returns the current simulated time in nanoseconds.
+        """
+        return self.now_ns
+
+    def advance(self, nanoseconds):
+        """
+        Moves simulated time forward.
+
+        Parameters
+        ----------
+        nanoseconds : int
+            How far to move, in nanoseconds.
+        """
+        self.now_ns += nanoseconds
+
+
+class GameClock():
+    """
+    The one time source for the game: song time, frame time and input timestamps are all read from it,
+    so timing judgments and pause math always agree with each other.
+    Time is kept in integer nanoseconds from a monotonic counter, so it never jumps when the system
+    clock is adjusted and does not lose precision however long the machine has been up.
+
+    The time source can be swapped out (e.g. for a SimulatedTime) to drive the game deterministically.
+
+    Attributes
+    ----------
+    time_source : callable
+        Returns the current time in integer nanoseconds (default is time.perf_counter_ns).
+    frame_ns : int
+        The time at which the current frame began, set by begin_frame.
+    frame_dt : float
+        Seconds between the last two begin_frame calls.
+    """
+
+    def __init__(self, time_source=time.perf_counter_ns):
+        """
+        Initializes the GameClock.
+
+        Parameters
+        ----------
+        time_source : callable, optional
+            Returns the current time in integer nanoseconds (default is time.perf_counter_ns).
+        """
+        self.time_source = time_source
+        self.frame_ns = time_source()
+        self.frame_dt = 0.0
+
+    def now_ns(self):
+        """
+        Returns the current time in nanoseconds. Use this to timestamp input events as they arrive.
+        """
+        return self.time_source()
+
+    def begin_frame(self):
+        """
+        Marks the start of a frame, so everything in the frame is judged against the same instant.
+
+        Returns
+        -------
+        int
+            The frame time in nanoseconds.
+        """
+        now = self.time_source()
+        self.frame_dt = (now - self.frame_ns) / 1e9
+        self.frame_ns = now
+        return now
+
+
+class SongClock():
+    """
+    A pausable song clock on top of a GameClock, with a variable playback rate.
+
+    Song time is measured from an anchor: the song time and GameClock time when the song started or the rate last changed.
+    Since then, song time has advanced by the time not spent paused, times the playback rate.
+
+    Attributes
+    ----------
+    game_clock : GameClock
+        The time source.
+    rate : float
+        The playback rate; 0.5 plays the song at half speed.
+    anchor_ns : int or None
+        The GameClock time of the anchor, or None before start is called.
+    anchor_time : float
+        The song time of the anchor, in seconds.
+    paused_ns : int
+        Total nanoseconds spent paused since the anchor, not counting a pause still in progress.
+    pause_start_ns : int or None
+        The time the current pause began, or None while running.
+    """
+
+    def __init__(self, game_clock=None):
+        """
+        Initializes the SongClock, stopped at song time 0 and normal speed.
+
+        Parameters
+        ----------
+        game_clock : GameClock, optional
+            The time source (default is a new GameClock on time.perf_counter_ns).
+        """
+        self.game_clock = game_clock if game_clock is not None else GameClock()
+        self.rate = 1.0
+        self.anchor_ns = None
+        self.anchor_time = 0.0
+        self.paused_ns = 0
+        self.pause_start_ns = None
+
+    def start(self, at_ns=None):
+        """
+        Starts (or restarts) the song at time 0, keeping the playback rate.
+
+        Parameters
+        ----------
+        at_ns : int, optional
+            When the song starts (default is now).
+        """
+        self.anchor_ns = self.game_clock.now_ns() if at_ns is None else at_ns
+        self.anchor_time = 0.0
+        self.paused_ns = 0
+        self.pause_start_ns = None
+
+    @property
+    def paused(self):
+        """
+        True while the clock is paused.
+        """
+        return self.pause_start_ns is not None
+
+    def time_at(self, at_ns):
+        """
+        Converts a GameClock time (e.g. a frame time or an input timestamp) into song time.
+
+        Parameters
+        ----------
+        at_ns : int
+            The time in nanoseconds.
+
+        Returns
+        -------
+        float
+            The song time in seconds. 0 before the song starts; frozen while paused.
+        """
+        if self.anchor_ns is None:
+            return 0.0
+
+        if self.paused:
+            at_ns = self.pause_start_ns
+        return self.anchor_time + (at_ns - self.anchor_ns - self.paused_ns) * self.rate / 1e9
+
+    @property
+    def time(self):
+        """
+        The current song time in seconds.
+        """
+        return self.time_at(self.game_clock.now_ns())
+
+    def pause(self, at_ns=None):
+        """
+        Freezes song time. Does nothing if already paused.
+
+        Parameters
+        ----------
+        at_ns : int, optional
+            When the pause happened (default is now).
+        """
+        if not self.paused:
+            self.pause_start_ns = self.game_clock.now_ns() if at_ns is None else at_ns
+
+    def resume(self, at_ns=None):
+        """
+        Lets song time run again from where it was paused. Does nothing if not paused.
+
+        Parameters
+        ----------
+        at_ns : int, optional
+            When the song resumed, e.g. the timestamp of the key press that resumed it (default is now).
+        """
+        if self.paused:
+            self.paused_ns += (self.game_clock.now_ns() if at_ns is None else at_ns) - self.pause_start_ns
+            self.pause_start_ns = None
+
+    def set_rate(self, rate, at_ns=None):
+        """
+        Changes the playback rate from now on, without a jump in song time.
+        Only the anchor moves, so this is constant-time and nothing already scheduled or drawn is rebuilt.
+
+        Parameters
+        ----------
+        rate : float
+            The new playback rate, clamped to MIN_PLAYBACK_RATE..MAX_PLAYBACK_RATE.
+        at_ns : int, optional
+            When the change happens (default is now).
+
+        Returns
+        -------
+        float
+            The playback rate actually set.
+        """
+        rate = min(max(rate, MIN_PLAYBACK_RATE), MAX_PLAYBACK_RATE)
+
+        if self.anchor_ns is not None:
+            at_ns = self.game_clock.now_ns() if at_ns is None else at_ns
+            if self.paused:
+                at_ns = self.pause_start_ns
+            self.anchor_time = self.time_at(at_ns)
+            self.anchor_ns = at_ns
+            self.paused_ns = 0
+
+        self.rate = rate
+        return rate
+
+    def seek(self, song_time, at_ns=None):
+        """
+        Jumps to a song time, keeping the playback rate and whether the clock is paused.
+
+        Parameters
+        ----------
+        song_time : float
+            The song time to jump to, in seconds.
+        at_ns : int, optional
+            When the jump happens (default is now).
+        """
+        at_ns = self.game_clock.now_ns() if at_ns is None else at_ns
+        self.anchor_time = song_time
+        self.anchor_ns = at_ns
+        self.paused_ns = 0
+        if self.paused:
+            self.pause_start_ns = at_ns
+
+
+class NoteDispatcher():
+    """
+    Hands out a song's notes in onset order as song time advances.
+
+    Attributes
+    ----------
+    onsets : numpy.ndarray
+        When each note starts, in seconds of song time (sorted).
+    notes : numpy.ndarray
+        The MIDI note number of each note.
+    velocities : numpy.ndarray
+        The velocity of each note.
+    durations : numpy.ndarray
+        How long each note is held, in seconds.
+    players : numpy.ndarray
+        The player each note belongs to (1 or 2).
+    end_time : float
+        When the last note is released, in seconds of song time.
+    cursor : int
+        Index of the next note that has not been handed out yet.
+    """
+
+    def __init__(self, player_tracks):
+        """
+        Initializes the NoteDispatcher, merging every player's notes into one onset-ordered timeline.
+
+        Parameters
+        ----------
+        player_tracks : list of tuple
+            (track_notes, player) pairs, where track_notes is a compiled note array (dtype NOTE_DTYPE).
+        """
+        onsets = [track_notes['onset_seconds'] for track_notes, _ in player_tracks]
+        durations = [track_notes['duration_seconds'] for track_notes, _ in player_tracks]
+        notes = [track_notes['note'] for track_notes, _ in player_tracks]
+        velocities = [track_notes['velocity'] for track_notes, _ in player_tracks]
+        players = [np.full(len(track_notes), player, dtype=np.uint8) for track_notes, player in player_tracks]
+
+        # Stable, so notes that start together keep their order (by pitch, then by player).
+        onsets = np.concatenate(onsets) if onsets else np.empty(0)
+        order = np.argsort(onsets, kind='stable')
+
+        self.onsets = onsets[order]
+        self.durations = np.concatenate(durations)[order] if durations else np.empty(0)
+        self.notes = np.concatenate(notes)[order] if notes else np.empty(0, dtype=np.uint8)
+        self.velocities = np.concatenate(velocities)[order] if velocities else np.empty(0, dtype=np.uint8)
+        self.players = np.concatenate(players)[order] if players else np.empty(0, dtype=np.uint8)
+
+        self.end_time = float(np.max(self.onsets + self.durations)) if len(self.onsets) else 0.0
+        self.cursor = 0
+
+        # Note indexes grouped by pitch, each group in onset order: pitch p is pitch_order[pitch_starts[p]:pitch_starts[p + 1]].
+        self.pitch_order = np.argsort(self.notes, kind='stable')
+        self.pitch_starts = np.searchsorted(self.notes[self.pitch_order], np.arange(129)).tolist()
+        # The latest end so far within each pitch group, in the same order, so it can be binary searched even when
+        # two players' notes of one pitch overlap.
+        self.pitch_ends = (self.onsets + self.durations)[self.pitch_order]
+        for pitch in range(128):
+            group = self.pitch_ends[self.pitch_starts[pitch]:self.pitch_starts[pitch + 1]]
+            np.maximum.accumulate(group, out=group)
+
+    def __len__(self):
+        """
+        Returns the number of notes in the song.
+        """
+        return len(self.onsets)
+
+    def due(self, song_time):
+        """
+        Hands out every note that starts at or before song_time and has not been handed out yet.
+
+        Parameters
+        ----------
+        song_time : float
+            The current song time in seconds.
+
+        Returns
+        -------
+        list
+            (onset, note, velocity, duration, player) tuples in onset order.
+        """
+        end = int(np.searchsorted(self.onsets, song_time, side='right'))
+        if end <= self.cursor:
+            return []
+
+        start, self.cursor = self.cursor, end
+        return list(zip(self.onsets[start:end].tolist(), self.notes[start:end].tolist(), self.velocities[start:end].tolist(),
+                        self.durations[start:end].tolist(), self.players[start:end].tolist()))
+
+    def seek(self, song_time):
+        """
+        Moves the cursor so that the next notes handed out are the ones starting after song_time.
+        A binary search, so it costs the same at any point of any song.
+
+        Parameters
+        ----------
+        song_time : float
+            The song time to jump to, in seconds.
+        """
+        self.cursor = int(np.searchsorted(self.onsets, song_time, side='right'))
+
+    def window(self, start_time, end_time):
+        """
+        Returns the notes that start after start_time and at or before end_time, without moving the cursor.
+
+        Parameters
+        ----------
+        start_time : float
+            Start of the window in song time (exclusive).
+        end_time : float
+            End of the window in song time (inclusive).
+
+        Returns
+        -------
+        list
+            (onset, note, velocity, duration, player) tuples in onset order.
+        """
+        start, end = np.searchsorted(self.onsets, [start_time, end_time], side='right').tolist()
+        return list(zip(self.onsets[start:end].tolist(), self.notes[start:end].tolist(), self.velocities[start:end].tolist(),
+                        self.durations[start:end].tolist(), self.players[start:end].tolist()))
+
+    def find_note(self, note, song_time, early):
+        """
+        Finds the note of a pitch that is sounding at song_time, or starts within `early` seconds of it.
+        Binary searches only, so it is cheap enough to call for every key press.
+
+        Parameters
+        ----------
+        note : int
+            The MIDI note number.
+        song_time : float
+            The song time in seconds.
+        early : float
+            How many seconds before its onset a note can be found.
+
+        Returns
+        -------
+        int
+            The index of the note (into onsets, notes, ...); of the notes that qualify, the one starting nearest
+            song_time. -1 if there is none.
+        """
+        if not 0 <= note < 128:
+            return -1
+
+        group_start, group_end = self.pitch_starts[note], self.pitch_starts[note + 1]
+        indexes = self.pitch_order[group_start:group_end]
+        # From the first note that has not ended by song_time, to the last that starts within reach.
+        first = int(np.searchsorted(self.pitch_ends[group_start:group_end], song_time, side='left'))
+        last = int(np.searchsorted(self.onsets[indexes], song_time + early, side='right'))
+        if first >= last:
+            return -1
+
+        candidates = indexes[first:last]
+        # Only overlapping notes (two players on one pitch) can have ended in this range.
+        candidates = candidates[self.onsets[candidates] + self.durations[candidates] >= song_time]
+        if not len(candidates):
+            return -1
+        onsets = self.onsets[candidates]
+        # Onsets are sorted, so the nearest one is on either side of song_time.
+        i = int(np.searchsorted(onsets, song_time))
+        nearest = [j for j in (i - 1, i) if 0 <= j < len(candidates)]
+        best = min(nearest, key=lambda j: abs(onsets[j] - song_time))
+        return int(candidates[best])
+
+    def peak_active(self, before, after):
+        """
+        Returns the most notes that are ever alive at once, if each note lives from `before` seconds ahead of its onset
+        until `after` seconds past its end. Used to size the pool of falling rectangles before the song starts.
+
+        Parameters
+        ----------
+        before : float
+            Seconds each note exists before its onset.
+        after : float
+            Seconds each note exists after it ends.
+
+        Returns
+        -------
+        int
+            The peak number of live notes.
+        """
+        if not len(self.onsets):
+            return 0
+
+        starts = self.onsets - before
+        ends = np.sort(self.onsets + self.durations + after)
+        # At the i-th start (starts are sorted), i + 1 notes have started, less those that ended before it.
+        alive = np.arange(1, len(starts) + 1) - np.searchsorted(ends, starts, side='left')
+        return int(np.max(alive))
+
+    def finished(self):
+        """
+        Returns True once every note has been handed out.
+        """
+        return self.cursor >= len(self.onsets)
@@ -0,0 +1,233 @@
+"""
+song_metadata.py
+=====================
+
+This file provides per-song playback settings, read from song_metadata.csv next to this file:
+
+    file        The song's file name (without directory). Songs are looked up by the name without its extension, so
+                a .wpsong exported from a song (see midi_processor.write_wpsong) gets the same settings.
+    time_scale  Stretches the song in time; 1.75 plays it 1.75 times slower (blank means 1).
+    transpose   Semitones to shift every note by (blank means 0). The drum channel is never transposed.
+    tracks      Space separated track numbers to play, in order (blank means every track that has notes).
+    hands       Space separated "right"/"left" for each entry in tracks. Player 1 gets the right hand.
+
+The table is read and checked once when the game starts (init_song_metadata), into a dict keyed by song name, so a
+mistake in it stops the game at startup rather than when the song is picked. If nothing loaded it, the first lookup does.
+Settings are applied to a compiled timeline (or a streamed event chunk) with a vectorized pass after it is
+loaded, never during parsing, so tweaking a song does not invalidate the song cache or require a code change.
+
+Functions:
+    song_name
+    load_song_metadata
+    init_song_metadata
+    get_song_metadata
+    apply_song_metadata
+    apply_song_metadata_to_events
+    order_tracks
+
+Authors: Devin Martin and Wesley Jake Anding
+"""
+
+import csv
+import os
+import numpy as np
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_METADATA_PATH = os.path.join(PROJECT_DIR, 'song_metadata.csv')
+DRUM_CHANNEL = 9  # Channel 10 in MIDI numbering; its note numbers pick drums, not pitches
+
+DEFAULT_SONG_METADATA = {"time_scale": 1.0, "transpose": 0, "tracks": [], "hands": {}}
+HANDS = ("right", "left")
+
+_song_metadata = None  # song name -> settings, filled in by init_song_metadata or get_song_metadata
+
+
+def song_name(file_path):
+    """
+    Returns the name songs are looked up by: the file name without its directory or extension.
+    """
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+
+def load_song_metadata(metadata_path=DEFAULT_METADATA_PATH):
+    """
+    Reads and checks the song metadata table.
+
+    Parameters
+    ----------
+    metadata_path : str, optional
+        The path to the CSV file (default is song_metadata.csv next to this file).
+
+    Returns
+    -------
+    dict
+        Settings (time_scale, transpose, tracks, hands) keyed by song name (see song_name). Missing files give an
+        empty dict.
+
+    Raises
+    ------
+    ValueError
+        If a row is malformed: no file name, a song listed twice, a value that is not a number, a time scale
+        that is not positive, or hands that don't match the tracks one to one.
+    """
+    song_metadata = {}
+    try:
+        with open(metadata_path, mode='r', encoding='utf-8') as csv_file:
+            # Line 1 is the header.
+            for line_number, row in enumerate(csv.DictReader(csv_file), start=2):
+                file_name = (row.get("file") or "").strip()
+                if not file_name:
+                    raise ValueError(f"{metadata_path}, line {line_number}: no file name")
+                name = song_name(file_name)
+                if name in song_metadata:
+                    raise ValueError(f"{metadata_path}, line {line_number}: {file_name} is listed twice")
+
+                try:
+                    time_scale = float(row.get("time_scale") or 1.0)
+                    transpose = int(row.get("transpose") or 0)
+                    tracks = [int(track) for track in (row.get("tracks") or "").split()]
+                except ValueError as error:
+                    raise ValueError(f"{metadata_path}, line {line_number}: {error}") from None
+                hands = (row.get("hands") or "").split()
+
+                if time_scale <= 0:
+                    raise ValueError(f"{metadata_path}, line {line_number}: time_scale must be positive")
+                if hands and len(hands) != len(tracks):
+                    raise ValueError(f"{metadata_path}, line {line_number}: {len(hands)} hands for {len(tracks)} tracks")
+                if any(hand not in HANDS for hand in hands):
+                    raise ValueError(f"{metadata_path}, line {line_number}: hands must be \"right\" or \"left\"")
+
+                song_metadata[name] = {
+                    "time_scale": time_scale,
+                    "transpose": transpose,
+                    "tracks": tracks,
+                    "hands": dict(zip(tracks, hands)),
+                }
+    except FileNotFoundError:
+        pass
+
+    return song_metadata
+
+
+def init_song_metadata(metadata_path=DEFAULT_METADATA_PATH):
+    """
+    Reads and checks the song metadata table, and uses it for every later lookup. Call once when the game starts.
+
+    Parameters
+    ----------
+    metadata_path : str, optional
+        The path to the CSV file (default is song_metadata.csv next to this file).
+
+    Raises
+    ------
+    ValueError
+        If the table is malformed, see load_song_metadata.
+    """
+    global _song_metadata
+    _song_metadata = load_song_metadata(metadata_path)
+
+
+def get_song_metadata(file_path):
+    """
+    Looks up the settings for a song, reading the metadata table first if init_song_metadata has not.
+
+    Parameters
+    ----------
+    file_path : str
+        The path to the song (.mid/.midi or .wpsong); only its name is used, see song_name.
+
+    Returns
+    -------
+    dict
+        The song's settings, or DEFAULT_SONG_METADATA if it has none.
+    """
+    if _song_metadata is None:
+        init_song_metadata()
+
+    return _song_metadata.get(song_name(file_path), DEFAULT_SONG_METADATA)
+
+
+def apply_song_metadata(timeline, song_metadata):
+    """
+    Applies a song's time scale and transposition to a compiled timeline.
+
+    Parameters
+    ----------
+    timeline : numpy.ndarray
+        The compiled timeline (dtype NOTE_DTYPE or WPSONG_NOTE_DTYPE). Never modified, since it is often a read-only memory map.
+    song_metadata : dict
+        The song's settings, from get_song_metadata.
+
+    Returns
+    -------
+    numpy.ndarray
+        The timeline itself if there is nothing to change, else an adjusted copy.
+    """
+    time_scale = song_metadata["time_scale"]
+    transpose = song_metadata["transpose"]
+    if time_scale == 1.0 and transpose == 0:
+        return timeline
+
+    timeline = np.array(timeline)
+    timeline['onset_seconds'] *= time_scale
+    timeline['duration_seconds'] *= time_scale
+
+    if transpose:
+        pitched = timeline['channel'] != DRUM_CHANNEL
+        timeline['note'][pitched] = np.clip(timeline['note'][pitched].astype(np.int16) + transpose, 0, 127)
+
+    return timeline
+
+
+def apply_song_metadata_to_events(events, song_metadata):
+    """
+    Applies a song's time scale and transposition to a chunk of streamed events (see midi_processor.MIDIStreamReader).
+
+    Parameters
+    ----------
+    events : numpy.ndarray
+        A chunk of events (dtype EVENT_DTYPE). Adjusted in place.
+    song_metadata : dict
+        The song's settings, from get_song_metadata.
+
+    Returns
+    -------
+    numpy.ndarray
+        The same chunk, for convenience.
+    """
+    if song_metadata["time_scale"] != 1.0:
+        events['time_seconds'] *= song_metadata["time_scale"]
+
+    if song_metadata["transpose"]:
+        # Note off, note on and polyphonic aftertouch carry a note number in data1.
+        command = events['status'] & 0xF0
+        pitched = ((command == 0x80) | (command == 0x90) | (command == 0xA0)) & ((events['status'] & 0x0F) != DRUM_CHANNEL)
+        events['data1'][pitched] = np.clip(events['data1'][pitched].astype(np.int16) + song_metadata["transpose"], 0, 127)
+
+    return events
+
+
+def order_tracks(playable_tracks, song_metadata):
+    """
+    Orders a song's playable tracks for the players, right hand ahead of left hand.
+    If the song's settings list tracks, only those are used (in that order); otherwise every playable track is.
+
+    Parameters
+    ----------
+    playable_tracks : list of int
+        The track numbers that contain notes.
+    song_metadata : dict
+        The song's settings, from get_song_metadata.
+
+    Returns
+    -------
+    list
+        The track numbers in the order players are assigned to them (player 1 first).
+    """
+    if song_metadata["tracks"]:
+        ordered = [track for track in song_metadata["tracks"] if track in playable_tracks]
+    else:
+        ordered = list(playable_tracks)
+
+    hand_order = {"right": 0, "left": 1}
+    return sorted(ordered, key=lambda track: hand_order.get(song_metadata["hands"].get(track), 2))
@@ -13,6 +13,7 @@ Classes:
 
 Functions:
     csv_to_song_database
+    rebuild_song_cache
     
 Authors: Devin Martin and Wesley Jake Anding
 """
@@ -23,144 +24,145 @@ from piano_game import PianoGameUI
 import os
 import signal
 import csv 
-
+import argparse
+from song_cache import build_song_library
+from song_analysis import annotate_song_database
+from song_metadata import init_song_metadata
+
+# "difficulty", "players" and "practice" are filled in from song analysis when the game starts (see song_analysis.py).
+# Any of them written here overrides the analysis; only do so for songs the analysis gets wrong, and say why.
+# "practice": False marks songs that don't play well in Practice mode (they used to be blacklisted in
+# filter_songs_based_on_mode_and_players).
 song_database = {
-    # Easy songs
-    1: {"name": "A Happy Bass Melody", "artist": "G. Turk - Adapted", "file": "A_Happy_Bass_Melody.mid", "difficulty": "Easy", "players": 1},
-    2: {"name": "A Happy Treble Melody", "artist": "G. Turk - Adapted", "file": "A_Happy_Treble_Melody.mid", "difficulty": "Easy", "players": 1},
-    3: {"name": "A Lion", "artist": "Nursery Rhyme (Easy)", "file": "A_Lion.mid", "difficulty": "Easy", "players": 1},
-    4: {"name": "Mary had a little lamb", "artist": "Nursery Rhyme (Easy)", "file": "mary_lamb.mid", "difficulty": "Easy", "players": 1},
-    5: {"name": "Morning", "artist": "Edvard Grieg - Adapted", "file": "morning.mid", "difficulty": "Easy", "players": 1},
-    6: {"name": "My Heart Will Go On", "artist": "Celine Dion", "file": "My_Heart_Will_Go_On_Piano.mid", "difficulty": "Easy", "players": 2},
-    7: {"name": "Ode to Joy", "artist": "Ludwig van Beethoven - Adapted", "file": "Ode_to_joy.mid", "difficulty": "Easy", "players": 1},
-    8: {"name": "Peter Peter Pumpkin Eater", "artist": "Nursery Rhyme (Easy)", "file": "PeterPeter.mid", "difficulty": "Easy", "players": 1},
-    9: {"name": "Piano Polka", "artist": "Kevin Olson", "file": "piano_polka.mid", "difficulty": "Easy", "players": 1},
-    10: {"name": "Pure Imagination", "artist": "Leslie Bricusse & Anthony Newley", "file": "Pure_Imagination_Piano_Solo_-_Beginner.mid", "difficulty": "Easy", "players": 2},
-    11: {"name": "Silent Night", "artist": "Traditional", "file": "silent_night.mid", "difficulty": "Easy", "players": 2},
-    12: {"name": "The Wishing Well", "artist": "Nursery Rhyme (Easy)", "file": "TheWishingWell.mid", "difficulty": "Easy", "players": 1},
-    13: {"name": "Twinkle Twinkle Little Star", "artist": "Nursery Rhyme", "file": "twinkle_twinkle.mid", "difficulty": "Easy", "players": 2},
-    14: {"name": "Yankee Doodle", "artist": "Mary Leaf", "file": "Yankee_Doodle.mid", "difficulty": "Easy", "players": 1},
-    15: {"name": "You've Got A Friend In Me", "artist": "Randy Newman", "file": "You_ve_Got_A_Friend_In_Me_Easy_Piano_Sheet_Music.mid", "difficulty": "Easy", "players": 2},
-
-
-    # Challenge songs
-    16: {"name": "7 Years", "artist": "Lukas Graham", "file": "7_Years.mid", "difficulty": "Challenge", "players": 2},
-    17: {"name": "A Whole New World", "artist": "Aladdin", "file": "whole_new_world.mid", "difficulty": "Challenge", "players": 2},
-    18: {"name": "All of Me", "artist": "John Legend", "file": "All_of_Me_John_Legend.mid", "difficulty": "Challenge", "players": 2},
-    20: {"name": "Can't Help Falling in Love", "artist": "Elvis Presley", "file": "Cant_Help_Falling_In_Love.mid", "difficulty": "Challenge", "players": 2},
-    21: {"name": "Captured Memories", "artist": "Zelda: Breath of the Wild", "file": "Zelda_Breath_of_the_Wild_-_Captured_Memories_piano.mid", "difficulty": "Challenge", "players": 2},
-    22: {"name": "Christmas Don't Be Late", "artist": "The Chipmunks", "file": "christmas_dont_be_late.mid", "difficulty": "Challenge", "players": 2},
-    23: {"name": "Clark (Minecraft)", "artist": "C418", "file": "clark_minecraft.mid", "difficulty": "Challenge", "players": 2},
-    24: {"name": "Cornfield Chase (Interstellar)", "artist": "Hans Zimmer", "file": "cornfield_chase.mid", "difficulty": "Challenge", "players": 2},
-    25: {"name": "Counting Stars", "artist": "OneRepublic", "file": "Counting_Stars_longer.mid", "difficulty": "Challenge", "players": 2},
-    26: {"name": "Dancing in the Moonlight", "artist": "Toploader", "file": "Dancing_in_the_Moonlight_-_Toploader_-_Easy_Piano.mid", "difficulty": "Challenge", "players": 2},
-    27: {"name": "Dry Hands", "artist": "C418", "file": "Dry_Hands.mid", "difficulty": "Challenge", "players": 2},
-    28: {"name": "Evil Morty's Theme", "artist": "Rick and Morty", "file": "Evil_Morty_s_ThemeFor_the_Damaged_Coda_-_Easy_Piano.mid", "difficulty": "Challenge", "players": 2},
-    29: {"name": "Game of Thrones Theme", "artist": "Ramin Djawadi", "file": "game_of_thrones.mid", "difficulty": "Challenge", "players": 2},
-    30: {"name": "Glimpse of Us", "artist": "Joji", "file": "Glimpse_of_Us__Joji_Piano_Accompaniment.mid", "difficulty": "Challenge", "players": 2},
-    31: {"name": "Hallelujah", "artist": "Leonard Cohen", "file": "hallelujah.mid", "difficulty": "Challenge", "players": 2},
-    32: {"name": "Hanachirusato", "artist": "Genshin Impact", "file": "Genshin_Impact_-_Hanachirusato_Piano.mid", "difficulty": "Challenge", "players": 2},
-    33: {"name": "Heart and Soul", "artist": "Hoagy Carmichael", "file": "Heart_and_Soul_Piano.mid", "difficulty": "Challenge", "players": 2},
-    34: {"name": "He's a Pirate", "artist": "Klaus Badelt", "file": "hes_a_pirate.mid", "difficulty": "Challenge", "players": 2},
-    35: {"name": "How To Save A Life", "artist": "The Fray", "file": "How_To_Save_A_Life_-_The_Fray.mid", "difficulty": "Challenge", "players": 2},
-    36: {"name": "I'm Still Standing", "artist": "Elton John", "file": "still_standing.mid", "difficulty": "Challenge", "players": 2},
-    37: {"name": "Interstellar Theme", "artist": "Hans Zimmer", "file": "Interstellar_Theme_Easy_Piano.mid", "difficulty": "Challenge", "players": 2},
-    38: {"name": "Jurassic Park Theme", "artist": "John Williams", "file": "Jurassic_Park_Theme_for_Beginner_EASY_Piano.mid", "difficulty": "Challenge", "players": 2},
-    39: {"name": "La Vie En Rose", "artist": "Édith Piaf", "file": "La_vie_en_rose_Piano_Intermediate.mid", "difficulty": "Challenge", "players": 2},
-    40: {"name": "Let Her Go", "artist": "Passenger", "file": "Let_Her_Go_Passenger.mid", "difficulty": "Challenge", "players": 2},
-    41: {"name": "Love Yourself", "artist": "Justin Bieber", "file": "Love_Yourself.mid", "difficulty": "Challenge", "players": 2},
-    42: {"name": "Mad at Disney", "artist": "salem ilese", "file": "mad_at_disney_copy.mid", "difficulty": "Challenge", "players": 2},
-    43: {"name": "Married Life", "artist": "Michael Giacchino (Up)", "file": "married_life.mid", "difficulty": "Challenge", "players": 2},
-    44: {"name": "Megalovania Theme from Undertale", "artist": "Toby Fox", "file": "Megalovania_Theme_from_Undertale__easy_piano.mid", "difficulty": "Challenge", "players": 2},
-    45: {"name": "Minuet in G Minor", "artist": "Bach", "file": "Bach_Minuet_in_G_Minor.mid", "difficulty": "Challenge", "players": 2},
-    46: {"name": "Moon River", "artist": "Henry Mancini", "file": "Moon_River(1).mid", "difficulty": "Challenge", "players": 2},
-    47: {"name": "My Heart Will Go On", "artist": "Celine Dion", "file": "heart_will_go_on.mid", "difficulty": "Challenge", "players": 2},
-    48: {"name": "No Time to Die", "artist": "Billie Eilish", "file": "No_Time_to_Die_Piano_-_James_Bond_Theme_-_Billie_Eilish_with_Lyrics.mid", "difficulty": "Challenge", "players": 2},
-    49: {"name": "One Last Time", "artist": "Ariana Grande", "file": "One_Last_Time.mid", "difficulty": "Challenge", "players": 2},
-    50: {"name": "Perfect", "artist": "Ed Sheeran", "file": "Perfect_-_Ed_Sheeran_PIANO.mid", "difficulty": "Challenge", "players": 2},
-    51: {"name": "Pirates of the Caribbean", "artist": "Klaus Badelt", "file": "Pirates_of_the_Caribbean.mid", "difficulty": "Challenge", "players": 2},
-    52: {"name": "Piano Man", "artist": "Billy Joel", "file": "piano_man.mid", "difficulty": "Challenge", "players": 2},
-    54: {"name": "SAD!", "artist": "XXXTENTACION", "file": "SAD_-_XXXTENTACION_Piano.mid", "difficulty": "Challenge", "players": 2},
-    55: {"name": "Sadness and Sorrow", "artist": "Naruto", "file": "Sadness_and_Sorrow_for_PIANO_SOLO.mid", "difficulty": "Challenge", "players": 2},
-    56: {"name": "See You Again", "artist": "Wiz Khalifa ft. Charlie Puth", "file": "See_You_Again.mid", "difficulty": "Challenge", "players": 2},
-    57: {"name": "Set Fire To The Rain", "artist": "Adele", "file": "Set_Fire_To_The_Rain.mid", "difficulty": "Challenge", "players": 2},
-    58: {"name": "Snowman", "artist": "Sia", "file": "Sia_-_Snowman.mid", "difficulty": "Challenge", "players": 2},
-    59: {"name": "Someone Like You", "artist": "Adele", "file": "Someone_Like_You_easy_piano.mid", "difficulty": "Challenge", "players": 2},
-    60: {"name": "Somewhere Over the Rainbow", "artist": "Harold Arlen", "file": "Somewhere_over_the_Rainbow.mid", "difficulty": "Challenge", "players": 2},
-    61: {"name": "Song for Beginners", "artist": "Nikodem Kulczyk", "file": "beginner.mid", "difficulty": "Challenge", "players": 2},
-    63: {"name": "Super Mario Theme Song", "artist": "Koji Kondo", "file": "Super_Mario_Theme_Song.mid", "difficulty": "Challenge", "players": 1},
-    64: {"name": "Sweden (Minecraft)", "artist": "C418", "file": "sweden_minecraft.mid", "difficulty": "Challenge", "players": 2},
-    66: {"name": "The Legend of Zelda Main Theme", "artist": "Nintendo", "file": "The_Legend_of_Zelda_Main_Theme_Easy.mid", "difficulty": "Challenge", "players": 2},
-    67: {"name": "The Most Wonderful Time of the Year", "artist": "Andy Williams", "file": "The_Most_Wonderful_Time_of_the_Year_-_easy_piano_C_maj.mid", "difficulty": "Challenge", "players": 2},
-    68: {"name": "Uptown Girl", "artist": "Billy Joel", "file": "Uptown_Girl(1).mid", "difficulty": "Challenge", "players": 2},
-    69: {"name": "Uptown Girl", "artist": "Westlife", "file": "uptown_girl.mid", "difficulty": "Challenge", "players": 2},
-    70: {"name": "Viva la Vida", "artist": "Coldplay", "file": "Viva_la_vida.mid", "difficulty": "Challenge", "players": 2},
-    71: {"name": "Wet Hands", "artist": "C418", "file": "Wet_Hands_Minecraft.mid", "difficulty": "Challenge", "players": 2},
-    72: {"name": "Zelda's Lullaby", "artist": "The Legend of Zelda: Ocarina of Time", "file": "Zeldas_Lullaby_The_Legend_of_Zelda_Ocarina_of_Time_-_Easy_version.mid", "difficulty": "Challenge", "players": 2},
-
-
-    # Impossible songs
-    75: {"name": "20th Century Fox Fanfare", "artist": "Unknown", "file": "20th_Century_Fox_Fanfare_Simple_Piano.mid", "difficulty": "Impossible", "players": 2},
-    76: {"name": "A Cruel Angel's Thesis - Neon Genesis Evangelion", "artist": "Unknown", "file": "A_Cruel_Angels_Thesis_-_Neon_Genesis_Evangelion_Piano_Cover.mid", "difficulty": "Impossible", "players": 2},
-    77: {"name": "All the World's a Stage", "artist": "Genshin Impact", "file": "genshin.mid", "difficulty": "Impossible", "players": 2},
-    701: {"name": "All of Me", "artist": "John Legend", "file": "All_of_me_-_John_Legend.mid", "difficulty": "Impossible", "players": 2},
-    78: {"name": "Autumn Leaves", "artist": "Jazz Piano", "file": "Autumn_Leaves_Jazz_Piano.mid", "difficulty": "Impossible", "players": 2},
-    79: {"name": "Bach Toccata and Fugue in D Minor", "artist": "Bach", "file": "Bach_Toccata_and_Fugue_in_D_Minor_Piano_solo.mid", "difficulty": "Impossible", "players": 2},
-    80: {"name": "Ballad of the Wind Fish", "artist": "The Legend of Zelda", "file": "The_Legend_of_Zelda_Links_Awakening-Ballad_of_the_Wind_Fish_Piano.mid", "difficulty": "Impossible", "players": 2},
-    81: {"name": "Beethoven Symphony No. 5 1st movement", "artist": "Beethoven", "file": "Beethoven_Symphony_No._5_1st_movement_Piano_solo.mid", "difficulty": "Impossible", "players": 2},
-    82: {"name": "Bluebird", "artist": "Naruto", "file": "bluebird_naruto.mid", "difficulty": "Impossible", "players": 2},
-    83: {"name": "Canon in D", "artist": "Unknown", "file": "Canon_in_D.mid", "difficulty": "Impossible", "players": 2},
-    84: {"name": "Cowboy Bebop TANK", "artist": "Unknown", "file": "Cowboy_Bebop_TANK.mid", "difficulty": "Impossible", "players": 2},
-    85: {"name": "Dancing in the Moonlight", "artist": "Toploader", "file": "Dancing_in_the_Moonlight.mid", "difficulty": "Impossible", "players": 2},
-    86: {"name": "Deference for Darkness", "artist": "Halo 3 ODST", "file": "Deference_for_Darkness_from_Halo_3_ODST_for_Piano.mid", "difficulty": "Impossible", "players": 2},
-    87: {"name": "Don't Stop Believing", "artist": "Journey", "file": "Dont_Stop_Believing_Piano_Guitar_Vocals.mid", "difficulty": "Impossible", "players": 2},
-    88: {"name": "Fallen Down", "artist": "Undertale", "file": "Fallen_Down_-_Undertale_Piano_Solo.mid", "difficulty": "Impossible", "players": 2},
-    89: {"name": "From the New World - 4th Movement", "artist": "Unknown", "file": "From_the_New_World_-_4th_Movement.mid", "difficulty": "Impossible", "players": 2},
-    90: {"name": "Golden Hour", "artist": "JVKE", "file": "Golden_HOUR.mid", "difficulty": "Impossible", "players": 2},
-    91: {"name": "Good News", "artist": "Mac Miller", "file": "Good_News_-_Mac_Miller_-_Easy_piano.mid", "difficulty": "Impossible", "players": 2},
-    92: {"name": "Gravity Falls Opening", "artist": "Intermediate Piano Solo", "file": "Gravity_Falls_Opening_-_Intermediate_Piano_Solo.mid", "difficulty": "Impossible", "players": 2},
-    93: {"name": "Great Fairy Fountain", "artist": "The Legend of Zelda", "file": "The_Legend_of_Zelda_Great_Fairy_Fountain_Piano_Cover.mid", "difficulty": "Impossible", "players": 2},
-    94: {"name": "Gusty Garden Galaxy", "artist": "Super Mario Galaxy", "file": "Gusty_Garden_Galaxy_From_Super_Mario_Galaxy_for_piano.mid", "difficulty": "Impossible", "players": 2},
-    95: {"name": "Here With Me", "artist": "D4vd", "file": "here_with_me.mid", "difficulty": "Impossible", "players": 2},
-    96: {"name": "idontwannabeyouanymore", "artist": "Billie Eilish", "file": "idontwannabeyouanymore.mid", "difficulty": "Impossible", "players": 2},
-    97: {"name": "Isn't She Lovely", "artist": "Unknown", "file": "Isnt_She_Lovely.mid", "difficulty": "Impossible", "players": 2},
-    98: {"name": "Jojo's Bizarre Adventure G", "artist": "Unknown", "file": "jojo.mid", "difficulty": "Impossible", "players": 2},
-    99: {"name": "Jump Up, Super Star! (Super Mario Odyssey)", "artist": "Unknown", "file": "Jump_Up_Super_Star_-Super_Mario_Odyssey-.mid", "difficulty": "Impossible", "players": 2},
-    100: {"name": "Kick Back (TV Size)", "artist": "Unknown", "file": "Kick_Back__TV_Size.mid", "difficulty": "Impossible", "players": 2},
-    101: {"name": "Littleroot Town", "artist": "Pokemon ORAS", "file": "Littleroot_Town_-_Pokmon_ORAS_for_piano.mid", "difficulty": "Impossible", "players": 2},
-    102: {"name": "Lost in Paradise", "artist": "Unknown", "file": "Lost_in_Paradise.mid", "difficulty": "Impossible", "players": 2},
-    103: {"name": "Main Theme From Interstellar", "artist": "Hans Zimmer", "file": "Main_Theme_From_Interstellar__Hans_Zimmer_Piano.mid", "difficulty": "Impossible", "players": 2},
-    105: {"name": "Merry Go Round of Life", "artist": "Howl's Moving Castle", "file": "Merry_Go_Round_of_Life_Howls_Moving_Castle_Piano_Tutorial_.mid", "difficulty": "Impossible", "players": 2},
-    106: {"name": "Mii Channel", "artist": "Nintendo", "file": "Mii_Channel_piano.mscz.mid", "difficulty": "Impossible", "players": 2},
-    107: {"name": "Moon River", "artist": "Johnny Mercer and Henry Mancini", "file": "moon_river.mid", "difficulty": "Impossible", "players": 2},
-    108: {"name": "My Heart Will Go On", "artist": "Unknown", "file": "MY_HEART_WILL_GO_ON.mid", "difficulty": "Impossible", "players": 2},
-    109: {"name": "Never See Me Again", "artist": "Kanye West", "file": "Never_See_Me_Again__Kanye_West.mid", "difficulty": "Impossible", "players": 2},
-    110: {"name": "Number One (Thousand Year Blood War ver.)", "artist": "Bleach OST", "file": "number_one_bleach.mid", "difficulty": "Impossible", "players": 2},
-    111: {"name": "Ode to Joy Easy Variation", "artist": "Unknown", "file": "Ode_to_Joy_Easy_variation.mid", "difficulty": "Impossible", "players": 2},
-    112: {"name": "One Piece - Overtaken", "artist": "Unknown", "file": "One_Piece_-_Overtaken.mid", "difficulty": "Impossible", "players": 2},
-    113: {"name": "Perfect", "artist": "Ed Sheeran", "file": "Perfect_-_Ed_Sheeran_PIANO.mid", "difficulty": "Impossible", "players": 2},
-    114: {"name": "Piano Sonata No. 11 K. 331 3rd Movement Rondo alla Turca", "artist": "Mozart", "file": "Piano_Sonata_No._11_K._331_3rd_Movement_Rondo_alla_Turca.mid", "difficulty": "Impossible", "players": 2},
-    115: {"name": "Pokemon Red and Blue Title Theme", "artist": "Pokemon", "file": "Pokemon_Red_and_Blue_-_Title_Theme_for_piano.mid", "difficulty": "Impossible", "players": 2},
-    116: {"name": "Pokemon Theme Song", "artist": "Pokemon", "file": "Pokemon_Theme_Song_piano.mid", "difficulty": "Impossible", "players": 2},
-    117: {"name": "Promenade I", "artist": "Unknown", "file": "Promenade_I.mid", "difficulty": "Impossible", "players": 2},
-    118: {"name": "River Flows in You", "artist": "Yiruma", "file": "River_Flows_in_You_-_Yiruma_-_10th_Anniversary_Version_Piano.mid", "difficulty": "Impossible", "players": 2},
-    119: {"name": "Runaway", "artist": "Kanye West", "file": "runaway.mid", "difficulty": "Impossible", "players": 2},
-    700: {"name": 'Running up that hill', "artist": 'Kate Bush', "file": 'Running_Up_That_Hill__A_Deal_With_God__Piano_Solo.mid', "difficulty": 'Impossible', "players": 2},
-    120: {"name": "September", "artist": "Earth, Wind & Fire", "file": "september.mid", "difficulty": "Impossible", "players": 2},
-    121: {"name": "Set Fire to the Rain", "artist": "Adele", "file": "52__Adele__Set_Fire_to_the_Rain.mid", "difficulty": "Impossible", "players": 2},
-    122: {"name": "Skyrim Medley", "artist": "The Elder Scrolls V: Skyrim", "file": "Skyrim_Medley-_Dragonborn_The_Dragonborn_Comes_From_Past_to_Present_Far_Horizons.mid", "difficulty": "Impossible", "players": 2},
-    123: {"name": "Somewhere Over the Rainbow", "artist": "Harold Arlen", "file": "Somewhere_over_the_Rainbow.mid", "difficulty": "Impossible", "players": 2},
-    124: {"name": "Song of Storms", "artist": "Koji Kondo", "file": "Song_of_Storms_-_The_Legend_of_Zelda_Ocarine_of_Time__Koji_Kondo_-_Accordion_Solo.mid", "difficulty": "Impossible", "players": 2},
-    125: {"name": "Super Mario Bros. Main Theme", "artist": "Nintendo", "file": "Super_Mario_Bros.__Main_Theme.mid", "difficulty": "Impossible", "players": 2},
-    126: {"name": "The Legend of Zelda Main Theme", "artist": "Nintendo", "file": "The_Legend_of_Zelda_Main_Theme_Easy.mid", "difficulty": "Impossible", "players": 2},
-    127: {"name": "The Most Wonderful Time of the Year", "artist": "Andy Williams", "file": "The_Most_Wonderful_Time_of_the_Year_-_easy_piano_C_maj.mid", "difficulty": "Impossible", "players": 2},
-    128: {"name": "The Observatory", "artist": "Super Mario Galaxy", "file": "The_Observatory_-_Super_Mario_Galaxy.mid", "difficulty": "Impossible", "players": 2},
-    129: {"name": "The Pink Panther Theme", "artist": "Henry Mancini", "file": "The_Pink_Panther_Theme_-_Henry_Mancini_-_Piano_version.mid", "difficulty": "Impossible", "players": 2},
-    130: {"name": "Undertale", "artist": "Undertale", "file": "Undertale_Undertale_Piano.mid", "difficulty": "Impossible", "players": 2},
-    131: {"name": "Verdanturf Town", "artist": "Pokemon ORAS", "file": "Verdanturf_Town_-_Pokemon_ORAS_for_piano.mid", "difficulty": "Impossible", "players": 2},
-    132: {"name": "Wii Sports Theme", "artist": "Nintendo", "file": "Wii_Sports_Theme_piano.mid", "difficulty": "Impossible", "players": 2},
-    133: {"name": "You've Got A Friend In Me", "artist": "Randy Newman", "file": "friend_in_me.mid", "difficulty": "Impossible", "players": 2},
-    134: {"name": "Zoltraak - Frieren OST", "artist": "Unknown", "file": "Zoltraak_-_Frieren_OST.mid", "difficulty": "Impossible", "players": 2}
+    1: {"name": "A Happy Bass Melody", "artist": "G. Turk - Adapted", "file": "A_Happy_Bass_Melody.mid", "practice": False},
+    2: {"name": "A Happy Treble Melody", "artist": "G. Turk - Adapted", "file": "A_Happy_Treble_Melody.mid", "practice": False},
+    3: {"name": "A Lion", "artist": "Nursery Rhyme (Easy)", "file": "A_Lion.mid", "practice": False},
+    4: {"name": "Mary had a little lamb", "artist": "Nursery Rhyme (Easy)", "file": "mary_lamb.mid"},
+    5: {"name": "Morning", "artist": "Edvard Grieg - Adapted", "file": "morning.mid", "practice": False},
+    6: {"name": "My Heart Will Go On", "artist": "Celine Dion", "file": "My_Heart_Will_Go_On_Piano.mid", "practice": False},
+    7: {"name": "Ode to Joy", "artist": "Ludwig van Beethoven - Adapted", "file": "Ode_to_joy.mid"},
+    8: {"name": "Peter Peter Pumpkin Eater", "artist": "Nursery Rhyme (Easy)", "file": "PeterPeter.mid"},
+    9: {"name": "Piano Polka", "artist": "Kevin Olson", "file": "piano_polka.mid", "practice": False},
+    10: {"name": "Pure Imagination", "artist": "Leslie Bricusse & Anthony Newley", "file": "Pure_Imagination_Piano_Solo_-_Beginner.mid", "practice": False},
+    11: {"name": "Silent Night", "artist": "Traditional", "file": "silent_night.mid", "practice": False},
+    12: {"name": "The Wishing Well", "artist": "Nursery Rhyme (Easy)", "file": "TheWishingWell.mid", "practice": False},
+    13: {"name": "Twinkle Twinkle Little Star", "artist": "Nursery Rhyme", "file": "twinkle_twinkle.mid"},
+    14: {"name": "Yankee Doodle", "artist": "Mary Leaf", "file": "Yankee_Doodle.mid"},
+    15: {"name": "You've Got A Friend In Me", "artist": "Randy Newman", "file": "You_ve_Got_A_Friend_In_Me_Easy_Piano_Sheet_Music.mid", "practice": False},
+    16: {"name": "7 Years", "artist": "Lukas Graham", "file": "7_Years.mid"},
+    17: {"name": "A Whole New World", "artist": "Aladdin", "file": "whole_new_world.mid"},
+    18: {"name": "All of Me", "artist": "John Legend", "file": "All_of_Me_John_Legend.mid"},
+    20: {"name": "Can't Help Falling in Love", "artist": "Elvis Presley", "file": "Cant_Help_Falling_In_Love.mid"},
+    21: {"name": "Captured Memories", "artist": "Zelda: Breath of the Wild", "file": "Zelda_Breath_of_the_Wild_-_Captured_Memories_piano.mid"},
+    22: {"name": "Christmas Don't Be Late", "artist": "The Chipmunks", "file": "christmas_dont_be_late.mid"},
+    23: {"name": "Clark (Minecraft)", "artist": "C418", "file": "clark_minecraft.mid"},
+    24: {"name": "Cornfield Chase (Interstellar)", "artist": "Hans Zimmer", "file": "cornfield_chase.mid"},
+    25: {"name": "Counting Stars", "artist": "OneRepublic", "file": "Counting_Stars_longer.mid"},
+    26: {"name": "Dancing in the Moonlight", "artist": "Toploader", "file": "Dancing_in_the_Moonlight_-_Toploader_-_Easy_Piano.mid"},
+    27: {"name": "Dry Hands", "artist": "C418", "file": "Dry_Hands.mid"},
+    28: {"name": "Evil Morty's Theme", "artist": "Rick and Morty", "file": "Evil_Morty_s_ThemeFor_the_Damaged_Coda_-_Easy_Piano.mid"},
+    29: {"name": "Game of Thrones Theme", "artist": "Ramin Djawadi", "file": "game_of_thrones.mid"},
+    30: {"name": "Glimpse of Us", "artist": "Joji", "file": "Glimpse_of_Us__Joji_Piano_Accompaniment.mid"},
+    31: {"name": "Hallelujah", "artist": "Leonard Cohen", "file": "hallelujah.mid"},
+    32: {"name": "Hanachirusato", "artist": "Genshin Impact", "file": "Genshin_Impact_-_Hanachirusato_Piano.mid"},
+    33: {"name": "Heart and Soul", "artist": "Hoagy Carmichael", "file": "Heart_and_Soul_Piano.mid"},
+    34: {"name": "He's a Pirate", "artist": "Klaus Badelt", "file": "hes_a_pirate.mid"},
+    35: {"name": "How To Save A Life", "artist": "The Fray", "file": "How_To_Save_A_Life_-_The_Fray.mid"},
+    36: {"name": "I'm Still Standing", "artist": "Elton John", "file": "still_standing.mid"},
+    37: {"name": "Interstellar Theme", "artist": "Hans Zimmer", "file": "Interstellar_Theme_Easy_Piano.mid"},
+    38: {"name": "Jurassic Park Theme", "artist": "John Williams", "file": "Jurassic_Park_Theme_for_Beginner_EASY_Piano.mid"},
+    39: {"name": "La Vie En Rose", "artist": "Édith Piaf", "file": "La_vie_en_rose_Piano_Intermediate.mid"},
+    40: {"name": "Let Her Go", "artist": "Passenger", "file": "Let_Her_Go_Passenger.mid"},
+    41: {"name": "Love Yourself", "artist": "Justin Bieber", "file": "Love_Yourself.mid"},
+    42: {"name": "Mad at Disney", "artist": "salem ilese", "file": "mad_at_disney_copy.mid"},
+    43: {"name": "Married Life", "artist": "Michael Giacchino (Up)", "file": "married_life.mid"},
+    44: {"name": "Megalovania Theme from Undertale", "artist": "Toby Fox", "file": "Megalovania_Theme_from_Undertale__easy_piano.mid"},
+    45: {"name": "Minuet in G Minor", "artist": "Bach", "file": "Bach_Minuet_in_G_Minor.mid"},
+    46: {"name": "Moon River", "artist": "Henry Mancini", "file": "Moon_River(1).mid"},
+    47: {"name": "My Heart Will Go On", "artist": "Celine Dion", "file": "heart_will_go_on.mid"},
+    48: {"name": "No Time to Die", "artist": "Billie Eilish", "file": "No_Time_to_Die_Piano_-_James_Bond_Theme_-_Billie_Eilish_with_Lyrics.mid"},
+    49: {"name": "One Last Time", "artist": "Ariana Grande", "file": "One_Last_Time.mid"},
+    50: {"name": "Perfect", "artist": "Ed Sheeran", "file": "Perfect_-_Ed_Sheeran_PIANO.mid"},
+    51: {"name": "Pirates of the Caribbean", "artist": "Klaus Badelt", "file": "Pirates_of_the_Caribbean.mid"},
+    52: {"name": "Piano Man", "artist": "Billy Joel", "file": "piano_man.mid"},
+    54: {"name": "SAD!", "artist": "XXXTENTACION", "file": "SAD_-_XXXTENTACION_Piano.mid"},
+    55: {"name": "Sadness and Sorrow", "artist": "Naruto", "file": "Sadness_and_Sorrow_for_PIANO_SOLO.mid"},
+    56: {"name": "See You Again", "artist": "Wiz Khalifa ft. Charlie Puth", "file": "See_You_Again.mid"},
+    57: {"name": "Set Fire To The Rain", "artist": "Adele", "file": "Set_Fire_To_The_Rain.mid"},
+    58: {"name": "Snowman", "artist": "Sia", "file": "Sia_-_Snowman.mid"},
+    59: {"name": "Someone Like You", "artist": "Adele", "file": "Someone_Like_You_easy_piano.mid"},
+    60: {"name": "Somewhere Over the Rainbow", "artist": "Harold Arlen", "file": "Somewhere_over_the_Rainbow.mid"},
+    61: {"name": "Song for Beginners", "artist": "Nikodem Kulczyk", "file": "beginner.mid"},
+    63: {"name": "Super Mario Theme Song", "artist": "Koji Kondo", "file": "Super_Mario_Theme_Song.mid"},
+    64: {"name": "Sweden (Minecraft)", "artist": "C418", "file": "sweden_minecraft.mid"},
+    66: {"name": "The Legend of Zelda Main Theme", "artist": "Nintendo", "file": "The_Legend_of_Zelda_Main_Theme_Easy.mid"},
+    67: {"name": "The Most Wonderful Time of the Year", "artist": "Andy Williams", "file": "The_Most_Wonderful_Time_of_the_Year_-_easy_piano_C_maj.mid"},
+    68: {"name": "Uptown Girl", "artist": "Billy Joel", "file": "Uptown_Girl(1).mid"},
+    69: {"name": "Uptown Girl", "artist": "Westlife", "file": "uptown_girl.mid"},
+    70: {"name": "Viva la Vida", "artist": "Coldplay", "file": "Viva_la_vida.mid"},
+    71: {"name": "Wet Hands", "artist": "C418", "file": "Wet_Hands_Minecraft.mid"},
+    72: {"name": "Zelda's Lullaby", "artist": "The Legend of Zelda: Ocarina of Time", "file": "Zeldas_Lullaby_The_Legend_of_Zelda_Ocarina_of_Time_-_Easy_version.mid"},
+    75: {"name": "20th Century Fox Fanfare", "artist": "Unknown", "file": "20th_Century_Fox_Fanfare_Simple_Piano.mid"},
+    76: {"name": "A Cruel Angel's Thesis - Neon Genesis Evangelion", "artist": "Unknown", "file": "A_Cruel_Angels_Thesis_-_Neon_Genesis_Evangelion_Piano_Cover.mid"},
+    77: {"name": "All the World's a Stage", "artist": "Genshin Impact", "file": "genshin.mid"},
+    701: {"name": "All of Me", "artist": "John Legend", "file": "All_of_me_-_John_Legend.mid"},
+    78: {"name": "Autumn Leaves", "artist": "Jazz Piano", "file": "Autumn_Leaves_Jazz_Piano.mid"},
+    79: {"name": "Bach Toccata and Fugue in D Minor", "artist": "Bach", "file": "Bach_Toccata_and_Fugue_in_D_Minor_Piano_solo.mid"},
+    80: {"name": "Ballad of the Wind Fish", "artist": "The Legend of Zelda", "file": "The_Legend_of_Zelda_Links_Awakening-Ballad_of_the_Wind_Fish_Piano.mid"},
+    81: {"name": "Beethoven Symphony No. 5 1st movement", "artist": "Beethoven", "file": "Beethoven_Symphony_No._5_1st_movement_Piano_solo.mid"},
+    82: {"name": "Bluebird", "artist": "Naruto", "file": "bluebird_naruto.mid"},
+    83: {"name": "Canon in D", "artist": "Unknown", "file": "Canon_in_D.mid"},
+    84: {"name": "Cowboy Bebop TANK", "artist": "Unknown", "file": "Cowboy_Bebop_TANK.mid"},
+    85: {"name": "Dancing in the Moonlight", "artist": "Toploader", "file": "Dancing_in_the_Moonlight.mid"},
+    86: {"name": "Deference for Darkness", "artist": "Halo 3 ODST", "file": "Deference_for_Darkness_from_Halo_3_ODST_for_Piano.mid"},
+    87: {"name": "Don't Stop Believing", "artist": "Journey", "file": "Dont_Stop_Believing_Piano_Guitar_Vocals.mid"},
+    88: {"name": "Fallen Down", "artist": "Undertale", "file": "Fallen_Down_-_Undertale_Piano_Solo.mid"},
+    89: {"name": "From the New World - 4th Movement", "artist": "Unknown", "file": "From_the_New_World_-_4th_Movement.mid"},
+    90: {"name": "Golden Hour", "artist": "JVKE", "file": "Golden_HOUR.mid"},
+    91: {"name": "Good News", "artist": "Mac Miller", "file": "Good_News_-_Mac_Miller_-_Easy_piano.mid"},
+    92: {"name": "Gravity Falls Opening", "artist": "Intermediate Piano Solo", "file": "Gravity_Falls_Opening_-_Intermediate_Piano_Solo.mid"},
+    93: {"name": "Great Fairy Fountain", "artist": "The Legend of Zelda", "file": "The_Legend_of_Zelda_Great_Fairy_Fountain_Piano_Cover.mid"},
+    94: {"name": "Gusty Garden Galaxy", "artist": "Super Mario Galaxy", "file": "Gusty_Garden_Galaxy_From_Super_Mario_Galaxy_for_piano.mid"},
+    95: {"name": "Here With Me", "artist": "D4vd", "file": "here_with_me.mid"},
+    96: {"name": "idontwannabeyouanymore", "artist": "Billie Eilish", "file": "idontwannabeyouanymore.mid"},
+    97: {"name": "Isn't She Lovely", "artist": "Unknown", "file": "Isnt_She_Lovely.mid"},
+    98: {"name": "Jojo's Bizarre Adventure G", "artist": "Unknown", "file": "jojo.mid"},
+    99: {"name": "Jump Up, Super Star! (Super Mario Odyssey)", "artist": "Unknown", "file": "Jump_Up_Super_Star_-Super_Mario_Odyssey-.mid"},
+    100: {"name": "Kick Back (TV Size)", "artist": "Unknown", "file": "Kick_Back__TV_Size.mid"},
+    101: {"name": "Littleroot Town", "artist": "Pokemon ORAS", "file": "Littleroot_Town_-_Pokmon_ORAS_for_piano.mid"},
+    102: {"name": "Lost in Paradise", "artist": "Unknown", "file": "Lost_in_Paradise.mid"},
+    103: {"name": "Main Theme From Interstellar", "artist": "Hans Zimmer", "file": "Main_Theme_From_Interstellar__Hans_Zimmer_Piano.mid"},
+    105: {"name": "Merry Go Round of Life", "artist": "Howl's Moving Castle", "file": "Merry_Go_Round_of_Life_Howls_Moving_Castle_Piano_Tutorial_.mid"},
+    106: {"name": "Mii Channel", "artist": "Nintendo", "file": "Mii_Channel_piano.mscz.mid"},
+    107: {"name": "Moon River", "artist": "Johnny Mercer and Henry Mancini", "file": "moon_river.mid"},
+    108: {"name": "My Heart Will Go On", "artist": "Unknown", "file": "MY_HEART_WILL_GO_ON.mid"},
+    109: {"name": "Never See Me Again", "artist": "Kanye West", "file": "Never_See_Me_Again__Kanye_West.mid"},
+    110: {"name": "Number One (Thousand Year Blood War ver.)", "artist": "Bleach OST", "file": "number_one_bleach.mid"},
+    111: {"name": "Ode to Joy Easy Variation", "artist": "Unknown", "file": "Ode_to_Joy_Easy_variation.mid"},
+    112: {"name": "One Piece - Overtaken", "artist": "Unknown", "file": "One_Piece_-_Overtaken.mid"},
+    113: {"name": "Perfect", "artist": "Ed Sheeran", "file": "Perfect_-_Ed_Sheeran_PIANO.mid"},
+    114: {"name": "Piano Sonata No. 11 K. 331 3rd Movement Rondo alla Turca", "artist": "Mozart", "file": "Piano_Sonata_No._11_K._331_3rd_Movement_Rondo_alla_Turca.mid"},
+    115: {"name": "Pokemon Red and Blue Title Theme", "artist": "Pokemon", "file": "Pokemon_Red_and_Blue_-_Title_Theme_for_piano.mid"},
+    116: {"name": "Pokemon Theme Song", "artist": "Pokemon", "file": "Pokemon_Theme_Song_piano.mid"},
+    117: {"name": "Promenade I", "artist": "Unknown", "file": "Promenade_I.mid"},
+    118: {"name": "River Flows in You", "artist": "Yiruma", "file": "River_Flows_in_You_-_Yiruma_-_10th_Anniversary_Version_Piano.mid"},
+    119: {"name": "Runaway", "artist": "Kanye West", "file": "runaway.mid"},
+    700: {"name": 'Running up that hill', "artist": 'Kate Bush', "file": 'Running_Up_That_Hill__A_Deal_With_God__Piano_Solo.mid'},
+    120: {"name": "September", "artist": "Earth, Wind & Fire", "file": "september.mid"},
+    121: {"name": "Set Fire to the Rain", "artist": "Adele", "file": "52__Adele__Set_Fire_to_the_Rain.mid"},
+    122: {"name": "Skyrim Medley", "artist": "The Elder Scrolls V: Skyrim", "file": "Skyrim_Medley-_Dragonborn_The_Dragonborn_Comes_From_Past_to_Present_Far_Horizons.mid"},
+    123: {"name": "Somewhere Over the Rainbow", "artist": "Harold Arlen", "file": "Somewhere_over_the_Rainbow.mid"},
+    124: {"name": "Song of Storms", "artist": "Koji Kondo", "file": "Song_of_Storms_-_The_Legend_of_Zelda_Ocarine_of_Time__Koji_Kondo_-_Accordion_Solo.mid"},
+    125: {"name": "Super Mario Bros. Main Theme", "artist": "Nintendo", "file": "Super_Mario_Bros.__Main_Theme.mid"},
+    126: {"name": "The Legend of Zelda Main Theme", "artist": "Nintendo", "file": "The_Legend_of_Zelda_Main_Theme_Easy.mid"},
+    127: {"name": "The Most Wonderful Time of the Year", "artist": "Andy Williams", "file": "The_Most_Wonderful_Time_of_the_Year_-_easy_piano_C_maj.mid"},
+    128: {"name": "The Observatory", "artist": "Super Mario Galaxy", "file": "The_Observatory_-_Super_Mario_Galaxy.mid"},
+    129: {"name": "The Pink Panther Theme", "artist": "Henry Mancini", "file": "The_Pink_Panther_Theme_-_Henry_Mancini_-_Piano_version.mid"},
+    130: {"name": "Undertale", "artist": "Undertale", "file": "Undertale_Undertale_Piano.mid"},
+    131: {"name": "Verdanturf Town", "artist": "Pokemon ORAS", "file": "Verdanturf_Town_-_Pokemon_ORAS_for_piano.mid"},
+    132: {"name": "Wii Sports Theme", "artist": "Nintendo", "file": "Wii_Sports_Theme_piano.mid"},
+    133: {"name": "You've Got A Friend In Me", "artist": "Randy Newman", "file": "friend_in_me.mid"},
+    134: {"name": "Zoltraak - Frieren OST", "artist": "Unknown", "file": "Zoltraak_-_Frieren_OST.mid"}
 }
 
 def csv_to_song_database(csv_filename):
@@ -190,7 +192,23 @@ def csv_to_song_database(csv_filename):
             song_id += 1
     return song_database
 
-csv_filename = 'maestro-v3_songs.csv' 
+def rebuild_song_cache(song_database):
+    """
+    Clears the song cache and recompiles every song in the song database into it, in parallel,
+    so the first play of each song after an update starts without parsing.
+    See song_cache.build_song_library.
+
+    Parameters
+    ----------
+    song_database : dict
+        The song database whose files should be cached. Paths are relative to the current directory.
+    """
+    song_files = sorted({song_info["file"] for song_info in song_database.values()})
+    build_song_library(song_files, force=True)
+
+#Absolute, because this runs again on import in every worker process (see song_analysis.py and song_cache.py),
+#and the workers may start after the game has changed into the songs directory.
+csv_filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'maestro-v3_songs.csv')
 jukebox_song_database = csv_to_song_database(csv_filename)
 
 #jukebox_song_database[1] = {"name": "test_song", "artist": "NULL", "file": "rush_e.mid"}
@@ -387,6 +405,9 @@ class WalkingPianoGame(pyglet.window.Window):
         
         self.game = None
         
+        # Fill in difficulty/players/practice for songs that don't specify them. Cached after the first run.
+        annotate_song_database(song_database)
+        
         self.setup_menu()
         self.setup_song_selection()
         self.setup_jukebox_song_selection()
@@ -618,9 +639,8 @@ class WalkingPianoGame(pyglet.window.Window):
         if self.selected_game_mode == 'Practice':
             # Filter for 'Easy' songs for Practice mode regardless of player count
             for song_id, song_info in song_database.items():
-                if song_info['difficulty'] == 'Easy':
-                    if song_info['file'] not in ['piano_polka.mid','TheWishingWell.mid','A_Lion.mid',"morning.mid","A_Happy_Treble_Melody.mid","A_Happy_Bass_Melody.mid","You_ve_Got_A_Friend_In_Me_Easy_Piano_Sheet_Music.mid", "silent_night.mid", "Pure_Imagination_Piano_Solo_-_Beginner.mid", "My_Heart_Will_Go_On_Piano.mid"]:
-                        filtered_songs[song_id] = song_info
+                if song_info['difficulty'] == 'Easy' and song_info['practice']:
+                    filtered_songs[song_id] = song_info
                     
         elif self.selected_game_mode == 'Challenge':
             # In Challenge Mode, filter songs based on the number of players
@@ -993,6 +1013,10 @@ if __name__ == "__main__":
     Initializes the game and sets up the signal handler for graceful termination.
     """
 
+    parser = argparse.ArgumentParser(description="Walking Piano")
+    parser.add_argument('--rebuild-cache', action='store_true', help="Clear the song cache and recompile every song before starting.")
+    args = parser.parse_args()
+
     # Added for easily terminating the program with CTRL+C...
     def signal_handler(sig, frame):
         # Force all threads to exit immediately
@@ -1007,6 +1031,12 @@ if __name__ == "__main__":
     os.chdir(os.path.dirname(__file__))
     #Change to songs directory for access of song files within game.
     os.chdir("songs")
+    
+    if args.rebuild_cache:
+        rebuild_song_cache(song_database)
+
+    #Read per-song settings now, so a mistake in song_metadata.csv stops the game here rather than mid-menu.
+    init_song_metadata()
 
     game = WalkingPianoGame(width=1920, height=1080, resizable=False, caption="Walking Piano", style=pyglet.window.Window.WINDOW_STYLE_BORDERLESS)
     #game = WalkingPianoGame(fullscreen=True, resizable=False, caption="Walking Piano")
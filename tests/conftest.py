@@ -0,0 +1,10 @@
+"""
+Shared setup for the tests: the game's modules live in the project root, not in a package.
+"""
+
+import os
+import sys
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
@@ -0,0 +1,30 @@
+"""
+Tests that play songs through the whole game with headless_game.py.
+"""
+
+import os
+import pytest
+from conftest import PROJECT_DIR
+from headless_game import HeadlessWindow, run_headless
+
+SONGS_DIR = os.path.join(PROJECT_DIR, 'songs')
+
+
+@pytest.fixture(scope='module')
+def window():
+    window = HeadlessWindow()
+    yield window
+    window.close()
+
+
+@pytest.mark.parametrize("song_file, score", [
+    ("mary_lamb.mid", 3650),
+    ("twinkle_twinkle.mid", 5780),
+])
+def test_autoplay_scores(window, song_file, score):
+    # The simulated clock makes every run the same, so autoplay always scores exactly this.
+    results = run_headless(window, os.path.join(SONGS_DIR, song_file))
+
+    assert "error" not in results
+    assert results["finished"]
+    assert results["score"] == score
@@ -0,0 +1,115 @@
+"""
+Tests for midi_processor.py.
+"""
+
+import struct
+import numpy as np
+import pytest
+from midi_processor import (TempoMap, NOTE_DTYPE, MIN_NOTE_SECONDS, PROCESSOR_VERSION, WPSONG_HEADER, _resolve_overlaps,
+                            write_wpsong, load_wpsong)
+
+
+def make_timeline(notes):
+    """
+    Returns a compiled timeline from (onset, duration, note, track, channel) tuples.
+    """
+    timeline = np.zeros(len(notes), dtype=NOTE_DTYPE)
+    for record, (onset, duration, note, track, channel) in zip(timeline, notes):
+        record['onset_seconds'] = onset
+        record['duration_seconds'] = duration
+        record['note'] = note
+        record['track'] = track
+        record['channel'] = channel
+        record['velocity'] = 64
+    return timeline
+
+
+def test_tempo_map_across_tempo_changes():
+    # 120 BPM for the first beat, then 60 BPM.
+    tempo_map = TempoMap([0, 480], [500000, 1000000], 480)
+
+    assert tempo_map.ticks_to_seconds(240) == pytest.approx(0.25)
+    assert tempo_map.ticks_to_seconds(480) == pytest.approx(0.5)
+    assert tempo_map.ticks_to_seconds(960) == pytest.approx(1.5)
+    np.testing.assert_allclose(tempo_map.ticks_to_seconds(np.array([0, 720, 1440])), [0.0, 1.0, 2.5])
+
+    assert tempo_map.seconds_to_ticks(1.5) == pytest.approx(960)
+    np.testing.assert_allclose(tempo_map.seconds_to_ticks(tempo_map.ticks_to_seconds(np.arange(0, 2000, 37))),
+                               np.arange(0, 2000, 37))
+
+
+def test_tempo_map_defaults_to_120_bpm_before_the_first_tempo():
+    tempo_map = TempoMap([960], [1000000], 480)
+
+    assert tempo_map.ticks_to_seconds(480) == pytest.approx(0.5)
+    assert tempo_map.ticks_to_seconds(1440) == pytest.approx(2.0)
+
+
+def test_tempo_map_last_tempo_on_a_tick_wins():
+    tempo_map = TempoMap([0, 0], [500000, 1000000], 480)
+
+    assert tempo_map.ticks_to_seconds(480) == pytest.approx(1.0)
+
+
+def test_resolve_overlaps_cuts_notes_at_the_next_onset():
+    timeline = _resolve_overlaps(make_timeline([(0.0, 2.0, 60, 0, 0), (1.0, 1.0, 60, 0, 0)]))
+
+    np.testing.assert_allclose(timeline['onset_seconds'], [0.0, 1.0])
+    np.testing.assert_allclose(timeline['duration_seconds'], [1.0, 1.0])
+
+
+def test_resolve_overlaps_merges_notes_that_start_together():
+    timeline = _resolve_overlaps(make_timeline([(0.0, 0.5, 60, 0, 0), (0.0, 1.5, 60, 0, 0)]))
+
+    assert len(timeline) == 1
+    assert timeline['duration_seconds'][0] == pytest.approx(1.5)
+
+
+def test_resolve_overlaps_lengthens_short_notes_but_not_past_the_next():
+    timeline = _resolve_overlaps(make_timeline([(0.0, 0.0, 60, 0, 0), (1.0, 0.0, 60, 0, 0), (1.01, 0.5, 60, 0, 0)]))
+
+    np.testing.assert_allclose(timeline['duration_seconds'], [MIN_NOTE_SECONDS, 0.01, 0.5])
+
+
+def test_resolve_overlaps_keeps_other_keys_apart():
+    # Same pitch on another track or channel, and another pitch, are separate keys.
+    timeline = _resolve_overlaps(make_timeline([(0.0, 2.0, 60, 0, 0), (1.0, 1.0, 60, 1, 0),
+                                                (1.0, 1.0, 60, 0, 1), (1.0, 1.0, 62, 0, 0)]))
+
+    assert len(timeline) == 4
+    np.testing.assert_allclose(np.sort(timeline['duration_seconds']), [1.0, 1.0, 1.0, 2.0])
+
+
+def test_wpsong_round_trip(tmp_path):
+    tempo_map = TempoMap([0, 480], [500000, 1000000], 480)
+    timeline = make_timeline([(0.0, 0.5, 60, 0, 0), (1.0, 0.25, 64, 1, 2)])
+    path = str(tmp_path / "song.wpsong")
+    write_wpsong(path, tempo_map, timeline)
+
+    loaded_tempo_map, loaded_timeline = load_wpsong(path)
+    np.testing.assert_array_equal(loaded_tempo_map.breakpoint_ticks, tempo_map.breakpoint_ticks)
+    np.testing.assert_array_equal(loaded_tempo_map.tempos, tempo_map.tempos)
+    assert loaded_tempo_map.ticks_per_beat == 480
+    assert loaded_timeline.tolist() == timeline.tolist()
+
+
+def test_wpsong_from_another_processor_version_is_rejected(tmp_path):
+    path = str(tmp_path / "song.wpsong")
+    write_wpsong(path, TempoMap([], [], 480), make_timeline([(0.0, 0.5, 60, 0, 0)]))
+
+    with open(path, 'r+b') as song_file:
+        header = list(WPSONG_HEADER.unpack(song_file.read(WPSONG_HEADER.size)))
+        header[-1] = PROCESSOR_VERSION - 1
+        song_file.seek(0)
+        song_file.write(WPSONG_HEADER.pack(*header))
+
+    with pytest.raises(OSError, match="processor version"):
+        load_wpsong(path)
+
+
+def test_wpsong_rejects_other_files(tmp_path):
+    path = tmp_path / "song.wpsong"
+    path.write_bytes(struct.pack('<32s', b'MThd'))
+
+    with pytest.raises(OSError):
+        load_wpsong(str(path))
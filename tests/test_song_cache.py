@@ -0,0 +1,64 @@
+"""
+Tests for song_cache.py.
+"""
+
+import os
+import numpy as np
+from midi_processor import NOTE_DTYPE
+from song_cache import SongCache
+
+
+def fill(song_cache, keys):
+    """
+    Stores one timeline per key, oldest first, and returns the size of one entry in bytes.
+    """
+    for age, key in enumerate(keys):
+        song_cache.store(key, np.zeros(100, dtype=NOTE_DTYPE))
+        path = song_cache.entry_path(key)
+        os.utime(path, ns=(age * 10**9, age * 10**9))
+    return os.path.getsize(song_cache.entry_path(keys[0]))
+
+
+def cached_keys(song_cache):
+    return sorted(os.path.basename(path)[:-len('.npy')] for path, _ in song_cache.entries())
+
+
+def test_evict_removes_least_recently_used(tmp_path):
+    song_cache = SongCache(str(tmp_path), max_bytes=None)
+    size = fill(song_cache, ['a', 'b', 'c'])
+
+    song_cache.max_bytes = 2 * size
+    song_cache.load('a')  # Now the most recently used
+    song_cache.evict()
+
+    assert cached_keys(song_cache) == ['a', 'c']
+
+
+def test_store_never_evicts_the_entry_it_wrote(tmp_path):
+    song_cache = SongCache(str(tmp_path), max_bytes=None)
+    size = fill(song_cache, ['a', 'b'])
+
+    # Too small for even one entry: everything else goes, the new entry stays.
+    song_cache.max_bytes = size // 2
+    song_cache.store('c', np.zeros(100, dtype=NOTE_DTYPE))
+
+    assert cached_keys(song_cache) == ['c']
+
+
+def test_evict_skips_entries_that_cannot_be_removed(tmp_path, monkeypatch):
+    song_cache = SongCache(str(tmp_path), max_bytes=None)
+    size = fill(song_cache, ['a', 'b', 'c'])
+    locked = song_cache.entry_path('a')
+
+    remove = os.remove
+    def remove_unless_locked(path):
+        if path == locked:
+            raise PermissionError(path)  # Like a memory-mapped file on Windows
+        remove(path)
+    monkeypatch.setattr(os, 'remove', remove_unless_locked)
+
+    song_cache.max_bytes = 2 * size
+    song_cache.evict()
+
+    # 'a' could not be removed, so it does not count as freed and 'b' goes instead.
+    assert cached_keys(song_cache) == ['a', 'c']
@@ -0,0 +1,144 @@
+"""
+Tests for song_clock.py.
+"""
+
+import numpy as np
+import pytest
+from midi_processor import NOTE_DTYPE
+from song_clock import SimulatedTime, GameClock, SongClock, NoteDispatcher, MIN_PLAYBACK_RATE, MAX_PLAYBACK_RATE
+
+SECOND = 1_000_000_000  # In nanoseconds
+
+
+def make_notes(onsets, note=60, duration=0.05):
+    """
+    Returns a compiled note array of one pitch, with the given onsets.
+    """
+    notes = np.zeros(len(onsets), dtype=NOTE_DTYPE)
+    notes['onset_seconds'] = onsets
+    notes['duration_seconds'] = duration
+    notes['note'] = note
+    notes['velocity'] = 64
+    return notes
+
+
+def test_find_note_trill_matches_the_note_being_played():
+    # A press on a note's onset must find that note, not one further ahead that is still within the early window.
+    dispatcher = NoteDispatcher([(make_notes([1.0, 1.1, 1.2, 1.3, 1.4]), 1)])
+
+    assert dispatcher.find_note(60, 1.0, 0.467) == 0
+    assert dispatcher.find_note(60, 1.12, 0.467) == 1
+    assert dispatcher.find_note(60, 1.38, 0.467) == 4
+
+
+def test_find_note_sounding_and_early():
+    dispatcher = NoteDispatcher([(make_notes([1.0, 3.0], duration=0.5), 1)])
+
+    assert dispatcher.find_note(60, 1.4, 0.2) == 0  # Still sounding
+    assert dispatcher.find_note(60, 2.85, 0.2) == 1  # Early, within reach
+    assert dispatcher.find_note(60, 2.0, 0.2) == -1  # Between notes
+    assert dispatcher.find_note(61, 1.0, 0.2) == -1  # No note of that pitch
+    assert dispatcher.find_note(200, 1.0, 0.2) == -1
+
+
+def test_find_note_overlapping_players():
+    # Player 2's long note overlaps player 1's short one of the same pitch.
+    dispatcher = NoteDispatcher([(make_notes([1.0], duration=0.1), 1), (make_notes([0.5], duration=2.0), 2)])
+
+    assert dispatcher.players[dispatcher.find_note(60, 1.0, 0.2)] == 1
+    assert dispatcher.players[dispatcher.find_note(60, 2.0, 0.2)] == 2
+
+
+def test_due_hands_out_each_note_once():
+    dispatcher = NoteDispatcher([(make_notes([0.5, 1.0, 1.0, 2.0]), 1)])
+
+    assert dispatcher.due(0.4) == []
+    assert [onset for onset, *_ in dispatcher.due(1.0)] == [0.5, 1.0, 1.0]
+    assert dispatcher.due(1.5) == []
+    assert [onset for onset, *_ in dispatcher.due(5.0)] == [2.0]
+    assert dispatcher.finished()
+
+
+def test_due_merges_players_in_onset_order():
+    dispatcher = NoteDispatcher([(make_notes([1.0, 3.0], note=60), 1), (make_notes([2.0], note=48), 2)])
+
+    assert [(note, player) for _, note, _, _, player in dispatcher.due(3.0)] == [(60, 1), (48, 2), (60, 1)]
+
+
+def test_dispatcher_seek():
+    dispatcher = NoteDispatcher([(make_notes([1.0, 2.0, 3.0]), 1)])
+
+    dispatcher.seek(2.0)
+    assert [onset for onset, *_ in dispatcher.due(10.0)] == [3.0]
+
+    dispatcher.seek(0.0)
+    assert [onset for onset, *_ in dispatcher.due(2.5)] == [1.0, 2.0]
+
+
+def make_song_clock():
+    """
+    Returns a started SongClock on a simulated clock, and the simulated time driving it.
+    """
+    simulated_time = SimulatedTime()
+    song_clock = SongClock(GameClock(simulated_time))
+    song_clock.start()
+    return song_clock, simulated_time
+
+
+def test_song_clock_pause_and_resume():
+    song_clock, simulated_time = make_song_clock()
+
+    simulated_time.advance(SECOND)
+    song_clock.pause()
+    simulated_time.advance(5 * SECOND)
+    assert song_clock.time == pytest.approx(1.0)
+
+    song_clock.resume()
+    simulated_time.advance(SECOND)
+    assert song_clock.time == pytest.approx(2.0)
+
+
+def test_song_clock_rate_change_does_not_jump():
+    song_clock, simulated_time = make_song_clock()
+
+    simulated_time.advance(2 * SECOND)
+    song_clock.set_rate(0.5)
+    assert song_clock.time == pytest.approx(2.0)
+
+    simulated_time.advance(2 * SECOND)
+    assert song_clock.time == pytest.approx(3.0)
+
+    assert song_clock.set_rate(10.0) == MAX_PLAYBACK_RATE
+    assert song_clock.set_rate(0.0) == MIN_PLAYBACK_RATE
+
+
+def test_song_clock_rate_change_while_paused():
+    song_clock, simulated_time = make_song_clock()
+
+    simulated_time.advance(SECOND)
+    song_clock.pause()
+    simulated_time.advance(SECOND)
+    song_clock.set_rate(2.0)
+    assert song_clock.time == pytest.approx(1.0)
+
+    song_clock.resume()
+    simulated_time.advance(SECOND)
+    assert song_clock.time == pytest.approx(3.0)
+
+
+def test_song_clock_seek():
+    song_clock, simulated_time = make_song_clock()
+    song_clock.set_rate(2.0)
+
+    simulated_time.advance(SECOND)
+    song_clock.seek(10.0)
+    assert song_clock.time == pytest.approx(10.0)
+
+    simulated_time.advance(SECOND)
+    assert song_clock.time == pytest.approx(12.0)
+
+    song_clock.pause()
+    song_clock.seek(1.0)
+    simulated_time.advance(SECOND)
+    assert song_clock.paused
+    assert song_clock.time == pytest.approx(1.0)
@@ -0,0 +1,372 @@
+"""
+timing_harness.py
+=====================
+
+This file measures how accurately our schedulers send a song's MIDI events on time.
+
+Each scheduler plays the first seconds of a song through the game's own playback code into a RecordingOutput, a fake
+MIDI output port that timestamps every message with time.perf_counter as it is sent, and reports when each message was
+due. Comparing the two gives each event's lateness, which is summarized as percentiles (p50/p99/max), and as drift: how much later events get over the length
+of the song. Every scheduler is run once on an idle machine and once with busy worker processes loading every CPU,
+to show how each holds up under load.
+
+Schedulers (see SCHEDULERS):
+    play_track          MIDIProcessor.play_track: sleeps for each relative delay, one thread per track.
+    jukebox             midi_processor.play_event_stream, JukeBox mode's player, fed by a MIDIStreamReader.
+    dispatcher          The game's SongClock and NoteDispatcher.due, polled once per 60 Hz frame as update_rectangles does
+                        (note_ons only; the game sends nothing for note ends).
+    playback_engine     midi_processor.PlaybackEngine: absolute deadlines, coarse sleep then spin, batched, one thread.
+
+    python timing_harness.py [song] [--seconds 20] [--load N] [--schedulers NAME ...] [--json report.json]
+
+Classes:
+    RecordingOutput
+    HarnessSong
+
+Functions:
+    load_song
+    run_scheduler
+    summarize_lateness
+    main
+
+Authors: Devin Martin and Wesley Jake Anding
+"""
+
+import json
+import multiprocessing
+import os
+import threading
+import time
+from collections import defaultdict, deque, namedtuple
+import mido
+import numpy as np
+from midi_processor import MIDIProcessor, MIDIStreamReader, PlaybackEngine, play_event_stream
+from song_clock import GameClock, SongClock, NoteDispatcher
+
+FRAME_SECONDS = 1 / 60  # Frame period of the dispatcher scheduler's frame loop
+
+
+class RecordingOutput(mido.ports.BaseOutput):
+    """
+    A fake MIDI output port that records when each message is sent instead of playing it.
+    Safe to send to from several threads at once.
+
+    Attributes
+    ----------
+    sent : list
+        (perf_counter time, message) for every message sent, in order.
+    """
+
+    def __init__(self):
+        """
+        Initializes the RecordingOutput.
+        """
+        super().__init__()
+        self.sent = []
+
+    def send(self, msg):
+        """
+        Records the message with the current time, taken before mido's send would copy it.
+
+        Parameters
+        ----------
+        msg : mido.Message
+            The message being sent.
+        """
+        now = time.perf_counter()
+        with self._lock:
+            self.sent.append((now, msg))
+
+
+# A song as the schedulers play it: the file, how many seconds of it to play, its MIDIProcessor, its note events per
+# track (message, delay) as play_track expects them, and its compiled timeline (see MIDIProcessor.compile_timeline).
+HarnessSong = namedtuple('HarnessSong', ['file_path', 'max_seconds', 'processor', 'tracks', 'timeline'])
+
+
+def load_song(file_path, max_seconds=None):
+    """
+    Reads a song for the schedulers.
+
+    Parameters
+    ----------
+    file_path : str
+        The path to the MIDI file.
+    max_seconds : float, optional
+        Only play events due in the first max_seconds of the song (default is the whole song).
+
+    Returns
+    -------
+    HarnessSong
+        The song; tracks only lists the tracks that have note events.
+    """
+    processor = MIDIProcessor(file_path)
+    tracks = []
+
+    for track_number in range(len(processor.midi_file.tracks)):
+        messages = processor.extract_track_messages(track_number)
+        if max_seconds is not None:
+            due = np.cumsum([delay for _, delay in messages])
+            messages = messages[:int(np.searchsorted(due, max_seconds, side='right'))]
+        if messages:
+            tracks.append(messages)
+
+    timeline = processor.compile_timeline()
+    if max_seconds is not None:
+        timeline = timeline[timeline['onset_seconds'] <= max_seconds]
+
+    return HarnessSong(file_path, max_seconds, processor, tracks, timeline)
+
+
+def _play_track_scheduler(song):
+    """
+    MIDIProcessor.play_track, one thread per track, as `python -m midi_processor play` used to run it.
+    """
+    expected = []
+    for messages in song.tracks:
+        due = np.cumsum([delay for _, delay in messages]).tolist()
+        expected.extend(zip(due, (msg for msg, _ in messages)))
+
+    def play(outport, start_ns):
+        threads = [threading.Thread(target=song.processor.play_track, args=(messages, outport)) for messages in song.tracks]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    return expected, play
+
+
+def _stream_chunks(reader, max_seconds):
+    """
+    The chunks of a MIDIStreamReader, cut to the events due in the first max_seconds.
+    """
+    for chunk in reader:
+        if max_seconds is not None and chunk['time_seconds'][-1] > max_seconds:
+            yield chunk[chunk['time_seconds'] <= max_seconds]
+            return
+        yield chunk
+
+
+def _jukebox_scheduler(song):
+    """
+    play_event_stream reading the song from a MIDIStreamReader, as JukeBox mode plays it (without per-song metadata).
+    """
+    expected = []
+    reader = MIDIStreamReader(song.file_path)
+    try:
+        for chunk in _stream_chunks(reader, song.max_seconds):
+            for seconds, status, data1, data2, _ in chunk.tolist():
+                one_byte = (status & 0xF0) in (0xC0, 0xD0)
+                expected.append((seconds, mido.Message.from_bytes([status, data1] if one_byte else [status, data1, data2])))
+    finally:
+        reader.close()
+
+    def play(outport, start_ns):
+        # A fresh reader, so the song is streamed while it plays, as in the game.
+        reader = MIDIStreamReader(song.file_path)
+        try:
+            play_event_stream(_stream_chunks(reader, song.max_seconds), outport)
+        finally:
+            reader.close()
+
+    return expected, play
+
+
+def _dispatcher_scheduler(song):
+    """
+    The game's clocks and NoteDispatcher, driven by a 60 Hz frame loop: each frame begins on the GameClock, is turned
+    into song time by the SongClock, and sends a note_on for every note NoteDispatcher.due hands out, as
+    update_rectangles does with the notes it spawns.
+    """
+    timeline = song.timeline
+    expected = [(onset, mido.Message('note_on', note=note, velocity=velocity))
+                for onset, note, velocity in zip(timeline['onset_seconds'].tolist(), timeline['note'].tolist(),
+                                                 timeline['velocity'].tolist())]
+
+    def play(outport, start_ns):
+        game_clock = GameClock()
+        song_clock = SongClock(game_clock)
+        dispatcher = NoteDispatcher([(timeline, 1)])
+        song_clock.start(at_ns=start_ns)
+        next_frame_ns = start_ns
+
+        while not dispatcher.finished():
+            next_frame_ns += round(FRAME_SECONDS * 1e9)
+            delay = (next_frame_ns - game_clock.now_ns()) / 1e9
+            if delay > 0:
+                time.sleep(delay)
+
+            frame_time = song_clock.time_at(game_clock.begin_frame())
+            for _, note, velocity, _, _ in dispatcher.due(frame_time):
+                outport.send(mido.Message('note_on', note=note, velocity=velocity))
+
+    return expected, play
+
+
+def _playback_engine_scheduler(song):
+    """
+    PlaybackEngine.from_timeline, as MIDIProcessor.play_timeline (`python -m midi_processor play`) runs it.
+    """
+    engine = PlaybackEngine.from_timeline(song.timeline)
+    expected = [(due, msg) for due, batch in zip(engine.deadlines.tolist(), engine.batches) for msg in batch]
+
+    def play(outport, start_ns):
+        engine.play(outport, start_ns / 1e9)
+
+    return expected, play
+
+
+# Name -> function(song) that sets up playing the song through the game's own playback code. It returns
+# (expected, play): (due seconds, message) for every message that should be sent, and play(outport, start_ns), which
+# plays the song into outport from start_ns (a time.perf_counter_ns time) and returns when done.
+SCHEDULERS = {
+    "play_track": _play_track_scheduler,
+    "jukebox": _jukebox_scheduler,
+    "dispatcher": _dispatcher_scheduler,
+    "playback_engine": _playback_engine_scheduler,
+}
+
+
+def run_scheduler(scheduler, song):
+    """
+    Plays a song through one scheduler into a RecordingOutput and measures each event's lateness.
+    Sent messages are matched to the events they were due for by their bytes: the n-th copy of a message sent is the
+    n-th one due. Messages sent more often than they were due are counted as unexpected rather than matched.
+
+    Parameters
+    ----------
+    scheduler : callable
+        One of SCHEDULERS.
+    song : HarnessSong
+        The song, from load_song.
+
+    Returns
+    -------
+    tuple
+        (due, lateness, unexpected, missing): arrays of when each matched event was due and how late it was sent, in
+        seconds, in order of due time; the number of messages sent that were not due, and of events due but never sent.
+    """
+    expected, play = scheduler(song)
+
+    due_times = defaultdict(deque)
+    for due_time, msg in sorted(expected, key=lambda event: event[0]):
+        due_times[bytes(msg.bytes())].append(due_time)
+
+    outport = RecordingOutput()
+    start_ns = time.perf_counter_ns()
+    play(outport, start_ns)
+    start_time = start_ns / 1e9
+
+    due = []
+    lateness = []
+    unexpected = 0
+    for sent_time, msg in outport.sent:
+        waiting = due_times[bytes(msg.bytes())]
+        if not waiting:
+            unexpected += 1
+            continue
+        due_time = waiting.popleft()
+        due.append(due_time)
+        lateness.append(sent_time - start_time - due_time)
+    missing = sum(len(waiting) for waiting in due_times.values())
+
+    due = np.array(due, dtype=np.float64)
+    lateness = np.array(lateness, dtype=np.float64)
+    order = np.argsort(due, kind='stable')
+    return due[order], lateness[order], unexpected, missing
+
+
+def summarize_lateness(due, lateness, unexpected=0, missing=0):
+    """
+    Summarizes event lateness.
+
+    Parameters
+    ----------
+    due : numpy.ndarray
+        When each event was due, in seconds.
+    lateness : numpy.ndarray
+        How late each event was sent, in seconds.
+    unexpected : int, optional
+        Number of messages sent that were not due (default is 0).
+    missing : int, optional
+        Number of events due that were never sent (default is 0).
+
+    Returns
+    -------
+    dict
+        events, unexpected, missing, p50_ms, p99_ms, max_ms, and drift_ms_per_minute (the slope of lateness over the
+        song). With no events the timings are None.
+    """
+    if len(lateness) == 0:
+        return {"events": 0, "unexpected": unexpected, "missing": missing,
+                "p50_ms": None, "p99_ms": None, "max_ms": None, "drift_ms_per_minute": None}
+
+    drift = np.polyfit(due, lateness, 1)[0] if len(lateness) > 1 and np.ptp(due) > 0 else 0.0
+    return {
+        "events": int(len(lateness)),
+        "unexpected": unexpected,
+        "missing": missing,
+        "p50_ms": round(float(np.percentile(lateness, 50)) * 1000, 3),
+        "p99_ms": round(float(np.percentile(lateness, 99)) * 1000, 3),
+        "max_ms": round(float(np.max(lateness)) * 1000, 3),
+        "drift_ms_per_minute": round(float(drift) * 60 * 1000, 3),
+    }
+
+
+def _burn_cpu(stop):
+    """
+    Keeps one CPU busy until stop is set. Runs in a worker process.
+    """
+    while not stop.is_set():
+        pass
+
+
+def main():
+    """
+    Command line entry point: runs the chosen schedulers on a song with and without CPU load and prints their lateness.
+    """
+    import argparse
+
+    project_dir = os.path.dirname(os.path.abspath(__file__))
+
+    parser = argparse.ArgumentParser(description="Measure how late our schedulers send a song's MIDI events.")
+    parser.add_argument("song", nargs="?", default=os.path.join(project_dir, "songs", "married_life.mid"), help="MIDI file to play.")
+    parser.add_argument("--seconds", type=float, default=20, help="Play only the first N seconds of the song (default: 20).")
+    parser.add_argument("--load", type=int, default=os.cpu_count(), help="Busy processes for the loaded run; 0 skips it (default: one per CPU).")
+    parser.add_argument("--schedulers", nargs="+", default=list(SCHEDULERS), choices=list(SCHEDULERS), help="Schedulers to measure (default: all).")
+    parser.add_argument("--json", help="Also write the report to this JSON file.")
+    args = parser.parse_args()
+
+    song = load_song(args.song, args.seconds)
+    print(f"{args.song}: {sum(len(messages) for messages in song.tracks)} note events in {len(song.tracks)} tracks, first {args.seconds:g}s")
+
+    report = {}
+    for load in ([0, args.load] if args.load > 0 else [0]):
+        stop = multiprocessing.Event()
+        workers = [multiprocessing.Process(target=_burn_cpu, args=(stop,), daemon=True) for _ in range(load)]
+        for worker in workers:
+            worker.start()
+
+        try:
+            for name in args.schedulers:
+                summary = summarize_lateness(*run_scheduler(SCHEDULERS[name], song))
+                report[f"{name} (load {load})"] = summary
+                if summary["events"] == 0:
+                    print(f"{name:>18} | load {load:>2} | no events")
+                else:
+                    print(f"{name:>18} | load {load:>2} | p50 {summary['p50_ms']:8.3f} ms | p99 {summary['p99_ms']:8.3f} ms | "
+                          f"max {summary['max_ms']:8.3f} ms | drift {summary['drift_ms_per_minute']:8.3f} ms/min")
+                if summary["unexpected"] or summary["missing"]:
+                    print(f"{'':>18} | {summary['unexpected']} unexpected messages, {summary['missing']} events never sent")
+        finally:
+            stop.set()
+            for worker in workers:
+                worker.join()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as report_file:
+            json.dump(report, report_file, indent=1, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()